@@ -0,0 +1,45 @@
+"""
+Compare model loading: unpickling vs the memory-mapped flat artifact.
+
+Run `python -m src.api.trees` first to export the artifact.
+
+Usage:
+    python benchmarks/bench_loading.py [--repeat 20]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import joblib
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from benchmarks.common import best_of
+from src.api.models import FLAT_MODELS_PATH, MODELS_DIR, TREATMENT_ARMS
+from src.api.trees import FlatTreeEnsemble
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    def load_pickles():
+        return [joblib.load(MODELS_DIR / arm.model_file) for arm in TREATMENT_ARMS]
+
+    timings = {
+        "joblib.load (pickles)": best_of(load_pickles, args.repeat),
+        "artifact, mmap + sha256": best_of(lambda: FlatTreeEnsemble.load(FLAT_MODELS_PATH), args.repeat),
+        "artifact, mmap": best_of(
+            lambda: FlatTreeEnsemble.load(FLAT_MODELS_PATH, verify=False), args.repeat
+        ),
+        "artifact, in memory": best_of(
+            lambda: FlatTreeEnsemble.load(FLAT_MODELS_PATH, mmap_mode=None, verify=False), args.repeat
+        ),
+    }
+    baseline = timings["joblib.load (pickles)"]
+    for name, seconds in timings.items():
+        print(f"{name:<26} {seconds * 1e3:>8.2f} ms  {baseline / seconds:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark: single /predict calls with and without micro-batching.
+
+Runs the ASGI app in-process with a number of concurrent clients, each
+sending single-customer /predict requests back to back, and reports
+throughput and latency percentiles for the unbatched path (one model
+call per request) and the micro-batched path.
+
+Usage:
+    python benchmarks/bench_microbatch.py [--concurrency 64] [--duration 5]
+        [--max-batch-size 64] [--max-wait-ms 2]
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from benchmarks.common import load_customers
+from src.api.batching import batcher
+from src.api.config import settings
+from src.api.main import app
+
+
+async def client_loop(client, customers: list[dict], stop: asyncio.Event) -> list[float]:
+    latencies = []
+    i = 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.post("/predict", json=customers[i % len(customers)])
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.text
+        i += 1
+    return latencies
+
+
+async def measure(client, customers: list[dict], concurrency: int, duration: float) -> dict:
+    stop = asyncio.Event()
+    tasks = [
+        asyncio.create_task(client_loop(client, customers[i::concurrency], stop))
+        for i in range(concurrency)
+    ]
+    started = time.perf_counter()
+    await asyncio.sleep(duration)
+    stop.set()
+    latencies = np.concatenate([await task for task in tasks]) * 1e3
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": np.percentile(latencies, 50),
+        "p99_ms": np.percentile(latencies, 99),
+    }
+
+
+async def run(args):
+    customers = load_customers(10_000)
+    transport = httpx.ASGITransport(app=app)
+    batcher.max_batch_size = args.max_batch_size
+    batcher.max_wait_ms = args.max_wait_ms
+
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        for enabled in (False, True):
+            settings.micro_batching = enabled
+            batches, rows = batcher.batches, batcher.rows
+            result = await measure(client, customers, args.concurrency, args.duration)
+            label = "micro-batched" if enabled else "unbatched"
+            line = (
+                f"{label:<14} {result['rps']:>8,.0f} req/s  "
+                f"p50={result['p50_ms']:7.2f}ms  p99={result['p99_ms']:7.2f}ms"
+            )
+            if enabled and batcher.batches > batches:
+                mean_size = (batcher.rows - rows) / (batcher.batches - batches)
+                line += f"  mean batch={mean_size:.1f}"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per mode")
+    parser.add_argument("--max-batch-size", type=int, default=settings.batch_max_size)
+    parser.add_argument("--max-wait-ms", type=float, default=settings.batch_max_wait_ms)
+    args = parser.parse_args()
+
+    print(
+        f"{args.concurrency} clients, max batch {args.max_batch_size}, "
+        f"max wait {args.max_wait_ms}ms"
+    )
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Compare the per-arm X-learners with the multi-treatment X-learner.
+
+Trains both on hillstrom.csv, the per-arm way of src/training/pipeline.py
+(one binary X-learner and one GradientBoostingRegressor per arm) and the
+src/training/multi.py way (shared control models, multi-output trees),
+then times scoring their flat artifacts.
+
+Usage:
+    python benchmarks/bench_multi.py [--n-estimators 30] [--sizes 1 100 10000]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from sklearn.ensemble import GradientBoostingRegressor
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from benchmarks.common import HILLSTROM_PATH, best_of, load_customers
+from src.api.models import TREATMENT_ARMS
+from src.api.preprocessing import preprocess_batch
+from src.api.trees import FlatTreeEnsemble
+from src.training.data import load_campaign
+from src.training.multi import MultiXLearner, distill, treatment_codes
+from src.training.pipeline import DistillConfig
+from src.training.xlearner import EffectModels, OutcomeModels, XLearnerConfig, predict_cate
+
+
+def train_per_arm(batch, config, distill_config):
+    models, cate = [], np.full((len(batch), len(TREATMENT_ARMS)), np.nan)
+    for a, arm in enumerate(TREATMENT_ARMS):
+        rows = batch.arm_rows(arm)
+        X, y = batch.X[rows], batch.y[rows]
+        treated = batch.treatment[rows] == arm.label
+        outcomes = OutcomeModels.fit(X, treated, y, config)
+        effects = EffectModels.fit(X, treated, y, [outcomes], config)
+        cate[rows, a] = predict_cate([outcomes], [effects], X)
+        models.append(GradientBoostingRegressor(
+            n_estimators=distill_config.n_estimators,
+            max_depth=distill_config.max_depth,
+            random_state=distill_config.random_state
+        ).fit(X, cate[rows, a]))
+    return FlatTreeEnsemble.from_gradient_boosting(models), cate
+
+
+def train_multi(batch, config, distill_config):
+    learner = MultiXLearner.fit(batch.X, treatment_codes(batch), batch.y, config)
+    cate = learner.predict_cate(batch.X)
+    return distill(batch.X, cate, distill_config), cate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--n-estimators", type=int, default=30, help="Trees per nuisance forest")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 10_000])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    batch = load_campaign(HILLSTROM_PATH)
+    config = XLearnerConfig(n_estimators=args.n_estimators)
+    distill_config = DistillConfig()
+
+    results = {}
+    for name, train in (("per-arm", train_per_arm), ("multi", train_multi)):
+        started = time.perf_counter()
+        flat, cate = train(batch, config, distill_config)
+        results[name] = (flat, cate, time.perf_counter() - started)
+
+    print(f"{'':<10} {'train (s)':>10} {'trees':>6} {'nodes':>8}")
+    for name, (flat, _, seconds) in results.items():
+        print(f"{name:<10} {seconds:>10.1f} {len(flat.roots):>6} {len(flat.feature):>8,}")
+
+    per_arm_cate, multi_cate = results["per-arm"][1], results["multi"][1]
+    for a, arm in enumerate(TREATMENT_ARMS):
+        rows = batch.arm_rows(arm)
+        corr = np.corrcoef(per_arm_cate[rows, a], multi_cate[rows, a])[0, 1]
+        print(f"{arm.name}: CATE correlation {corr:.3f} on its customers")
+
+    per_arm, multi = results["per-arm"][0], results["multi"][0]
+    print(f"\n{'n':>8} {'per-arm (ms)':>13} {'multi (ms)':>11} {'speedup':>8}")
+    for n in args.sizes:
+        X = preprocess_batch(load_customers(n))
+        t_per_arm = best_of(lambda: per_arm.predict(X), args.repeat)
+        t_multi = best_of(lambda: multi.predict(X), args.repeat)
+        print(f"{n:>8} {t_per_arm * 1e3:>13.3f} {t_multi * 1e3:>11.3f} {t_per_arm / t_multi:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Compare the per-row and columnar feature encoders.
+
+Usage:
+    python benchmarks/bench_preprocessing.py [--sizes 100 10000 50000]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from benchmarks.common import best_of, load_customers
+from src.api.preprocessing import (
+    INPUT_COLUMNS,
+    preprocess_batch,
+    preprocess_columns,
+    preprocess_customer,
+)
+
+
+def encode_per_row(customers: list[dict]) -> np.ndarray:
+    """Previous implementation of preprocess_batch."""
+    return np.vstack([preprocess_customer(c) for c in customers])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 50_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'n':>8} {'per-row (ms)':>14} {'batch (ms)':>12} {'columns (ms)':>14} {'speedup':>9}")
+    for n in args.sizes:
+        customers = load_customers(n)
+        columns = {name: [c[name] for c in customers] for name in INPUT_COLUMNS}
+
+        expected = encode_per_row(customers)
+        assert np.array_equal(preprocess_batch(customers), expected)
+        assert np.array_equal(preprocess_columns(columns), expected)
+
+        t_row = best_of(lambda: encode_per_row(customers), args.repeat)
+        t_batch = best_of(lambda: preprocess_batch(customers), args.repeat)
+        t_cols = best_of(lambda: preprocess_columns(columns), args.repeat)
+        print(
+            f"{n:>8} {t_row * 1e3:>14.2f} {t_batch * 1e3:>12.2f} "
+            f"{t_cols * 1e3:>14.2f} {t_row / t_batch:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
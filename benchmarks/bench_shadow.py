@@ -0,0 +1,100 @@
+"""
+Benchmark: production latency with shadow scoring off and on.
+
+Runs the ASGI app in-process with concurrent single-customer /predict
+clients plus one /predict/batch client, and reports /predict latency
+percentiles with shadow scoring disabled and at several sample rates.
+The candidate is the production models themselves, so the shadow thread
+does the full scoring work.
+
+Usage:
+    python benchmarks/bench_shadow.py [--duration 5] [--rates 0.1 1.0]
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from benchmarks.common import load_customers
+from src.api.main import app
+from src.api.models import cate_models
+from src.api.shadow import shadow
+
+
+async def single_client(client, customers, stop, latencies):
+    i = 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.post("/predict", json=customers[i % len(customers)])
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200
+        i += 1
+
+
+async def batch_client(client, body, stop):
+    while not stop.is_set():
+        response = await client.post(
+            "/predict/batch?format=columnar", json=body
+        )
+        assert response.status_code == 200
+        await asyncio.sleep(0)
+
+
+async def measure(client, customers, args) -> np.ndarray:
+    stop = asyncio.Event()
+    latencies = []
+    tasks = [
+        asyncio.create_task(single_client(client, customers[i::args.clients], stop, latencies))
+        for i in range(args.clients)
+    ]
+    tasks.append(asyncio.create_task(batch_client(client, {"customers": customers[:1000]}, stop)))
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    return np.array(latencies) * 1e3
+
+
+async def run(args):
+    customers = load_customers(10_000)
+    transport = httpx.ASGITransport(app=app)
+
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        for rate in [None, *args.rates]:
+            if rate is None:
+                shadow.stop()
+                label = "shadow off"
+            else:
+                shadow.start(cate_models.version, sample_rate=rate)
+                label = f"shadow {rate:.0%}"
+            ms = await measure(client, customers, args)
+            line = (
+                f"{label:<12} n={len(ms):>6}  p50={np.percentile(ms, 50):6.2f}ms  "
+                f"p99={np.percentile(ms, 99):6.2f}ms"
+            )
+            if rate is not None:
+                stats = shadow.to_dict()
+                line += (
+                    f"  shadowed={stats['scored_rows']:,} dropped={stats['dropped_rows']:,}"
+                    f" busy={stats['busy_s']:.2f}s"
+                )
+            print(line)
+        shadow.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per mode")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--rates", type=float, nargs="+", default=[0.1, 1.0])
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Compare sklearn, flat-array and lookup-table scoring of the CATE models.
+
+The lookup table is read from models/cate_lookup when it exists, and
+built otherwise (about 20 s).
+
+Usage:
+    python benchmarks/bench_trees.py [--sizes 1 10 100 10000]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from benchmarks.common import best_of, load_customers
+from src.api.lookup import CATELookupTable, build_lookup_table
+from src.api.models import LOOKUP_TABLE_PATH, CATEModels
+from src.api.preprocessing import preprocess_batch
+from src.api.trees import FlatTreeEnsemble
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 10_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    mens, womens = CATEModels.load_pickles()
+    flat = FlatTreeEnsemble.from_gradient_boosting([mens, womens])
+    if (LOOKUP_TABLE_PATH / "manifest.json").exists():
+        table = CATELookupTable.load(LOOKUP_TABLE_PATH)
+    else:
+        table = build_lookup_table([mens, womens])
+
+    def predict_sklearn(X):
+        return np.column_stack([mens.predict(X), womens.predict(X)])
+
+    print(
+        f"{'n':>8} {'sklearn (ms)':>14} {'flat (ms)':>11} {'speedup':>9} {'max abs diff':>14}"
+        f" {'lookup (ms)':>13} {'speedup':>9} {'identical':>10}"
+    )
+    for n in args.sizes:
+        X = preprocess_batch(load_customers(n))
+        expected = predict_sklearn(X)
+        diff = np.abs(flat.predict(X) - expected).max()
+        identical = bool((table.predict(X, predict_sklearn) == expected).all())
+
+        t_sklearn = best_of(lambda: predict_sklearn(X), args.repeat)
+        t_flat = best_of(lambda: flat.predict(X), args.repeat)
+        t_lookup = best_of(lambda: table.predict(X, predict_sklearn), args.repeat)
+        print(
+            f"{n:>8} {t_sklearn * 1e3:>14.3f} {t_flat * 1e3:>11.3f} "
+            f"{t_sklearn / t_flat:>8.1f}x {diff:>14.2e}"
+            f" {t_lookup * 1e3:>13.3f} {t_sklearn / t_lookup:>8.1f}x {identical!s:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Time the batched bootstrap of src/evaluation/uplift.py on hillstrom.csv.
+
+Compares it with resampling the customers in a Python loop over the
+replicates and recomputing each curve, on the mens arm and the control
+group scored by the served models.
+
+Usage:
+    python benchmarks/bench_uplift.py [--replicates 1000] [--loop-replicates 50]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from benchmarks.common import HILLSTROM_PATH
+from src.api.models import cate_models
+from src.evaluation.uplift import arm_codes, bootstrap_policy, bootstrap_uplift, uplift_curve
+from src.training.data import load_campaign
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--replicates", type=int, default=1000)
+    parser.add_argument("--loop-replicates", type=int, default=50, help="Replicates of the loop, extrapolated")
+    args = parser.parse_args()
+
+    batch = load_campaign(HILLSTROM_PATH)
+    cate = cate_models.predict_matrix(batch.X)
+    codes = arm_codes(batch.treatment)
+    rows = np.isin(codes, (0, 2))
+    y, treated, score = batch.y[rows], codes[rows] == 0, cate[rows, 0]
+
+    started = time.perf_counter()
+    result = bootstrap_uplift(y, treated, score, n_boot=args.replicates)
+    t_batched = time.perf_counter() - started
+
+    rng = np.random.default_rng(0)
+    started = time.perf_counter()
+    for _ in range(args.loop_replicates):
+        index = rng.integers(0, len(y), len(y))
+        uplift_curve(y[index], treated[index], score[index], n_points=100).metrics()
+    t_loop = (time.perf_counter() - started) / args.loop_replicates * args.replicates
+
+    started = time.perf_counter()
+    bootstrap_policy(batch.y, codes, cate, n_boot=args.replicates)
+    t_policy = time.perf_counter() - started
+
+    print(f"{len(y):,} customers, {args.replicates} replicates")
+    print(f"  batched bootstrap (uplift): {t_batched:8.2f}s")
+    print(f"  loop over replicates:       {t_loop:8.2f}s (extrapolated, {t_loop / t_batched:.1f}x)")
+    print(f"  batched bootstrap (policy): {t_policy:8.2f}s on {len(batch.y):,} customers")
+    estimate, low, high = result.intervals["qini_coefficient"]
+    print(f"  mens Qini coefficient {estimate:.1f} [{low:.1f}, {high:.1f}]")
+
+
+if __name__ == "__main__":
+    main()
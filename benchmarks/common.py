@@ -0,0 +1,46 @@
+"""Shared helpers for the benchmark scripts."""
+import csv
+import time
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent
+HILLSTROM_PATH = PROJECT_ROOT / "data" / "raw" / "hillstrom.csv"
+
+
+def load_customers(n: int, seed: int = 42) -> list[dict]:
+    """
+    Draw n customers from hillstrom.csv in the CustomerInput format.
+
+    Rows are sampled with replacement so any n can be requested.
+    """
+    with open(HILLSTROM_PATH, newline="") as f:
+        rows = list(csv.DictReader(f))
+
+    rng = np.random.default_rng(seed)
+    customers = []
+    for i in rng.integers(0, len(rows), size=n):
+        row = rows[i]
+        customers.append({
+            "recency": int(row["recency"]),
+            "history": float(row["history"]),
+            "history_segment": row["history_segment"],
+            "mens": int(row["mens"]),
+            "womens": int(row["womens"]),
+            "newbie": int(row["newbie"]),
+            # The raw dataset spells it "Surburban"
+            "zip_code": "Suburban" if row["zip_code"] == "Surburban" else row["zip_code"],
+            "channel": row["channel"],
+        })
+    return customers
+
+
+def best_of(fn, repeat: int = 5) -> float:
+    """Return the best wall time in seconds of `repeat` calls to fn."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
@@ -0,0 +1,122 @@
+"""
+Load test: /health latency while large batches are being scored.
+
+Runs the ASGI app in-process, polls /health at a fixed rate while
+several clients keep posting large /predict/batch requests, and reports
+/health latency percentiles. Compare the inline mode (--threads 0,
+inference on the event loop) with the executor.
+
+Usage:
+    python benchmarks/load_health.py [--threads 4] [--processes 0] [--batch-size 20000] [--clients 4]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from benchmarks.common import load_customers
+from src.api.executor import inference
+from src.api.main import app
+
+
+async def poll_health(client, stop: asyncio.Event, interval: float) -> list[float]:
+    """
+    Call /health every `interval` seconds.
+
+    Latency is measured from the time each call was scheduled, so time
+    spent waiting for a blocked event loop is counted.
+    """
+    latencies = []
+    scheduled = time.perf_counter()
+    while not stop.is_set():
+        response = await client.get("/health")
+        latencies.append(time.perf_counter() - scheduled)
+        assert response.status_code == 200
+        scheduled += interval
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+    return latencies
+
+
+async def post_batches(client, body: bytes, stop: asyncio.Event) -> dict:
+    statuses = {}
+    while not stop.is_set():
+        response = await client.post(
+            "/predict/batch?format=columnar",
+            content=body,
+            headers={"content-type": "application/json"}
+        )
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        # In-process requests may complete without suspending, yield like
+        # a network round trip would
+        await asyncio.sleep(0)
+    return statuses
+
+
+def percentiles(latencies: list[float]) -> str:
+    ms = np.array(latencies) * 1e3
+    return (
+        f"n={len(ms):>5}  p50={np.percentile(ms, 50):7.2f}ms  "
+        f"p99={np.percentile(ms, 99):7.2f}ms  max={ms.max():7.2f}ms"
+    )
+
+
+async def run(args):
+    body = json.dumps({"customers": load_customers(args.batch_size)}).encode()
+    transport = httpx.ASGITransport(app=app)
+
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        # Baseline without load
+        stop = asyncio.Event()
+        health = asyncio.create_task(poll_health(client, stop, args.interval))
+        await asyncio.sleep(args.duration / 2)
+        stop.set()
+        idle = await health
+
+        # Under load
+        stop = asyncio.Event()
+        health = asyncio.create_task(poll_health(client, stop, args.interval))
+        loaders = [
+            asyncio.create_task(post_batches(client, body, stop))
+            for _ in range(args.clients)
+        ]
+        await asyncio.sleep(args.duration)
+        stop.set()
+        loaded = await health
+        statuses = {}
+        for result in await asyncio.gather(*loaders):
+            for status, count in result.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    mode = f"{args.threads} executor threads" if args.threads else "inline (no executor)"
+    if args.processes:
+        mode += f", {args.processes} processes"
+    print(f"Mode: {mode}, {args.clients} clients x {args.batch_size:,} rows")
+    print(f"  /health idle:       {percentiles(idle)}")
+    print(f"  /health under load: {percentiles(loaded)}")
+    print(f"  /predict/batch responses by status: {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=4, help="Executor threads, 0 for inline")
+    parser.add_argument("--processes", type=int, default=0, help="Executor processes for large batches")
+    parser.add_argument("--batch-size", type=int, default=20_000)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds under load")
+    parser.add_argument("--interval", type=float, default=0.01, help="Seconds between /health calls")
+    args = parser.parse_args()
+
+    inference.threads = args.threads
+    inference.processes = args.processes
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
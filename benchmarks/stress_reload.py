@@ -0,0 +1,184 @@
+"""
+Stress test: hot model reloads under load.
+
+Publishes two model versions into a temporary registry (the real
+pickles, and a copy whose baselines are shifted so that every CATE
+differs), then keeps single, batch and NDJSON clients busy while an
+admin client swaps versions back and forth. Every response must succeed
+and carry CATE values that all come from the version it reports.
+
+Usage:
+    python benchmarks/stress_reload.py [--duration 10] [--reload-interval 0.2]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import joblib
+import numpy as np
+
+# Settings are read at import time
+REGISTRY = tempfile.mkdtemp(prefix="cate-registry-")
+os.environ["CATE_REGISTRY_DIR"] = REGISTRY
+os.environ["CATE_ADMIN_TOKEN"] = "stress-test"
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from benchmarks.common import load_customers
+from src.api import registry
+from src.api.main import app
+from src.api.models import MODELS_DIR, TREATMENT_ARMS, ModelBundle
+from src.api.preprocessing import preprocess_batch
+
+ADMIN_HEADERS = {"X-Admin-Token": "stress-test"}
+
+# Baseline shift of the second version
+SHIFT = 0.01
+
+
+def publish_versions() -> list[str]:
+    """Publish the real models as "a" and shifted copies as "b"."""
+    registry.publish(MODELS_DIR, "a", make_active=True)
+
+    shifted_dir = Path(REGISTRY) / "source-b"
+    shifted_dir.mkdir()
+    for arm in TREATMENT_ARMS:
+        model = joblib.load(MODELS_DIR / arm.model_file)
+        model.init_.constant_ = model.init_.constant_ + SHIFT
+        joblib.dump(model, shifted_dir / arm.model_file)
+    registry.publish(shifted_dir, "b")
+    return ["a", "b"]
+
+
+class Checker:
+    """Compares responses with the expected CATE of each version."""
+
+    def __init__(self, customers: list[dict], versions: list[str]):
+        X = preprocess_batch(customers)
+        fields = [arm.output_field for arm in TREATMENT_ARMS]
+        self.fields = fields
+        self.expected = {
+            version: ModelBundle.load(registry.version_dir(version), "sklearn", version).predict_matrix(X)
+            for version in versions
+        }
+        self.requests = 0
+        self.failures = []
+        self.versions_seen = {}
+
+    def check(self, kind: str, rows: list[int], cate: np.ndarray, version: str | None):
+        self.requests += 1
+        self.versions_seen[version] = self.versions_seen.get(version, 0) + 1
+        if version not in self.expected:
+            self.failures.append(f"{kind}: unknown version {version!r}")
+        elif not np.allclose(cate, self.expected[version][rows], rtol=0, atol=1e-12):
+            self.failures.append(f"{kind}: CATE does not match version {version!r}")
+
+    def fail(self, kind: str, response):
+        self.requests += 1
+        self.failures.append(f"{kind}: HTTP {response.status_code} {response.text[:200]}")
+
+
+async def single_client(client, customers, checker, stop, offset):
+    i = offset
+    while not stop.is_set():
+        row = i % len(customers)
+        response = await client.post("/predict", json=customers[row])
+        if response.status_code != 200:
+            checker.fail("single", response)
+        else:
+            body = response.json()
+            cate = np.array([[body[field] for field in checker.fields]])
+            checker.check("single", [row], cate, body["model_version"])
+        i += 7
+
+
+async def batch_client(client, customers, checker, stop, response_format, size):
+    rng = np.random.default_rng(size)
+    while not stop.is_set():
+        rows = rng.integers(0, len(customers), size).tolist()
+        response = await client.post(
+            f"/predict/batch?format={response_format}",
+            json={"customers": [customers[row] for row in rows]}
+        )
+        if response.status_code != 200:
+            checker.fail(response_format, response)
+            continue
+
+        if response_format == "columnar":
+            body = response.json()
+            cate = np.column_stack([body[field] for field in checker.fields])
+            version = body["model_version"]
+        else:
+            lines = [json.loads(line) for line in response.text.splitlines()]
+            cate = np.array([[line[field] for field in checker.fields] for line in lines[:-1]])
+            version = lines[-1]["model_version"]
+        checker.check(response_format, rows, cate, version)
+        await asyncio.sleep(0)
+
+
+async def reloader(client, versions, checker, stop, interval) -> int:
+    reloads = 0
+    while not stop.is_set():
+        await asyncio.sleep(interval)
+        version = versions[(reloads + 1) % len(versions)]
+        response = await client.post(
+            "/admin/models/reload", json={"version": version}, headers=ADMIN_HEADERS
+        )
+        if response.status_code != 200:
+            checker.fail("reload", response)
+        reloads += 1
+    return reloads
+
+
+async def run(args):
+    versions = publish_versions()
+    customers = load_customers(2_000)
+    checker = Checker(customers, versions)
+    transport = httpx.ASGITransport(app=app)
+
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        stop = asyncio.Event()
+        tasks = [
+            *(single_client(client, customers, checker, stop, i) for i in range(args.single_clients)),
+            batch_client(client, customers, checker, stop, "columnar", 500),
+            batch_client(client, customers, checker, stop, "ndjson", 3_000),
+        ]
+        tasks = [asyncio.create_task(task) for task in tasks]
+        reloads = asyncio.create_task(reloader(client, versions, checker, stop, args.reload_interval))
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(*tasks)
+        reloads = await reloads
+
+    print(f"{checker.requests:,} requests, {reloads} reloads, responses per version: {checker.versions_seen}")
+    if checker.failures:
+        print(f"{len(checker.failures)} failures, first ones:")
+        for failure in checker.failures[:10]:
+            print(f"  {failure}")
+        return 1
+    print("OK: no failed request, no response mixing versions")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--reload-interval", type=float, default=0.2, help="Seconds between reloads")
+    parser.add_argument("--single-clients", type=int, default=16)
+    args = parser.parse_args()
+    try:
+        status = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(REGISTRY, ignore_errors=True)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
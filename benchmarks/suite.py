@@ -0,0 +1,260 @@
+"""
+Benchmark suite of the scoring stack, with JSON results to compare runs.
+
+For each batch size, times every stage of a batch request on the same
+customers drawn from hillstrom.csv (validate the JSON body, encode,
+predict, decide, serialize as objects and as columns), then the whole
+request through the ASGI app in-process, with the body given as rows
+(/predict/batch) and as columns (/predict/batch/columns). Single
+/predict latency is measured end to end as well. The prediction cache
+is disabled so that repeated runs keep scoring.
+
+Usage:
+    python benchmarks/suite.py run [--sizes 1 100 10000 100000] [--output results.json]
+    python benchmarks/suite.py compare BASELINE.json CANDIDATE.json [--threshold 0.1]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import asdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Settings are read at import time
+os.environ.setdefault("CATE_CACHE_SIZE", "0")
+
+import httpx
+import numpy as np
+import sklearn
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from benchmarks.common import PROJECT_ROOT, load_customers
+from src.api.config import settings
+from src.api.main import app
+from src.api.models import cate_models
+from src.api.policy import optimal_treatment
+from src.api.preprocessing import INPUT_COLUMNS, preprocess_batch
+from src.api.responses import columnar_content, prediction_records, summarize
+from src.api.schemas import BatchInput
+
+DEFAULT_SIZES = [1, 100, 10_000, 100_000]
+
+# Every benchmark is repeated for at least MIN_TIME_S (fast ones run many
+# more times than requested) and stops repeating after MAX_TIME_S
+MIN_TIME_S = 0.5
+MAX_TIME_S = 5.0
+
+
+def _keep_going(times: list[float], repeat: int, started: float) -> bool:
+    elapsed = time.perf_counter() - started
+    if len(times) < repeat:
+        return not times or elapsed < MAX_TIME_S
+    return elapsed < MIN_TIME_S
+
+
+def time_calls(fn, repeat: int) -> list[float]:
+    """Wall times of repeated calls to fn, after one warm-up call."""
+    fn()
+    times = []
+    started = time.perf_counter()
+    while _keep_going(times, repeat, started):
+        call_started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - call_started)
+    return times
+
+
+async def time_requests(send, repeat: int) -> list[float]:
+    """Async counterpart of time_calls for requests through the ASGI app."""
+    await send()
+    times = []
+    started = time.perf_counter()
+    while _keep_going(times, repeat, started):
+        call_started = time.perf_counter()
+        response = await send()
+        times.append(time.perf_counter() - call_started)
+        assert response.status_code == 200, response.text[:200]
+    return times
+
+
+def result(name: str, rows: int, times: list[float]) -> dict:
+    median = statistics.median(times)
+    return {
+        "name": name,
+        "rows": rows,
+        "runs": len(times),
+        "median_s": median,
+        "min_s": min(times),
+        "rows_per_s": rows / median if median else None,
+    }
+
+
+def stage_results(customers: list[dict], repeat: int) -> list[dict]:
+    """Time each stage of a batch request on customers."""
+    n = len(customers)
+    body = json.dumps({"customers": customers}).encode()
+    X = preprocess_batch(customers)
+    cate = cate_models.predict_matrix(X)
+    codes, lift = optimal_treatment(cate)
+
+    def serialize_objects():
+        content = {"predictions": prediction_records(cate, codes, lift), "summary": summarize(cate, codes)}
+        return json.dumps(content, separators=(",", ":")).encode()
+
+    def serialize_columnar():
+        return json.dumps(columnar_content(cate, codes, lift), separators=(",", ":")).encode()
+
+    stages = {
+        "validate": lambda: BatchInput.model_validate_json(body),
+        "encode": lambda: preprocess_batch(customers),
+        "predict": lambda: cate_models.predict_matrix(X),
+        "decide": lambda: optimal_treatment(cate),
+        "serialize_objects": serialize_objects,
+        "serialize_columnar": serialize_columnar,
+    }
+    return [result(name, n, time_calls(fn, repeat)) for name, fn in stages.items()]
+
+
+async def end_to_end_results(sizes: list[int], repeat: int) -> list[dict]:
+    """Time single and batch requests through the ASGI app."""
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        customer = load_customers(1)[0]
+        times = await time_requests(lambda: client.post("/predict", json=customer), repeat)
+        results.append(result("e2e_single", 1, times))
+
+        for n in sizes:
+            customers = load_customers(n)
+            bodies = {
+                "batch": json.dumps({"customers": customers}).encode(),
+                "batch/columns": json.dumps(
+                    {name: [c[name] for c in customers] for name in INPUT_COLUMNS}
+                ).encode(),
+            }
+            for path, body in bodies.items():
+                for response_format in ("objects", "columnar"):
+                    times = await time_requests(
+                        lambda: client.post(
+                            f"/predict/{path}?format={response_format}",
+                            content=body,
+                            headers={"Content-Type": "application/json"}
+                        ),
+                        repeat
+                    )
+                    name = f"e2e_{path.replace('/', '_')}_{response_format}"
+                    results.append(result(name, n, times))
+    return results
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "model_version": cate_models.version,
+        "settings": asdict(settings),
+    }
+
+
+def run(args):
+    cate_models.load_models()
+    results = []
+    for n in args.sizes:
+        print(f"Stages, {n:,} rows...")
+        results.extend(stage_results(load_customers(n), args.repeat))
+    print("End to end...")
+    results.extend(asyncio.run(end_to_end_results(args.sizes, args.repeat)))
+
+    report = {"environment": environment(), "results": results}
+    Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+
+    print(f"\n{'benchmark':<30} {'rows':>8} {'median':>11} {'rows/s':>14}")
+    for r in results:
+        print(f"{r['name']:<30} {r['rows']:>8,} {r['median_s'] * 1e3:>9.3f}ms {r['rows_per_s']:>14,.0f}")
+    print(f"\nWrote {args.output}")
+    return 0
+
+
+def compare(args):
+    baseline = json.loads(Path(args.baseline).read_text())
+    candidate = json.loads(Path(args.candidate).read_text())
+
+    for key in ("python", "numpy", "sklearn", "cpu_count", "model_version"):
+        before, after = baseline["environment"].get(key), candidate["environment"].get(key)
+        if before != after:
+            print(f"Warning: {key} differs ({before} -> {after}), timings may not be comparable")
+
+    before = {(r["name"], r["rows"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"{'benchmark':<30} {'rows':>8} {'baseline':>11} {'candidate':>11} {'change':>8}")
+    for r in candidate["results"]:
+        key = (r["name"], r["rows"])
+        if key not in before:
+            continue
+        stat = f"{args.statistic}_s"
+        change = r[stat] / before[key][stat] - 1
+        flag = ""
+        if change > args.threshold:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(
+            f"{r['name']:<30} {r['rows']:>8,} {before[key][stat] * 1e3:>9.3f}ms "
+            f"{r[stat] * 1e3:>9.3f}ms {change:>+7.1%}{flag}"
+        )
+
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) slower by more than {args.threshold:.0%}")
+        return 1
+    print(f"\nNo benchmark slower by more than {args.threshold:.0%}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the suite and write the results")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    run_parser.add_argument(
+        "--repeat", type=int, default=7,
+        help=f"Minimum runs per benchmark, unless they take over {MAX_TIME_S:g}s"
+    )
+    run_parser.add_argument("--output", default="benchmark_results.json")
+
+    compare_parser = commands.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=0.1,
+        help="Relative slowdown reported as a regression"
+    )
+    compare_parser.add_argument(
+        "--statistic", choices=["median", "min"], default="median",
+        help="Timing compared, min is less sensitive to a noisy machine"
+    )
+
+    args = parser.parse_args()
+    sys.exit(run(args) if args.command == "run" else compare(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,493 @@
+"""
+Treatment allocation under campaign costs and send limits.
+
+The API recommendation (policy.optimal_treatment) emails every customer
+with a positive CATE. Campaigns have a cost per email, a cap on the
+emails of each arm and a total budget. allocate picks the arm of every
+customer to maximize the expected incremental conversions (or their net
+value, when a conversion is given a value) under those constraints.
+
+Lagrangian relaxation: each constraint gets a price, and every customer
+takes the arm of highest gain minus prices, or no email if none is
+positive. The price of a capped arm is found by coordinate updates,
+each an O(n) partition for its capacity-th margin; the price of the
+budget by bisection. Prices alone leave ties and customers over a
+cap unresolved, so the assignment is then improved by exchanges between
+treatments (e.g. a customer over the cap of one arm takes the room left
+in another) until none gains anything, which makes it optimal under
+the capacities. The budget left is filled greedily, by gain per unit of
+extra cost, which keeps the result within about the gain of one
+customer of the optimum. Each step is a vectorized O(n * n_arms) pass,
+so millions of customers take seconds.
+
+Usage:
+    python -m src.api.allocation customers.csv allocation.csv
+        [--cost mens=0.1 womens=0.1] [--capacity mens=10000] [--budget 1500]
+        [--value-per-conversion 100]
+"""
+import argparse
+import json
+import sys
+import time
+from dataclasses import dataclass
+from itertools import permutations
+
+import numpy as np
+import pandas as pd
+from pydantic import ValidationError
+
+from . import metrics
+from .models import TREATMENT_ARMS, cate_models
+from .policy import optimal_treatment, treatment_distribution
+from .schemas import AllocationConstraints
+from .scoring import BatchValidationError, check_columns, decode_json
+from .preprocessing import preprocess_columns
+
+# Coordinate updates of the capacity prices per solve
+MAX_SWEEPS = 50
+
+# Improving exchanges between treatments per solve, and the gain below
+# which an exchange is not worth making
+MAX_EXCHANGES = 1000
+EXCHANGE_TOLERANCE = 1e-12
+
+# Bisection steps of the budget price, and relative width at which it stops
+BUDGET_STEPS = 40
+BUDGET_TOLERANCE = 1e-6
+
+
+@dataclass(frozen=True)
+class Allocation:
+    """
+    Assignment of treatments to customers.
+
+    Attributes:
+        codes: Assigned arm index of each customer, n_arms for no email
+        lift: CATE of the assigned arm, 0 for no email
+        cost: Total cost of the emails
+        prices: Price of each arm's capacity, 0 if the cap is not binding
+        budget_price: Price of one unit of cost, 0 without binding budget
+    """
+    codes: np.ndarray
+    lift: np.ndarray
+    cost: float
+    prices: np.ndarray
+    budget_price: float
+
+    @property
+    def expected_conversions(self) -> float:
+        """Expected incremental conversions of the assignment."""
+        return float(self.lift.sum())
+
+    def counts(self) -> np.ndarray:
+        """Customers per treatment code."""
+        return np.bincount(self.codes, minlength=len(self.prices) + 1)
+
+
+def _choose(gain: np.ndarray, prices: np.ndarray) -> np.ndarray:
+    """Arm of highest positive gain net of prices, n_arms if none."""
+    n, n_arms = gain.shape
+    adjusted = gain - prices
+    best = adjusted.argmax(axis=1)
+    return np.where(adjusted[np.arange(n), best] > 0, best, n_arms)
+
+
+def _margins(gain: np.ndarray, prices: np.ndarray, arm: int) -> np.ndarray:
+    """How much more each customer gains from arm than from their best alternative."""
+    others = np.delete(gain - prices, arm, axis=1)
+    alternative = np.maximum(others.max(axis=1), 0) if others.shape[1] else np.zeros(len(gain))
+    return gain[:, arm] - alternative
+
+
+def _capacity_prices(gain: np.ndarray, capacity: np.ndarray, prices: np.ndarray) -> np.ndarray:
+    """
+    Prices at which no arm is chosen by more customers than its capacity.
+
+    Each update sets the price of one arm so that, the other prices
+    being fixed, exactly its capacity of customers (fewer on ties) have
+    a margin above it.
+    """
+    n = len(gain)
+    prices = prices.copy()
+    capped = [arm for arm in range(gain.shape[1]) if capacity[arm] < n]
+    for _ in range(MAX_SWEEPS):
+        changed = False
+        for arm in capped:
+            margins = _margins(gain, prices, arm)
+            cap = int(capacity[arm])
+            # (cap + 1)-th largest margin, 0 when the cap is not binding
+            price = max(np.partition(margins, n - cap - 1)[n - cap - 1], 0.0)
+            if not np.isclose(price, prices[arm], rtol=1e-12, atol=0):
+                prices[arm] = price
+                changed = True
+        if not changed:
+            break
+    return prices
+
+
+def _enforce_capacity(codes: np.ndarray, gain: np.ndarray, prices: np.ndarray, capacity: np.ndarray):
+    """Send no email to the lowest-margin customers of arms still over capacity."""
+    n_arms = gain.shape[1]
+    for arm in range(n_arms):
+        rows = np.flatnonzero(codes == arm)
+        excess = len(rows) - int(min(capacity[arm], len(codes)))
+        if excess > 0:
+            margins = _margins(gain[rows], prices, arm)
+            codes[rows[np.argpartition(margins, excess - 1)[:excess]]] = n_arms
+
+
+def _room(codes: np.ndarray, capacity: np.ndarray) -> np.ndarray:
+    """Customers each arm can still take."""
+    return capacity - np.bincount(codes, minlength=len(capacity) + 1)[:-1]
+
+
+def _cycles(n_nodes: int):
+    """Simple cycles of the complete graph on n_nodes, each once, as node tuples."""
+    for length in range(2, n_nodes + 1):
+        for nodes in permutations(range(n_nodes), length):
+            if nodes[0] == min(nodes):
+                yield nodes
+
+
+def _exchange(codes: np.ndarray, gain: np.ndarray, capacity: np.ndarray):
+    """
+    Move customers between treatments until no exchange improves the gain.
+
+    Nodes are the arms, no email, and a slack node standing for the room
+    left in the arms. An edge u -> v is worth the best gain of moving a
+    customer of u to v, v -> slack is free when v has room and slack -> u
+    always is. A cycle of positive worth is an improving exchange (e.g.
+    move a customer from no email into the full arm a, and one of a's
+    customers into arm b, which has room); with none left the assignment
+    is optimal under the capacities. Each pass moves the m best customers
+    of every edge of the best cycle at once, m as large as keeps every
+    layer of the exchange improving.
+    """
+    n, n_arms = gain.shape
+    if not (capacity < n).any():
+        # Every customer can have their best arm, which _choose gave
+        return
+    padded = np.column_stack([gain, np.zeros(n)])
+    slack = n_arms + 1
+    cycles = list(_cycles(n_arms + 2))
+    for _ in range(MAX_EXCHANGES):
+        delta = padded - padded[np.arange(n), codes][:, None]
+        room = np.append(_room(codes, capacity), np.inf)
+
+        # Best move of each treatment group to each other treatment, one
+        # reduceat over the customers sorted by group (a radix sort)
+        counts = np.bincount(codes, minlength=n_arms + 1)
+        present = np.flatnonzero(counts)
+        by_group = delta[np.argsort(codes.astype(np.int8), kind="stable")]
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[present]
+
+        worth = np.full((n_arms + 2, n_arms + 2), -np.inf)
+        worth[present, :-1] = np.maximum.reduceat(by_group, starts, axis=0)
+        worth[present, present] = -np.inf
+        worth[slack, present] = 0.0
+        worth[np.flatnonzero(room >= 1), slack] = 0.0
+
+        best, best_worth = None, EXCHANGE_TOLERANCE
+        for cycle in cycles:
+            total = sum(worth[u, v] for u, v in zip(cycle, cycle[1:] + cycle[:1]))
+            if total > best_worth:
+                best, best_worth = cycle, total
+        if best is None:
+            return
+
+        moves, deltas, limit = [], [], n
+        for u, v in zip(best, best[1:] + best[:1]):
+            if v == slack:
+                limit = min(limit, room[u])
+            elif u != slack:
+                # Customers who cannot make a layer improving, whatever the
+                # other edges give, are left out of the sort
+                rows = np.flatnonzero(
+                    (codes == u) & (delta[:, v] > EXCHANGE_TOLERANCE - (best_worth - worth[u, v]))
+                )
+                edge = delta[rows, v]
+                order = np.argsort(-edge, kind="stable")
+                moves.append((rows[order], v))
+                deltas.append(edge[order])
+                limit = min(limit, len(rows))
+        layers = np.sum([edge[:int(limit)] for edge in deltas], axis=0)
+        m = int(np.count_nonzero(layers > EXCHANGE_TOLERANCE))
+        for rows, v in moves:
+            codes[rows[:m]] = v
+
+
+def _fill_budget(codes: np.ndarray, gain: np.ndarray, cost: np.ndarray, capacity: np.ndarray, left: float):
+    """
+    Spend the budget left on the moves of best gain per unit of cost.
+
+    Every pass offers each customer their best affordable move to an arm
+    with room, and takes them by decreasing gain per extra cost (moves
+    that cost nothing more first) while the budget and the room allow.
+    """
+    n, n_arms = gain.shape
+    padded_gain = np.column_stack([gain, np.zeros(n)])
+    padded_cost = np.append(cost, 0.0)
+    for _ in range(MAX_SWEEPS):
+        room = _room(codes, capacity)
+        extra_gain = gain - padded_gain[np.arange(n), codes][:, None]
+        extra_cost = cost - padded_cost[codes][None].T
+        feasible = (extra_gain > 0) & (extra_cost <= left) & (room >= 1)
+        if not feasible.any():
+            return
+        target = np.where(feasible, extra_gain, -np.inf).argmax(axis=1)
+        rows = np.flatnonzero(feasible.any(axis=1))
+        target = target[rows]
+        extra_gain = extra_gain[rows, target]
+        extra_cost = extra_cost[rows, target]
+
+        free = extra_cost <= 0
+        ratio = np.where(free, np.inf, extra_gain / np.where(free, 1.0, extra_cost))
+        order = np.lexsort((-extra_gain, -ratio))
+        rows, target, extra_cost = rows[order], target[order], extra_cost[order]
+
+        # Within each arm's room, then within the budget in that order
+        rank = np.empty(len(rows), dtype=np.intp)
+        for arm in range(n_arms):
+            in_arm = np.flatnonzero(target == arm)
+            rank[in_arm] = np.arange(len(in_arm))
+        accepted = rank < room[target]
+        spent = np.cumsum(np.where(accepted, extra_cost, 0.0))
+        accepted &= spent <= left + BUDGET_TOLERANCE * max(left, 1.0)
+        # The first move that overflows the budget stops the pass
+        stop = np.flatnonzero(~accepted & (rank < room[target]))
+        if len(stop):
+            accepted[stop[0]:] = False
+        if not accepted.any():
+            return
+        codes[rows[accepted]] = target[accepted]
+        left -= float(extra_cost[accepted].sum())
+
+
+def _solve(gain: np.ndarray, capacity: np.ndarray, prices: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    prices = _capacity_prices(gain, capacity, prices)
+    codes = _choose(gain, prices)
+    _enforce_capacity(codes, gain, prices, capacity)
+    _exchange(codes, gain, capacity)
+    return codes, prices
+
+
+def allocate(
+    cate: np.ndarray,
+    cost=None,
+    capacity=None,
+    budget: float | None = None,
+    value_per_conversion: float | None = None
+) -> Allocation:
+    """
+    Assign at most one arm per customer under cost and send limits.
+
+    Args:
+        cate: CATE matrix of shape (n_customers, n_arms)
+        cost: Cost of one email of each arm, defaults to 0
+        capacity: Maximum emails of each arm, np.inf for no limit
+        budget: Maximum total cost, None for no limit
+        value_per_conversion: When given, maximize the net value
+            value_per_conversion * CATE - cost instead of the expected
+            incremental conversions
+
+    Returns:
+        Allocation
+    """
+    cate = np.asarray(cate, dtype=np.float64)
+    n, n_arms = cate.shape
+    cost = np.zeros(n_arms) if cost is None else np.asarray(cost, dtype=np.float64)
+    capacity = np.full(n_arms, np.inf) if capacity is None else np.asarray(capacity, dtype=np.float64)
+    if cost.shape != (n_arms,) or capacity.shape != (n_arms,):
+        raise ValueError(f"Expected a cost and a capacity for each of the {n_arms} arms")
+    if (cost < 0).any() or (capacity < 0).any() or (budget is not None and budget < 0):
+        raise ValueError("Costs, capacities and budget must be non-negative")
+
+    gain = cate if value_per_conversion is None else value_per_conversion * cate - cost
+    codes, prices = _solve(gain, capacity, np.zeros(n_arms))
+    budget_price = 0.0
+
+    def total_cost(codes):
+        return float(np.append(cost, 0.0)[codes].sum())
+
+    if budget is not None and total_cost(codes) > budget:
+        # Every gain is at most high * cost: nothing costly is sent at high
+        costly = cost > 0
+        low, high = 0.0, float((np.maximum(gain[:, costly], 0) / cost[costly]).max()) * (1 + 1e-9)
+        codes, prices = _solve(gain - high * cost, capacity, prices)
+        for _ in range(BUDGET_STEPS):
+            if high - low <= BUDGET_TOLERANCE * high:
+                break
+            middle = (low + high) / 2
+            candidate, candidate_prices = _solve(gain - middle * cost, capacity, prices)
+            if total_cost(candidate) > budget:
+                low = middle
+            else:
+                high, codes, prices = middle, candidate, candidate_prices
+        budget_price = high
+        _fill_budget(codes, gain, cost, capacity, budget - total_cost(codes))
+
+    lift = np.where(codes < n_arms, cate[np.arange(n), np.minimum(codes, n_arms - 1)], 0.0)
+    return Allocation(codes, lift, total_cost(codes), prices, budget_price)
+
+
+def _arm_values(values: dict, default: float) -> np.ndarray:
+    """Per-arm array from a dict keyed by arm name."""
+    names = [arm.name for arm in TREATMENT_ARMS]
+    unknown = sorted(set(values) - set(names))
+    if unknown:
+        raise ValueError(f"Unknown arms {unknown}, expected {names}")
+    return np.array([values.get(name, default) for name in names], dtype=np.float64)
+
+
+def allocate_constrained(cate: np.ndarray, constraints: AllocationConstraints) -> Allocation:
+    """allocate with the constraints of an AllocationConstraints."""
+    return allocate(
+        cate,
+        cost=_arm_values(constraints.cost, 0.0),
+        capacity=_arm_values(constraints.capacity, np.inf),
+        budget=constraints.budget,
+        value_per_conversion=constraints.value_per_conversion,
+    )
+
+
+def allocation_summary(allocation: Allocation, cate: np.ndarray, constraints: AllocationConstraints) -> dict:
+    """Expected results of an allocation, next to the unconstrained recommendation."""
+    _, unconstrained_lift = optimal_treatment(cate)
+    summary = {
+        "total_customers": len(cate),
+        "expected_conversions": allocation.expected_conversions,
+        "unconstrained_conversions": float(unconstrained_lift.sum()),
+        "total_cost": allocation.cost,
+        "treatment_distribution": treatment_distribution(allocation.counts(), cate_models.treatment_labels),
+        "prices": dict(zip([arm.name for arm in TREATMENT_ARMS], allocation.prices.tolist())),
+        "budget_price": allocation.budget_price,
+    }
+    if constraints.value_per_conversion is not None:
+        summary["expected_net_value"] = (
+            constraints.value_per_conversion * allocation.expected_conversions - allocation.cost
+        )
+    return summary
+
+
+def allocate_batch(body: bytes) -> bytes:
+    """
+    Validate, score and allocate an AllocationRequest JSON body.
+
+    Returns:
+        AllocationOutput JSON body
+
+    Raises:
+        BatchValidationError: with FastAPI-style error locations
+    """
+    with metrics.stage("validate"):
+        content = decode_json(body)
+        if not isinstance(content, dict):
+            raise BatchValidationError([{
+                "type": "model_attributes_type", "loc": ("body",), "msg": "Input should be an object", "input": None
+            }])
+        try:
+            constraints = AllocationConstraints.model_validate(
+                {key: value for key, value in content.items() if key != "customers"}
+            )
+            for values in (constraints.cost, constraints.capacity):
+                _arm_values(values, 0.0)
+        except ValidationError as e:
+            raise BatchValidationError([
+                {**error, "loc": ("body", *error["loc"])}
+                for error in e.errors(include_url=False, include_context=False)
+            ])
+        except ValueError as e:
+            raise BatchValidationError([{"type": "value_error", "loc": ("body",), "msg": str(e), "input": None}])
+        columns = check_columns(content.get("customers"), ("body", "customers"))
+    with metrics.stage("preprocess"):
+        X = preprocess_columns(columns)
+    metrics.observe_batch("allocate", len(X))
+
+    bundle = cate_models.current()
+    with metrics.stage("predict"):
+        cate = cate_models.predict_matrix(X, bundle)
+    with metrics.stage("decide"):
+        allocation = allocate_constrained(cate, constraints)
+    metrics.count_treatments(allocation.codes, cate_models.treatment_labels)
+
+    with metrics.stage("serialize"):
+        return json.dumps({
+            "treatment": allocation.codes.tolist(),
+            "expected_lift": allocation.lift.tolist(),
+            "treatment_labels": cate_models.treatment_labels,
+            "summary": allocation_summary(allocation, cate, constraints),
+            "model_version": bundle.version,
+        }).encode()
+
+
+def _parse_arm_values(items: list[str]) -> dict:
+    """Parse ["mens=0.1", ...] command-line values."""
+    values = {}
+    for item in items:
+        name, _, value = item.partition("=")
+        values[name] = float(value)
+    return values
+
+
+def main():
+    from .bulk import PASSTHROUGH_COLUMNS, frame_columns
+    from .validation import ColumnValidationError
+
+    parser = argparse.ArgumentParser(description="Allocate treatments under campaign costs and send limits.")
+    parser.add_argument("input", help="Customer CSV in the hillstrom.csv schema, or scored with cate_<arm>_email columns")
+    parser.add_argument("output", help="Output CSV with the assigned treatment of every customer")
+    parser.add_argument("--cost", nargs="*", default=[], metavar="ARM=COST", help="Cost of one email")
+    parser.add_argument("--capacity", nargs="*", default=[], metavar="ARM=N", help="Maximum emails")
+    parser.add_argument("--budget", type=float, default=None, help="Maximum total cost")
+    parser.add_argument("--value-per-conversion", type=float, default=None, help="Maximize net value instead")
+    args = parser.parse_args()
+
+    try:
+        constraints = AllocationConstraints(
+            cost=_parse_arm_values(args.cost),
+            capacity={name: int(value) for name, value in _parse_arm_values(args.capacity).items()},
+            budget=args.budget,
+            value_per_conversion=args.value_per_conversion,
+        )
+    except (ValueError, ValidationError) as e:
+        sys.exit(f"Invalid constraints: {e}")
+
+    df = pd.read_csv(args.input, dtype={"history_segment": str, "zip_code": str, "channel": str})
+    cate_columns = [arm.output_field for arm in TREATMENT_ARMS]
+    started = time.perf_counter()
+    if all(name in df for name in cate_columns):
+        cate = df[cate_columns].to_numpy(dtype=np.float64)
+    else:
+        try:
+            cate = cate_models.predict_matrix(preprocess_columns(frame_columns(df)))
+        except ColumnValidationError as e:
+            sys.exit(f"Invalid customers: {e.errors[:5]}")
+        df = df[[name for name in PASSTHROUGH_COLUMNS if name in df]].assign(
+            **{name: cate[:, j] for j, name in enumerate(cate_columns)}
+        )
+    scored = time.perf_counter()
+
+    try:
+        allocation = allocate_constrained(cate, constraints)
+    except ValueError as e:
+        sys.exit(str(e))
+    allocated = time.perf_counter()
+
+    labels = np.array(cate_models.treatment_labels)
+    df.assign(treatment=labels[allocation.codes], expected_lift=allocation.lift).to_csv(args.output, index=False)
+
+    summary = allocation_summary(allocation, cate, constraints)
+    print(
+        f"{len(df):,} customers (scored in {scored - started:.1f}s, allocated in {allocated - scored:.2f}s)\n"
+        f"Expected incremental conversions: {summary['expected_conversions']:.1f} "
+        f"(unconstrained: {summary['unconstrained_conversions']:.1f}), total cost {summary['total_cost']:.2f}"
+    )
+    if "expected_net_value" in summary:
+        print(f"Expected net value: {summary['expected_net_value']:.2f}")
+    for label, share in summary["treatment_distribution"].items():
+        print(f"  {label}: {share['count']:,} ({share['percentage']}%)")
+    print(f"Allocation written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+On-disk format of exported model artifacts.
+
+An artifact is a directory holding one .npy file per array and a
+manifest.json describing them:
+
+    {
+        "kind": "flat_tree_ensemble",
+        "format_version": 1,
+        "version": "3f2a9c1b04de",
+        "feature_names": [...],
+        "arrays": {"feature": {"file": "feature.npy", "dtype": "int64",
+                               "shape": [12345], "sha256": "..."}, ...},
+        ...extra metadata
+    }
+
+Unlike pickles, loading an artifact never executes code, and the arrays
+can be memory-mapped so that several worker processes share the same
+pages through the OS page cache.
+"""
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+
+from .preprocessing import FEATURE_NAMES
+
+MANIFEST_NAME = "manifest.json"
+FORMAT_VERSION = 1
+
+
+class ArtifactError(ValueError):
+    """Raised when an artifact is corrupt or does not fit this code."""
+
+
+def file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def save_artifact(path, kind: str, arrays: dict, version: str | None = None, **metadata) -> dict:
+    """
+    Write arrays and their manifest to the directory path.
+
+    The manifest is written last, so a directory without one is an
+    interrupted export.
+
+    Args:
+        path: Output directory, created if needed
+        kind: Type of artifact, checked when loading
+        arrays: Mapping of array name to NumPy array
+        version: Version label, defaults to a hash of the array contents
+        **metadata: Extra JSON-serializable manifest entries
+
+    Returns:
+        The manifest
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    (path / MANIFEST_NAME).unlink(missing_ok=True)
+
+    entries = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        np.save(path / f"{name}.npy", array)
+        entries[name] = {
+            "file": f"{name}.npy",
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "sha256": file_sha256(path / f"{name}.npy"),
+        }
+
+    if version is None:
+        checksums = "".join(entries[name]["sha256"] for name in sorted(entries))
+        version = hashlib.sha256(checksums.encode()).hexdigest()[:12]
+
+    manifest = {
+        "kind": kind,
+        "format_version": FORMAT_VERSION,
+        "version": version,
+        "feature_names": FEATURE_NAMES,
+        "arrays": entries,
+        **metadata,
+    }
+    with open(path / MANIFEST_NAME, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_manifest(path) -> dict:
+    """Read the manifest of the artifact directory path."""
+    manifest_path = Path(path) / MANIFEST_NAME
+    if not manifest_path.exists():
+        raise FileNotFoundError(f"No artifact manifest at {manifest_path}")
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def load_artifact(path, kind: str, mmap_mode: str | None = 'r', verify: bool = True) -> tuple[dict, dict]:
+    """
+    Load the arrays of an artifact written by `save_artifact`.
+
+    Args:
+        path: Artifact directory
+        kind: Expected artifact type
+        mmap_mode: Passed to np.load, None reads the arrays into memory
+        verify: Check the SHA-256 of every array file
+
+    Returns:
+        Tuple of (arrays, manifest)
+
+    Raises:
+        FileNotFoundError: if the directory has no manifest
+        ArtifactError: if the artifact is of another kind or format,
+            was exported for other features, or fails its checksums
+    """
+    path = Path(path)
+    manifest = read_manifest(path)
+
+    if manifest.get("kind") != kind:
+        raise ArtifactError(f"{path} is a {manifest.get('kind')!r} artifact, expected {kind!r}")
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ArtifactError(
+            f"{path} has format version {manifest.get('format_version')}, "
+            f"expected {FORMAT_VERSION}"
+        )
+    if manifest.get("feature_names") != FEATURE_NAMES:
+        raise ArtifactError(
+            f"{path} was exported for features {manifest.get('feature_names')}, "
+            f"preprocessing.py produces {FEATURE_NAMES}"
+        )
+
+    arrays = {}
+    for name, entry in manifest["arrays"].items():
+        array_path = path / entry["file"]
+        if verify and file_sha256(array_path) != entry["sha256"]:
+            raise ArtifactError(f"Checksum mismatch for {array_path}")
+        array = np.load(array_path, mmap_mode=mmap_mode, allow_pickle=False)
+        if array.dtype.str != entry["dtype"] or list(array.shape) != entry["shape"]:
+            raise ArtifactError(f"{array_path} does not match its manifest entry")
+        arrays[name] = array
+    return arrays, manifest
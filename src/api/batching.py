@@ -0,0 +1,107 @@
+"""
+Dynamic micro-batching of single-customer predictions.
+
+Concurrent /predict calls each score one row, and the per-call overhead
+of the models dominates their cost. The MicroBatcher collects rows from
+concurrent requests for up to max_batch_size rows or max_wait_ms, scores
+them as one matrix in the inference executor and hands each request its
+own result.
+"""
+import asyncio
+
+import numpy as np
+
+from . import metrics
+from .config import settings
+from .executor import inference
+from .scoring import score_matrix
+
+
+class MicroBatcher:
+    """
+    Groups single rows submitted from the event loop into batches.
+
+    Attributes:
+        fn: Function mapping an (n_rows, n_features) matrix to a
+            sequence of n_rows results
+        max_batch_size: Rows that trigger an immediate flush
+        max_wait_ms: Longest time a row waits for others to join
+        batches: Number of batches scored so far
+        rows: Number of rows scored so far
+    """
+
+    def __init__(self, fn, max_batch_size: int = 64, max_wait_ms: float = 2.0):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.batches = 0
+        self.rows = 0
+        self._rows = []
+        self._futures = []
+        self._timer = None
+        self._tasks = set()
+
+    @classmethod
+    def from_settings(cls, fn) -> "MicroBatcher":
+        return cls(fn, settings.batch_max_size, settings.batch_max_wait_ms)
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.rows / self.batches if self.batches else 0.0
+
+    async def submit(self, row: np.ndarray):
+        """
+        Score one encoded row as part of the next batch.
+
+        Args:
+            row: Feature vector of shape (n_features,)
+
+        Returns:
+            The result of fn for this row
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._rows.append(row)
+        self._futures.append(future)
+
+        if len(self._rows) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_ms / 1000, self._flush)
+        return await future
+
+    def _flush(self):
+        """Start scoring the pending rows."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._rows:
+            return
+        rows, futures = self._rows, self._futures
+        self._rows, self._futures = [], []
+
+        # Keep a reference so the task is not garbage collected mid-flight
+        task = asyncio.ensure_future(self._score(rows, futures))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _score(self, rows: list, futures: list):
+        try:
+            results = await inference.run(self.fn, np.vstack(rows))
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.rows += len(rows)
+        metrics.observe_batch("predict_microbatch", len(rows))
+        # Requests that were cancelled meanwhile are skipped
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+
+
+# Global instance
+batcher = MicroBatcher.from_settings(score_matrix)
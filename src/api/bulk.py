@@ -0,0 +1,142 @@
+"""
+Bulk scoring of customer files in the data/raw/hillstrom.csv schema.
+
+Files are parsed into columns, validated with vectorized checks and
+scored chunk by chunk, producing rows in the format of
+data/processed/cate_predictions_sample.csv.
+"""
+import io
+from collections.abc import Iterator
+
+import numpy as np
+import pandas as pd
+
+from . import metrics
+from .models import ModelBundle, cate_models
+from .policy import optimal_treatment
+from .preprocessing import INPUT_COLUMNS, preprocess_columns
+from .validation import validate_columns
+
+# Input columns echoed in front of the predictions
+PASSTHROUGH_COLUMNS = ['recency', 'history', 'mens', 'womens', 'newbie']
+
+# Rows scored per output chunk
+CHUNK_SIZE = 10_000
+
+CSV_TYPES = ("text/csv", "application/csv", "text/plain")
+PARQUET_TYPES = ("application/vnd.apache.parquet", "application/x-parquet", "application/parquet")
+ARROW_TYPES = ("application/vnd.apache.arrow.file", "application/vnd.apache.arrow.stream")
+
+
+class UnsupportedFormatError(ValueError):
+    """Raised when an uploaded file cannot be read."""
+
+
+def read_table(body: bytes, content_type: str | None) -> pd.DataFrame:
+    """
+    Parse an uploaded CSV, Parquet or Arrow file.
+
+    Args:
+        body: Raw file content
+        content_type: Media type of the upload, CSV when missing
+
+    Returns:
+        DataFrame with at least the INPUT_COLUMNS
+
+    Raises:
+        UnsupportedFormatError: for unknown media types, or Parquet/Arrow
+            uploads when pyarrow is not installed
+    """
+    media_type = (content_type or "text/csv").split(";")[0].strip().lower()
+
+    if media_type in CSV_TYPES:
+        # Categorical columns are read as strings so validation sees the raw values
+        return pd.read_csv(
+            io.BytesIO(body),
+            usecols=lambda name: name in INPUT_COLUMNS,
+            dtype={'history_segment': str, 'zip_code': str, 'channel': str},
+        )
+
+    if media_type in PARQUET_TYPES + ARROW_TYPES:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise UnsupportedFormatError(
+                f"{media_type} uploads require pyarrow to be installed"
+            ) from e
+
+        source = pa.BufferReader(body)
+        if media_type in PARQUET_TYPES:
+            table = pq.read_table(source, columns=INPUT_COLUMNS)
+        elif media_type.endswith("stream"):
+            table = pa.ipc.open_stream(source).read_all()
+        else:
+            table = pa.ipc.open_file(source).read_all()
+        return table.to_pandas()
+
+    raise UnsupportedFormatError(
+        f"Unsupported media type {media_type!r}, expected one of "
+        f"{', '.join(CSV_TYPES + PARQUET_TYPES + ARROW_TYPES)}"
+    )
+
+
+def frame_columns(df: pd.DataFrame) -> dict:
+    """Validate the input columns of a DataFrame, see `validate_columns`."""
+    return validate_columns({
+        name: df[name].to_numpy() for name in INPUT_COLUMNS if name in df
+    })
+
+
+def score_columns(columns: dict, bundle: ModelBundle | None = None) -> pd.DataFrame:
+    """
+    Score validated columns into the cate_predictions_sample.csv format.
+
+    Args:
+        columns: Validated columns as returned by `validate_columns`
+        bundle: Models to score with, defaults to the current ones
+
+    Returns:
+        DataFrame with the passthrough columns, one CATE column per
+        arm and the optimal treatment label
+    """
+    with metrics.stage("preprocess"):
+        X = preprocess_columns(columns)
+    with metrics.stage("predict"):
+        cate = cate_models.predict_matrix(X, bundle)
+    with metrics.stage("decide"):
+        codes, _ = optimal_treatment(cate)
+    metrics.count_treatments(codes, cate_models.treatment_labels)
+
+    scored = pd.DataFrame({
+        'recency': columns['recency'].astype(np.int64),
+        'history': columns['history'],
+        'mens': columns['mens'].astype(np.int64),
+        'womens': columns['womens'].astype(np.int64),
+        'newbie': columns['newbie'].astype(np.int64),
+    })
+    for j, arm in enumerate(cate_models.arms):
+        scored[arm.output_field] = cate[:, j]
+    scored['optimal_treatment'] = np.asarray(cate_models.treatment_labels)[codes]
+    return scored
+
+
+def scored_csv_chunks(
+    columns: dict,
+    chunk_size: int = CHUNK_SIZE,
+    bundle: ModelBundle | None = None
+) -> Iterator[str]:
+    """
+    Score validated columns chunk by chunk and yield CSV text.
+
+    Every chunk is scored with the same models, even if they are
+    reloaded while the file streams.
+    """
+    bundle = bundle or cate_models.current()
+    n = len(columns['recency'])
+    for start in range(0, max(n, 1), chunk_size):
+        chunk = {name: values[start:start + chunk_size] for name, values in columns.items()}
+        scored = score_columns(chunk, bundle)
+        with metrics.stage("serialize"):
+            text = scored.to_csv(index=False, header=start == 0)
+        yield text
@@ -0,0 +1,120 @@
+"""
+Bounded LRU cache of CATE predictions.
+
+The Hillstrom feature space is highly discrete (only history is
+continuous), so many single predictions are exact repeats. Predictions
+are cached per encoded feature vector, optionally with history rounded
+to a step so that near-identical customers share an entry.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Column of history in the encoded feature vector
+HISTORY_COLUMN = 1
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU mapping of feature vectors to CATE rows.
+
+    Attributes:
+        max_size: Maximum number of entries, 0 disables the cache
+        history_step: history is rounded to the nearest multiple of this
+            step before lookup and scoring, 0 keeps it exact
+        hits: Rows answered from the cache
+        misses: Rows that had to be scored
+        evictions: Entries dropped to stay within max_size
+    """
+
+    def __init__(self, max_size: int = 10_000, history_step: float = 0.0):
+        self.max_size = max_size
+        self.history_step = history_step
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def quantize(self, X: np.ndarray) -> np.ndarray:
+        """Round the history column of X to history_step."""
+        X = np.asarray(X, dtype=np.float64)
+        if not self.history_step:
+            return X
+        X = X.copy()
+        X[:, HISTORY_COLUMN] = np.round(X[:, HISTORY_COLUMN] / self.history_step) * self.history_step
+        return X
+
+    def predict(self, X: np.ndarray, predict_fn, version: str = "") -> np.ndarray:
+        """
+        Predict X, scoring only the rows that are not cached.
+
+        Args:
+            X: Feature array of shape (n_samples, n_features)
+            predict_fn: Function scoring a feature array into an array
+                of shape (n_samples, n_arms)
+            version: Model version of predict_fn, part of the keys so
+                that entries of different versions never mix
+
+        Returns:
+            CATE array of shape (n_samples, n_arms)
+        """
+        X = np.ascontiguousarray(self.quantize(X))
+        prefix = version.encode() + b"\0"
+        keys = [prefix + row.tobytes() for row in X]
+
+        cached = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                value = self._entries.get(key)
+                if value is not None:
+                    self._entries.move_to_end(key)
+                    cached[i] = value
+            self.hits += len(cached)
+            self.misses += len(keys) - len(cached)
+
+        if len(cached) == len(keys):
+            return np.array([cached[i] for i in range(len(keys))])
+
+        missing = [i for i in range(len(keys)) if i not in cached]
+        scored = predict_fn(X[missing])
+
+        with self._lock:
+            for i, value in zip(missing, scored):
+                self._entries[keys[i]] = value.copy()
+                self._entries.move_to_end(keys[i])
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+        out = np.empty((len(keys), scored.shape[1]))
+        out[missing] = scored
+        for i, value in cached.items():
+            out[i] = value
+        return out
+
+    def clear(self):
+        """Drop all entries, e.g. after the models changed."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "history_step": self.history_step,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
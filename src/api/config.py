@@ -0,0 +1,74 @@
+"""Runtime settings of the API, read from environment variables."""
+import os
+from dataclasses import dataclass, fields
+
+
+@dataclass
+class Settings:
+    """API settings. Each field can be overridden by its CATE_* variable."""
+
+    # Scoring backend: "sklearn" (pickled models), "flat" (see trees.py)
+    # or "lookup" (see lookup.py)
+    backend: str = "sklearn"
+
+    # Inference executor (see executor.py). 0 threads runs inline on the
+    # event loop, 0 processes disables the process pool. Request bodies of
+    # at least process_min_bytes go to the process pool.
+    executor_threads: int = 4
+    executor_processes: int = 0
+    process_min_bytes: int = 1_000_000
+    max_queue_depth: int = 64
+
+    # Micro-batching of single /predict calls (see batching.py): a batch
+    # is scored once it holds batch_max_size customers or its oldest
+    # customer has waited batch_max_wait_ms.
+    micro_batching: bool = True
+    batch_max_size: int = 64
+    batch_max_wait_ms: float = 2.0
+
+    # Prediction cache (see cache.py). cache_size 0 disables it, batches
+    # above cache_max_rows bypass it, and history is rounded to a multiple
+    # of cache_history_step when it is not 0.
+    cache_size: int = 10_000
+    cache_max_rows: int = 1024
+    cache_history_step: float = 0.0
+
+    # Model registry (see registry.py), defaults to models/registry. The
+    # active version is polled every registry_poll_s seconds when not 0.
+    registry_dir: str = ""
+    registry_poll_s: float = 0.0
+
+    # Shadow scoring (see shadow.py): registry version of a candidate
+    # model scored on a sample of live traffic, off the request path
+    shadow_version: str = ""
+    shadow_sample_rate: float = 0.1
+    shadow_queue_size: int = 256
+
+    # Sequential monitor of a live campaign (see src/bayesian/monitor.py):
+    # stop once a group is best with probability monitor_threshold and
+    # every group has monitor_min_customers customers
+    monitor_threshold: float = 0.95
+    monitor_min_customers: int = 1000
+
+    # Prometheus metrics (see metrics.py), served at /metrics
+    metrics_enabled: bool = True
+
+    # Token expected in the X-Admin-Token header, admin endpoints are
+    # disabled when empty
+    admin_token: str = ""
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        values = {}
+        for field in fields(cls):
+            raw = os.environ.get(f"CATE_{field.name.upper()}")
+            if raw is None:
+                continue
+            if field.type is bool:
+                values[field.name] = raw.lower() in ("1", "true", "yes")
+            else:
+                values[field.name] = field.type(raw)
+        return cls(**values)
+
+
+settings = Settings.from_env()
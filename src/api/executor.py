@@ -0,0 +1,180 @@
+"""
+Executor for CPU-bound inference work.
+
+Keeps validation, preprocessing, model scoring and serialization off the
+asyncio event loop so that large batches do not stall other requests
+(health checks included), and rejects new work once too many requests
+are already queued.
+
+Large batches can be sent to a process pool, which also keeps their
+pure-Python work from competing with the event loop for the GIL.
+"""
+import asyncio
+from collections.abc import AsyncIterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+from .config import settings
+from .models import cate_models
+from .shadow import shadow
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the inference queue is at its maximum depth."""
+
+
+def _init_process_worker(backend: str | None):
+    """Load the models once per worker process."""
+    cate_models.load_models(backend=backend)
+    # Forked workers inherit the parent's sampling state
+    shadow.reseed()
+
+
+def _run_with_version(version: str, shadow_rate: float | None, fn, *args):
+    """
+    Run fn in a worker process with the given model version loaded.
+
+    Returns:
+        Tuple of fn's result and the rows it offered to shadow scoring,
+        sampled at shadow_rate, empty when shadow_rate is None
+    """
+    cate_models.ensure_version(version)
+    if shadow_rate is None:
+        return fn(*args), []
+    with shadow.collecting(shadow_rate) as samples:
+        result = fn(*args)
+    return result, samples
+
+
+class InferenceExecutor:
+    """
+    Thread pool, plus an optional process pool for large batches.
+
+    Attributes:
+        threads: Worker threads, 0 runs work inline on the event loop
+        processes: Worker processes, 0 disables the process pool
+        process_min_bytes: Payloads of at least this size are
+            processed in the process pool
+        max_queue_depth: Requests admitted at once before rejecting
+    """
+
+    def __init__(
+        self,
+        threads: int = 4,
+        processes: int = 0,
+        process_min_bytes: int = 1_000_000,
+        max_queue_depth: int = 64
+    ):
+        self.threads = threads
+        self.processes = processes
+        self.process_min_bytes = process_min_bytes
+        self.max_queue_depth = max_queue_depth
+        self.in_flight = 0
+        self._thread_pool = None
+        self._process_pool = None
+
+    @classmethod
+    def from_settings(cls) -> "InferenceExecutor":
+        return cls(
+            threads=settings.executor_threads,
+            processes=settings.executor_processes,
+            process_min_bytes=settings.process_min_bytes,
+            max_queue_depth=settings.max_queue_depth,
+        )
+
+    def start(self):
+        """Create the worker pools."""
+        if self.threads and self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(self.threads, thread_name_prefix="inference")
+        if self.processes and self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(
+                self.processes,
+                initializer=_init_process_worker,
+                initargs=(cate_models.backend,)
+            )
+
+    def shutdown(self):
+        """Stop the worker pools, waiting for running work."""
+        for pool in (self._thread_pool, self._process_pool):
+            if pool is not None:
+                pool.shutdown(wait=True)
+        self._thread_pool = None
+        self._process_pool = None
+
+    @contextmanager
+    def admit(self):
+        """
+        Reserve a queue slot for the duration of a request.
+
+        Must be entered from the event loop thread.
+
+        Raises:
+            QueueFullError: if max_queue_depth requests are already admitted
+        """
+        if self.in_flight >= self.max_queue_depth:
+            raise QueueFullError(
+                f"Inference queue full ({self.max_queue_depth} requests in flight)"
+            )
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    async def stream(self, fn, *args, **kwargs) -> AsyncIterator:
+        """
+        Stream the chunks of the iterator fn(*args, **kwargs) returns,
+        holding a queue slot until the last one is sent.
+
+        fn and every chunk run in the thread pool. The slot is reserved
+        and fn called before this returns, so that a full queue fails
+        the request before its response starts. The slot is released
+        when the stream ends, fails or the client disconnects.
+
+        Raises:
+            QueueFullError: if max_queue_depth requests are already admitted
+        """
+        chunks = self._held(partial(fn, *args, **kwargs))
+        await anext(chunks)
+        return chunks
+
+    async def _held(self, fn):
+        with self.admit():
+            chunks = iter(await self.run(fn))
+            yield
+            while (chunk := await self.run(next, chunks, None)) is not None:
+                yield chunk
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) in the thread pool."""
+        if self._thread_pool is None:
+            return fn(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._thread_pool, partial(fn, *args, **kwargs))
+
+    async def run_batch(self, fn, payload: bytes, *args):
+        """
+        Run fn(payload, *args), in the process pool for large payloads.
+
+        fn must be a module-level function so that it can be sent to a
+        worker process. Worker processes first switch to the model
+        version that is current here, in case it was reloaded, and
+        return the rows they sample for shadow scoring, which are
+        queued here where the candidate runs.
+        """
+        if self._process_pool is not None and len(payload) >= self.process_min_bytes:
+            loop = asyncio.get_running_loop()
+            shadow_rate = shadow.sample_rate if shadow.active else None
+            result, samples = await loop.run_in_executor(
+                self._process_pool, _run_with_version,
+                cate_models.version, shadow_rate, fn, payload, *args
+            )
+            for sample in samples:
+                shadow.enqueue(*sample)
+            return result
+        return await self.run(fn, payload, *args)
+
+
+# Global instance
+inference = InferenceExecutor.from_settings()
@@ -0,0 +1,334 @@
+"""
+Precomputed CATE lookup table over the discrete feature grid.
+
+Apart from history, every encoded feature takes a handful of values, and
+the trees split history at a finite set of thresholds. The models are
+therefore piecewise constant: for each combination of the categorical
+features (a "cell group"), CATE only changes at the history thresholds
+reachable in the trees for that combination. The table stores, per cell
+group, those thresholds and the CATE of every interval between them,
+computed by the models themselves, so lookups are bit-identical to the
+trees.
+
+sklearn compares history as float32 against float64 thresholds, so each
+threshold t can be replaced by the largest float32 not above it. For
+non-negative float32 the bit pattern is ordered like the value, which
+gives exact integer keys.
+
+Layout (CSR-like, saved as a memory-mappable artifact, see artifacts.py):
+    keys: uint64 array, group << 32 | float32 bits of the threshold,
+        sorted, so that a single searchsorted finds the interval of
+        (group, history)
+    values: CATE of every interval, shape (n_intervals, n_arms); the
+        intervals of group g follow the keys of group g, shifted by g
+
+Usage:
+    python -m src.api.lookup [output_dir]
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from .artifacts import load_artifact, save_artifact
+
+# Artifact kind written by CATELookupTable.save
+ARTIFACT_KIND = "cate_lookup_table"
+
+# Arrays that fully describe a CATELookupTable
+ARRAY_NAMES = ['keys', 'values']
+
+# Feature columns of the encoded vector (see preprocessing.py)
+RECENCY, HISTORY, SEGMENT = 0, 1, 2
+FLAGS = [3, 4, 5]
+ZIP_ONE_HOT = [6, 7, 8]
+CHANNEL_ONE_HOT = [9, 10, 11]
+N_FEATURES = 12
+
+# Values taken by the categorical features
+RECENCY_VALUES = np.arange(1, 13)
+SEGMENT_VALUES = np.arange(1, 8)
+
+# Grid shape over (recency, segment, mens, womens, newbie, zip, channel)
+GROUP_SHAPE = (len(RECENCY_VALUES), len(SEGMENT_VALUES), 2, 2, 2, 3, 3)
+N_GROUPS = int(np.prod(GROUP_SHAPE))
+
+
+def float32_floor(values) -> np.ndarray:
+    """Largest float32 not above each value."""
+    values = np.asarray(values, dtype=np.float64)
+    out = values.astype(np.float32)
+    return np.where(out > values, np.nextafter(out, np.float32(-np.inf)), out)
+
+
+def make_keys(group: np.ndarray, history: np.ndarray) -> np.ndarray:
+    """Keys of (group, non-negative float32 history) pairs."""
+    bits = (np.asarray(history, dtype=np.float32) + np.float32(0)).view(np.uint32)
+    return (np.asarray(group, dtype=np.uint64) << np.uint64(32)) | bits.astype(np.uint64)
+
+
+def group_features() -> np.ndarray:
+    """
+    Encoded feature vector of every cell group, history set to 0.
+
+    Returns:
+        Array of shape (N_GROUPS, 12), row g being cell group g
+    """
+    codes = np.unravel_index(np.arange(N_GROUPS), GROUP_SHAPE)
+    recency, segment, mens, womens, newbie, zip_code, channel = codes
+    X = np.zeros((N_GROUPS, N_FEATURES))
+    X[:, RECENCY] = RECENCY_VALUES[recency]
+    X[:, SEGMENT] = SEGMENT_VALUES[segment]
+    X[:, FLAGS] = np.column_stack([mens, womens, newbie])
+    X[np.arange(N_GROUPS), np.array(ZIP_ONE_HOT)[zip_code]] = 1
+    X[np.arange(N_GROUPS), np.array(CHANNEL_ONE_HOT)[channel]] = 1
+    return X
+
+
+def group_index(X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Cell group of each row.
+
+    Args:
+        X: Feature array of shape (n_samples, 12)
+
+    Returns:
+        Tuple of (group index, on-grid mask). Rows whose categorical
+        features are not one of the grid values are off the grid, their
+        group index is meaningless.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    recency = X[:, RECENCY].astype(np.intp) - 1
+    segment = X[:, SEGMENT].astype(np.intp) - 1
+    flags = X[:, FLAGS].astype(np.intp)
+    zip_one_hot = X[:, ZIP_ONE_HOT]
+    channel_one_hot = X[:, CHANNEL_ONE_HOT]
+
+    on_grid = (
+        (X[:, RECENCY] == recency + 1) & (recency >= 0) & (recency < GROUP_SHAPE[0])
+        & (X[:, SEGMENT] == segment + 1) & (segment >= 0) & (segment < GROUP_SHAPE[1])
+        & ((X[:, FLAGS] == 0) | (X[:, FLAGS] == 1)).all(axis=1)
+        & ((zip_one_hot == 0) | (zip_one_hot == 1)).all(axis=1)
+        & (zip_one_hot.sum(axis=1) == 1)
+        & ((channel_one_hot == 0) | (channel_one_hot == 1)).all(axis=1)
+        & (channel_one_hot.sum(axis=1) == 1)
+        & (X[:, HISTORY].astype(np.float32) >= 0)
+    )
+
+    codes = (
+        np.where(on_grid, recency, 0), np.where(on_grid, segment, 0),
+        *np.where(on_grid, flags.T, 0),
+        zip_one_hot.argmax(axis=1), channel_one_hot.argmax(axis=1),
+    )
+    return np.ravel_multi_index(codes, GROUP_SHAPE), on_grid
+
+
+def history_keys(flat) -> np.ndarray:
+    """
+    Keys of the history thresholds reachable for each cell group.
+
+    Walks every tree once for all cell groups at the same time, keeping
+    the set of groups that can reach each node. Splits on history keep
+    both branches reachable, other splits are decided by the group.
+    Negative thresholds are dropped, as history is never below them.
+
+    Args:
+        flat: FlatTreeEnsemble of the models
+
+    Returns:
+        Sorted unique keys, see make_keys
+    """
+    # sklearn compares float32 features against float64 thresholds
+    groups = group_features().astype(np.float32)
+    keys = []
+    bounds = np.append(flat.roots, len(flat.feature))
+
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        reach = np.zeros((stop - start, N_GROUPS), dtype=bool)
+        reach[0] = True
+        # Children come after their parent in sklearn's node order
+        for node in range(start, stop):
+            left, right = flat.left[node], flat.right[node]
+            if left == node:
+                continue
+            reachable = reach[node - start]
+            if not reachable.any():
+                continue
+            feature, threshold = flat.feature[node], flat.threshold[node]
+            if feature == HISTORY:
+                reach[left - start] |= reachable
+                reach[right - start] |= reachable
+                if threshold >= 0:
+                    keys.append(make_keys(np.flatnonzero(reachable), float32_floor(threshold)))
+            else:
+                goes_left = groups[:, feature] <= threshold
+                reach[left - start] |= reachable & goes_left
+                reach[right - start] |= reachable & ~goes_left
+
+    return np.unique(np.concatenate(keys))
+
+
+def interval_representatives(keys: np.ndarray) -> np.ndarray:
+    """
+    A float32 history value inside every interval of the grid.
+
+    Group g has one interval ending at each of its thresholds b, holding
+    the float32 values x <= b and represented by b itself, and a last
+    interval represented by the float32 just above its last threshold.
+
+    Args:
+        keys: Sorted keys, see make_keys
+
+    Returns:
+        Representative history of every interval, in values order
+    """
+    group = (keys >> np.uint64(32)).astype(np.intp)
+    bounds = (keys & np.uint64(0xFFFFFFFF)).astype(np.uint32).view(np.float32)
+    counts = np.bincount(group, minlength=N_GROUPS)
+    out = np.zeros(len(keys) + N_GROUPS, dtype=np.float32)
+    out[np.arange(len(keys)) + group] = bounds
+
+    # Groups without history splits keep a single interval at 0
+    last = np.cumsum(counts) - 1
+    has_splits = counts > 0
+    out[last[has_splits] + np.flatnonzero(has_splits) + 1] = np.nextafter(
+        bounds[last[has_splits]], np.float32(np.inf)
+    )
+    return out
+
+
+class CATELookupTable:
+    """
+    CATE of every grid cell, answered by index lookup.
+
+    Attributes:
+        keys: Sorted keys of the history thresholds, see make_keys
+        values: CATE of every interval, shape (n_intervals, n_arms)
+        manifest: Artifact manifest when loaded from disk, else None
+    """
+
+    def __init__(self, keys, values, manifest=None):
+        self.keys = keys
+        self.values = values
+        self.manifest = manifest
+
+    @classmethod
+    def build(cls, flat, predict_fn) -> "CATELookupTable":
+        """
+        Enumerate the grid of the models and score every cell.
+
+        Args:
+            flat: FlatTreeEnsemble of the models, used for the thresholds
+            predict_fn: Function scoring a feature array into an array
+                of shape (n_samples, n_arms), whose values are stored
+
+        Returns:
+            CATELookupTable
+        """
+        keys = history_keys(flat)
+        counts = np.bincount((keys >> np.uint64(32)).astype(np.intp), minlength=N_GROUPS)
+        X = np.repeat(group_features(), counts + 1, axis=0)
+        X[:, HISTORY] = interval_representatives(keys)
+        return cls(keys, np.asarray(predict_fn(X), dtype=np.float64))
+
+    @property
+    def n_arms(self) -> int:
+        return self.values.shape[1]
+
+    def lookup(self, X) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Look up the CATE of each row.
+
+        Args:
+            X: Feature array of shape (n_samples, 12)
+
+        Returns:
+            Tuple of (CATE array of shape (n_samples, n_arms), on-grid
+            mask). Rows off the grid get zeros.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        group, on_grid = group_index(X)
+        history = np.where(on_grid, X[:, HISTORY], 0)
+        position = np.searchsorted(self.keys, make_keys(group, history))
+        out = np.take(self.values, position + group, axis=0)
+        out[~on_grid] = 0
+        return out, on_grid
+
+    def predict(self, X, fallback) -> np.ndarray:
+        """
+        Predict CATE, scoring rows off the grid with fallback.
+
+        Args:
+            X: Feature array of shape (n_samples, 12)
+            fallback: Function scoring a feature array into an array of
+                shape (n_samples, n_arms)
+
+        Returns:
+            CATE array of shape (n_samples, n_arms)
+        """
+        out, on_grid = self.lookup(X)
+        if not on_grid.all():
+            out[~on_grid] = fallback(np.asarray(X)[~on_grid])
+        return out
+
+    def save(self, path, **metadata) -> dict:
+        """Save the table as an artifact directory, returning its manifest."""
+        self.manifest = save_artifact(
+            path, ARTIFACT_KIND, {name: getattr(self, name) for name in ARRAY_NAMES}, **metadata
+        )
+        return self.manifest
+
+    @classmethod
+    def load(cls, path, mmap_mode: str | None = 'r', verify: bool = True) -> "CATELookupTable":
+        """Load a table saved with `save`, memory-mapped by default."""
+        arrays, manifest = load_artifact(path, ARTIFACT_KIND, mmap_mode=mmap_mode, verify=verify)
+        return cls(**{name: arrays[name] for name in ARRAY_NAMES}, manifest=manifest)
+
+
+def build_lookup_table(models: list) -> CATELookupTable:
+    """Build the lookup table of fitted GradientBoostingRegressor models."""
+    from .trees import FlatTreeEnsemble
+
+    flat = FlatTreeEnsemble.from_gradient_boosting(models)
+    return CATELookupTable.build(
+        flat, lambda X: np.column_stack([model.predict(X) for model in models])
+    )
+
+
+def export_lookup_table(path=None, model_dir=None) -> Path:
+    """
+    Build the lookup table of the pickled CATE models.
+
+    Args:
+        path: Output directory, defaults to cate_lookup in model_dir
+        model_dir: Directory with the pickles or a multi-treatment
+            model, defaults to models/
+
+    Returns:
+        Path of the written directory
+    """
+    from .models import (
+        LOOKUP_TABLE_NAME, MODELS_DIR, MULTI_MODEL_NAME, TREATMENT_ARMS,
+        has_multi_model, load_pickles, model_checksums, model_dir_version
+    )
+    from .trees import FlatTreeEnsemble
+
+    model_dir = Path(model_dir) if model_dir is not None else MODELS_DIR
+    path = Path(path) if path is not None else model_dir / LOOKUP_TABLE_NAME
+    if has_multi_model(model_dir):
+        flat = FlatTreeEnsemble.load(model_dir / MULTI_MODEL_NAME)
+        table = CATELookupTable.build(flat, flat.predict)
+    else:
+        table = build_lookup_table(load_pickles(model_dir))
+    table.save(
+        path,
+        version=model_dir_version(model_dir),
+        arms=[arm.name for arm in TREATMENT_ARMS],
+        source=model_checksums(model_dir),
+    )
+    return path
+
+
+if __name__ == "__main__":
+    output = export_lookup_table(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(f"CATE lookup table written to {output}")
@@ -1,26 +1,98 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import hmac
+import time
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from contextlib import asynccontextmanager
+from typing import Literal
 
 from .schemas import (
     CustomerInput,
     PredictionOutput,
     BatchInput,
     BatchOutput,
-    HealthResponse
+    ColumnarBatchInput,
+    CacheStats,
+    HealthResponse,
+    ModelsStatus,
+    ReloadRequest,
+    ReloadResponse,
+    ShadowRequest,
+    ShadowStats,
+    AllocationOutput,
+    AllocationRequest,
+    MonitorEvents,
+    MonitorIngestResponse,
+    MonitorReport
 )
-from .preprocessing import preprocess_customer, preprocess_batch
 from .models import cate_models
+from .config import settings
+from .batching import batcher
+from .executor import QueueFullError, inference
+from .scoring import (
+    BatchValidationError,
+    parse_batch,
+    parse_columns,
+    score_batch,
+    score_customer
+)
+from .bulk import (
+    CSV_TYPES,
+    PARQUET_TYPES,
+    UnsupportedFormatError,
+    frame_columns,
+    read_table,
+    scored_csv_chunks
+)
+from .preprocessing import preprocess_customer
+from .validation import ColumnValidationError
+from .artifacts import ArtifactError
+from .shadow import shadow
+from .profiler import ProfilerBusyError, profiler
+from . import metrics, registry
+from .responses import ndjson_lines
+from .allocation import allocate_batch
+from ..bayesian.monitor import monitor
+
+
+async def watch_registry(interval: float):
+    """Reload the models whenever the active registry version changes."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            version = registry.current_version()
+            if version is not None and version != cate_models.version:
+                # Load in a background thread, requests keep being served
+                await asyncio.to_thread(cate_models.reload, version)
+                print(f"CATE models reloaded: version {version}")
+        except Exception as e:
+            print(f"Warning: model reload failed: {e}")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Load models on startup."""
+    """Load models and start the inference executor on startup."""
     try:
         cate_models.load_models()
-        print("CATE models loaded successfully")
+        print(f"CATE models loaded successfully (version {cate_models.version})")
     except FileNotFoundError as e:
         print(f"Warning: {e}")
+    inference.start()
+    if settings.shadow_version:
+        try:
+            shadow.start(settings.shadow_version)
+            print(f"Shadow scoring candidate version {settings.shadow_version}")
+        except (FileNotFoundError, ValueError) as e:
+            print(f"Warning: shadow scoring disabled: {e}")
+    watcher = None
+    if settings.registry_poll_s:
+        watcher = asyncio.create_task(watch_registry(settings.registry_poll_s))
     yield
+    if watcher is not None:
+        watcher.cancel()
+    shadow.stop()
+    inference.shutdown()
 
 
 app = FastAPI(
@@ -29,6 +101,34 @@ app = FastAPI(
     version="1.0.0",
     lifespan=lifespan
 )
+app.add_middleware(metrics.MetricsMiddleware)
+
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    """Shed load when the inference queue is full."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"}
+    )
+
+
+@app.exception_handler(BatchValidationError)
+async def batch_validation_handler(request: Request, exc: BatchValidationError):
+    """Report batch body errors like FastAPI request validation errors."""
+    return JSONResponse(
+        status_code=422,
+        content={"detail": jsonable_encoder(exc.errors)}
+    )
+
+
+def require_admin(x_admin_token: str | None = Header(None)):
+    """Check the X-Admin-Token header against the CATE_ADMIN_TOKEN setting."""
+    if not settings.admin_token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (CATE_ADMIN_TOKEN not set)")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
 
 
 @app.get("/health", response_model=HealthResponse)
@@ -36,17 +136,136 @@ async def health_check():
     """Check API health and model status."""
     return HealthResponse(
         status="healthy",
-        models_loaded=cate_models.is_loaded
+        models_loaded=cate_models.is_loaded,
+        model_version=cate_models.version
+    )
+
+
+@app.get("/admin/models", response_model=ModelsStatus, dependencies=[Depends(require_admin)])
+async def models_status():
+    """Loaded model version and the versions published in the registry."""
+    return ModelsStatus(
+        version=cate_models.version,
+        backend=cate_models.backend,
+        active_version=registry.current_version(),
+        versions=registry.list_versions()
+    )
+
+
+@app.post("/admin/models/reload", response_model=ReloadResponse, dependencies=[Depends(require_admin)])
+async def reload_models(reload: ReloadRequest | None = None):
+    """
+    Load a model version in the background and swap it in atomically.
+
+    Requests in flight finish on the version they started with. With
+    activate, the version is also written to the registry CURRENT file
+    so that other workers polling the registry follow.
+    """
+    reload = reload or ReloadRequest()
+    previous = cate_models.version
+    started = time.perf_counter()
+    try:
+        bundle = await asyncio.to_thread(cate_models.reload, reload.version, reload.backend)
+        if reload.activate:
+            registry.activate(bundle.version)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except (ArtifactError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return ReloadResponse(
+        version=bundle.version,
+        previous_version=previous,
+        backend=bundle.backend,
+        load_time_s=time.perf_counter() - started
     )
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Latency, batch size, model and treatment metrics in the Prometheus text format."""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (CATE_METRICS_ENABLED is off)")
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.post(
+    "/admin/profile",
+    response_class=PlainTextResponse,
+    dependencies=[Depends(require_admin)]
+)
+async def record_profile(
+    duration_s: float = Query(10.0, gt=0, le=60, description="Recording time in seconds"),
+    interval_ms: float = Query(5.0, ge=1, le=1000, description="Time between two samples"),
+    target: Literal["all", "inference"] = Query(
+        "all",
+        description="inference keeps only the stacks under preprocess_* and CATEModels.predict*"
+    ),
+    include_idle: bool = Query(False, description="Keep stacks of threads waiting for work")
+):
+    """
+    Sample the stacks of the live server for duration_s seconds.
+
+    Returns the profile in the collapsed stack format, ready for
+    flamegraph.pl or speedscope. Requests keep being served while it
+    records; only one profile can record at a time.
+    """
+    try:
+        profile = await asyncio.to_thread(
+            profiler.record, duration_s, interval_ms, target, include_idle
+        )
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return PlainTextResponse(
+        profile["collapsed"],
+        headers={
+            "Content-Disposition": 'attachment; filename="profile.folded"',
+            "X-Profile-Samples": str(profile["samples"]),
+            "X-Profile-Stacks": str(profile["stacks"]),
+        }
+    )
+
+
+@app.get("/cache/stats", response_model=CacheStats)
+async def cache_stats():
+    """Hit, miss and eviction counters of the prediction cache."""
+    return cate_models.cache.stats()
+
+
+@app.get("/shadow/stats", response_model=ShadowStats)
+async def shadow_stats():
+    """Disagreement of the shadow candidate with production, per feature bucket."""
+    return shadow.to_dict()
+
+
+@app.post("/admin/shadow", response_model=ShadowStats, dependencies=[Depends(require_admin)])
+async def start_shadow(request: ShadowRequest):
+    """Start shadow scoring a candidate version, resetting the stats."""
+    try:
+        await asyncio.to_thread(shadow.start, request.version, request.sample_rate, request.backend)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except (ArtifactError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return shadow.to_dict()
+
+
+@app.delete("/admin/shadow", response_model=ShadowStats, dependencies=[Depends(require_admin)])
+async def stop_shadow():
+    """Stop shadow scoring, returning the final stats."""
+    await asyncio.to_thread(shadow.stop)
+    return shadow.to_dict()
+
+
 @app.post("/predict", response_model=PredictionOutput)
 async def predict_single(customer: CustomerInput):
     """
     Predict optimal email treatment for a single customer.
 
     Returns CATE estimates for Mens and Womens email campaigns,
-    along with the recommended treatment.
+    along with the recommended treatment. Concurrent calls are scored
+    together in micro-batches.
     """
     if not cate_models.is_loaded:
         raise HTTPException(
@@ -54,39 +273,110 @@ async def predict_single(customer: CustomerInput):
             detail="Models not loaded. Run notebook 03_causal_ml.ipynb first."
         )
 
-    # Preprocess input
-    X = preprocess_customer(customer.model_dump())
-
-    # Predict CATE
-    cate_mens, cate_womens = cate_models.predict(X)
-    cate_mens = float(cate_mens[0])
-    cate_womens = float(cate_womens[0])
-
-    # Determine optimal treatment
-    if cate_mens > cate_womens and cate_mens > 0:
-        optimal = "Mens E-Mail"
-        lift = cate_mens
-    elif cate_womens > cate_mens and cate_womens > 0:
-        optimal = "Womens E-Mail"
-        lift = cate_womens
-    else:
-        optimal = "No E-Mail"
-        lift = 0.0
-
-    return PredictionOutput(
-        cate_mens_email=cate_mens,
-        cate_womens_email=cate_womens,
-        optimal_treatment=optimal,
-        lift_vs_no_email=lift
+    with inference.admit():
+        if settings.micro_batching:
+            with metrics.stage("preprocess"):
+                X = preprocess_customer(customer.model_dump())
+            return await batcher.submit(X[0])
+        metrics.observe_batch("predict", 1)
+        return await inference.run(score_customer, customer.model_dump())
+
+
+def json_request_body(model) -> dict:
+    """openapi_extra documenting a JSON body parsed by hand as the given model."""
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {
+                        key: value
+                        for key, value in model.model_json_schema(
+                            ref_template="#/components/schemas/{model}"
+                        ).items()
+                        if key != "$defs"
+                    }
+                }
+            }
+        }
+    }
+
+
+ResponseFormat = Literal["objects", "columnar", "ndjson"]
+
+RESPONSE_FORMAT_QUERY = Query(
+    "objects",
+    alias="format",
+    description=(
+        "objects: list of predictions. columnar: one array per field, "
+        "optimal_treatment as codes into treatment_labels. ndjson: "
+        "predictions streamed one per line, summary on the last line."
     )
+)
+
+
+async def score_batch_request(request: Request, response_format: ResponseFormat, parse) -> Response:
+    """Score a batch body with the given parser, in the requested format."""
+    if not cate_models.is_loaded:
+        raise HTTPException(
+            status_code=503,
+            detail="Models not loaded. Run notebook 03_causal_ml.ipynb first."
+        )
 
+    body = await request.body()
+    if response_format == "ndjson":
+        with inference.admit():
+            X = await inference.run(parse, body)
+        metrics.observe_batch("batch_ndjson", len(X))
+        # Scoring happens chunk by chunk while the response streams, in a
+        # queue slot held until the last line is sent
+        lines = await inference.stream(ndjson_lines, X)
+        return StreamingResponse(lines, media_type="application/x-ndjson")
 
-@app.post("/predict/batch", response_model=BatchOutput)
-async def predict_batch(batch: BatchInput):
+    with inference.admit():
+        # Validate, score and serialize off the event loop
+        content = await inference.run_batch(score_batch, body, response_format, parse)
+        return Response(content=content, media_type="application/json")
+
+
+@app.post("/predict/batch", response_model=BatchOutput, openapi_extra=json_request_body(BatchInput))
+async def predict_batch(request: Request, response_format: ResponseFormat = RESPONSE_FORMAT_QUERY):
     """
     Predict optimal email treatment for multiple customers.
 
     Returns predictions for each customer plus summary statistics.
+    The body follows the BatchInput schema.
+    """
+    return await score_batch_request(request, response_format, parse_batch)
+
+
+@app.post(
+    "/predict/batch/columns",
+    response_model=BatchOutput,
+    openapi_extra=json_request_body(ColumnarBatchInput)
+)
+async def predict_batch_columns(request: Request, response_format: ResponseFormat = RESPONSE_FORMAT_QUERY):
+    """
+    Predict optimal email treatment for customers given as columns.
+
+    The body follows the ColumnarBatchInput schema, one array per
+    field. It is validated with vectorized checks and encoded without
+    creating an object per customer, which makes it the fastest input
+    for large batches. Errors are located as (body, field, row).
+    """
+    return await score_batch_request(request, response_format, parse_columns)
+
+
+@app.post("/allocate", response_model=AllocationOutput, openapi_extra=json_request_body(AllocationRequest))
+async def allocate_treatments(request: Request):
+    """
+    Assign treatments to customers under campaign costs and send limits.
+
+    The body follows the AllocationRequest schema: customers as columns
+    (see /predict/batch/columns), a cost and a maximum number of emails
+    per arm, and a total budget. Returns the treatment code of every
+    customer, chosen to maximize the expected incremental conversions
+    (or their net value), and the expected totals.
     """
     if not cate_models.is_loaded:
         raise HTTPException(
@@ -94,50 +384,91 @@ async def predict_batch(batch: BatchInput):
             detail="Models not loaded. Run notebook 03_causal_ml.ipynb first."
         )
 
-    # Preprocess all customers
-    customers_dict = [c.model_dump() for c in batch.customers]
-    X = preprocess_batch(customers_dict)
-
-    # Predict CATE
-    cate_mens_arr, cate_womens_arr = cate_models.predict(X)
-
-    # Build predictions
-    predictions = []
-    treatment_counts = {"Mens E-Mail": 0, "Womens E-Mail": 0, "No E-Mail": 0}
-
-    for cate_mens, cate_womens in zip(cate_mens_arr, cate_womens_arr):
-        cate_mens = float(cate_mens)
-        cate_womens = float(cate_womens)
-
-        if cate_mens > cate_womens and cate_mens > 0:
-            optimal = "Mens E-Mail"
-            lift = cate_mens
-        elif cate_womens > cate_mens and cate_womens > 0:
-            optimal = "Womens E-Mail"
-            lift = cate_womens
-        else:
-            optimal = "No E-Mail"
-            lift = 0.0
-
-        treatment_counts[optimal] += 1
-
-        predictions.append(PredictionOutput(
-            cate_mens_email=cate_mens,
-            cate_womens_email=cate_womens,
-            optimal_treatment=optimal,
-            lift_vs_no_email=lift
-        ))
-
-    # Summary
-    n = len(predictions)
-    summary = {
-        "total_customers": n,
-        "treatment_distribution": {
-            k: {"count": v, "percentage": round(v / n * 100, 1)}
-            for k, v in treatment_counts.items()
-        },
-        "avg_cate_mens": round(sum(p.cate_mens_email for p in predictions) / n, 4),
-        "avg_cate_womens": round(sum(p.cate_womens_email for p in predictions) / n, 4)
+    body = await request.body()
+    with inference.admit():
+        content = await inference.run_batch(allocate_batch, body)
+    return Response(content=content, media_type="application/json")
+
+
+@app.post("/monitor/events", response_model=MonitorIngestResponse, openapi_extra=json_request_body(MonitorEvents))
+async def ingest_monitor_events(request: Request):
+    """
+    Add a batch of live campaign events to the sequential monitor.
+
+    Only counts per group are kept, send as many events per call as
+    convenient.
+    """
+    body = await request.body()
+    ingested = await asyncio.to_thread(monitor.ingest_json, body)
+    metrics.observe_batch("monitor", ingested)
+    return {"ingested": ingested, "events": monitor.events}
+
+
+@app.get("/monitor", response_model=MonitorReport)
+async def monitor_report():
+    """P(beats control), P(best) and expected loss of every group, and whether to stop."""
+    return await asyncio.to_thread(monitor.report)
+
+
+@app.delete("/admin/monitor", response_model=MonitorReport, dependencies=[Depends(require_admin)])
+async def reset_monitor():
+    """Reset the monitor for a new campaign, returning the final report."""
+    report = await asyncio.to_thread(monitor.report)
+    monitor.reset()
+    return report
+
+
+@app.post(
+    "/predict/file",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/csv": {}}}},
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                media_type: {"schema": {"type": "string", "format": "binary"}}
+                for media_type in (CSV_TYPES[0], PARQUET_TYPES[0])
+            }
+        }
     }
+)
+async def predict_file(request: Request):
+    """
+    Score a whole customer file in the hillstrom.csv schema.
+
+    The request body is a CSV file (or Parquet/Arrow, according to the
+    Content-Type header). Rows are validated with the CustomerInput
+    constraints, and the scored file is streamed back as CSV with the
+    columns of cate_predictions_sample.csv.
+    """
+    if not cate_models.is_loaded:
+        raise HTTPException(
+            status_code=503,
+            detail="Models not loaded. Run notebook 03_causal_ml.ipynb first."
+        )
 
-    return BatchOutput(predictions=predictions, summary=summary)
+    body = await request.body()
+    with inference.admit():
+        try:
+            df = await inference.run(read_table, body, request.headers.get("content-type"))
+        except UnsupportedFormatError as e:
+            raise HTTPException(status_code=415, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Could not parse file: {e}")
+
+        try:
+            columns = await inference.run(frame_columns, df)
+        except ColumnValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors)
+    metrics.observe_batch("file", len(columns["recency"]))
+
+    bundle = cate_models.current()
+    chunks = await inference.stream(scored_csv_chunks, columns, bundle=bundle)
+    return StreamingResponse(
+        chunks,
+        media_type="text/csv",
+        headers={
+            "Content-Disposition": 'attachment; filename="cate_predictions.csv"',
+            "X-Model-Version": bundle.version
+        }
+    )
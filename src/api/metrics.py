@@ -0,0 +1,238 @@
+"""
+Prometheus metrics of the API, in the text exposition format.
+
+Metrics are recorded once per request, stage or batch, never per row,
+and every recording function returns immediately when
+CATE_METRICS_ENABLED is off. Only the API process is measured: work
+sent to the process pool shows up in the request latency but not in the
+stage histograms.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+from .config import settings
+
+# Latency buckets in seconds, from 0.1 ms to 10 s
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+# Batch size buckets in rows
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10_000, 100_000, 1_000_000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base of the metric types: a name, a help text and label names."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    """Monotonic count per label set."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    """Value per label set that can go up and down."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Cumulative histogram per label set, with sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = self.header()
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+request_seconds = Histogram(
+    "cate_request_duration_seconds", "HTTP request latency, to the end of the response body.",
+    ("method", "path", "status")
+)
+stage_seconds = Histogram(
+    "cate_stage_duration_seconds", "Time spent in each stage of scoring a request.",
+    ("stage",)
+)
+batch_rows = Histogram(
+    "cate_batch_size_rows", "Customers per scored request or micro-batch.",
+    ("endpoint",), buckets=BATCH_SIZE_BUCKETS
+)
+model_load_seconds = Histogram(
+    "cate_model_load_duration_seconds", "Time to load a model version.",
+    ("backend",), buckets=LATENCY_BUCKETS
+)
+model_info = Gauge(
+    "cate_model_info", "Loaded model version, 1 for the version being served.",
+    ("version", "backend")
+)
+treatments = Counter(
+    "cate_optimal_treatment_total", "Customers assigned to each optimal treatment.",
+    ("treatment",)
+)
+
+METRICS = [request_seconds, stage_seconds, batch_rows, model_load_seconds, model_info, treatments]
+
+
+@contextmanager
+def _timed_stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage=name)
+
+
+def stage(name: str):
+    """Context manager timing a scoring stage into cate_stage_duration_seconds."""
+    if not settings.metrics_enabled:
+        return nullcontext()
+    return _timed_stage(name)
+
+
+def observe_batch(endpoint: str, n_rows: int):
+    if settings.metrics_enabled:
+        batch_rows.observe(n_rows, endpoint=endpoint)
+
+
+def count_treatments(codes: np.ndarray, labels: list[str]):
+    """Count the optimal treatment codes of a scored batch, one bincount per call."""
+    if settings.metrics_enabled and len(codes):
+        for label, count in zip(labels, np.bincount(codes, minlength=len(labels))):
+            if count:
+                treatments.inc(int(count), treatment=label)
+
+
+def observe_model_load(version: str, backend: str, seconds: float):
+    """Record a model load and make version the one reported as served."""
+    if settings.metrics_enabled:
+        model_load_seconds.observe(seconds, backend=backend)
+        model_info.clear()
+        model_info.set(1, version=version, backend=backend)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording the latency of every HTTP request.
+
+    Requests are labelled with the path of the route that matched them,
+    and "other" when none did, so that the label set stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.metrics_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            path = getattr(route, "path", "other")
+            request_seconds.observe(
+                time.perf_counter() - started, method=scope["method"], path=path, status=status
+            )
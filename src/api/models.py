@@ -1,64 +1,383 @@
+import hashlib
+import json
+import threading
+import time
 import joblib
+import numpy as np
+from dataclasses import dataclass
 from pathlib import Path
 
+from . import metrics
+from .artifacts import MANIFEST_NAME, ArtifactError, file_sha256, read_manifest
+from .cache import PredictionCache
+from .config import settings
+from .lookup import CATELookupTable, build_lookup_table
+from .trees import FlatTreeEnsemble
+
 # Path to models directory
 MODELS_DIR = Path(__file__).parent.parent.parent / "models"
 
+# Artifact directories next to the pickles of a model directory
+FLAT_MODELS_NAME = "cate_models_flat"
+LOOKUP_TABLE_NAME = "cate_lookup"
+
+# Single artifact of a multi-treatment model, held by a model directory
+# instead of the pickles, see src/training/multi.py
+MULTI_MODEL_NAME = "cate_model_multi"
+
+# Flat artifact of both models, see trees.py and artifacts.py
+FLAT_MODELS_PATH = MODELS_DIR / FLAT_MODELS_NAME
+
+# Precomputed CATE of the discrete feature grid, see lookup.py
+LOOKUP_TABLE_PATH = MODELS_DIR / LOOKUP_TABLE_NAME
+
+BACKENDS = ("sklearn", "flat", "lookup")
+
+
+@dataclass(frozen=True)
+class TreatmentArm:
+    """An email variant scored by its own CATE model."""
+    name: str
+    label: str
+    model_file: str
+
+    @property
+    def output_field(self) -> str:
+        """Name of the CATE field in prediction outputs."""
+        return f"cate_{self.name}_email"
+
+
+# Treatment arms, in the column order of CATEModels.predict_matrix
+TREATMENT_ARMS = [
+    TreatmentArm("mens", "Mens E-Mail", "cate_model_mens.pkl"),
+    TreatmentArm("womens", "Womens E-Mail", "cate_model_womens.pkl"),
+]
+
+# Label of the control group, recommended when no arm has a positive CATE
+NO_TREATMENT = "No E-Mail"
+
+
+def load_pickles(model_dir=MODELS_DIR) -> list:
+    """Load the model of each treatment arm from the pickles in model_dir."""
+    paths = [Path(model_dir) / arm.model_file for arm in TREATMENT_ARMS]
+
+    if not all(path.exists() for path in paths):
+        expected = "".join(f"  - {path}\n" for path in paths)
+        raise FileNotFoundError(
+            f"Model files not found. Expected:\n"
+            f"{expected}"
+            f"Run notebook 03_causal_ml.ipynb to generate them."
+        )
+
+    return [joblib.load(path) for path in paths]
+
+
+def pickle_checksums(model_dir=MODELS_DIR) -> dict:
+    """SHA-256 of the pickle of each treatment arm in model_dir."""
+    return {
+        arm.model_file: file_sha256(Path(model_dir) / arm.model_file)
+        for arm in TREATMENT_ARMS
+    }
+
+
+def has_multi_model(model_dir=MODELS_DIR) -> bool:
+    """Whether model_dir holds a multi-treatment model instead of pickles."""
+    return (Path(model_dir) / MULTI_MODEL_NAME / MANIFEST_NAME).exists()
+
+
+def model_checksums(model_dir=MODELS_DIR) -> dict:
+    """
+    Identity of the models of model_dir, the source of derived artifacts.
+
+    The pickle checksums, or the content hash of the multi-treatment
+    model for directories that hold one.
+    """
+    if has_multi_model(model_dir):
+        return {MULTI_MODEL_NAME: read_manifest(Path(model_dir) / MULTI_MODEL_NAME)["version"]}
+    return pickle_checksums(model_dir)
+
+
+def model_dir_version(model_dir=MODELS_DIR) -> str:
+    """Version label of the models in model_dir, a hash of their contents."""
+    if has_multi_model(model_dir):
+        return model_checksums(model_dir)[MULTI_MODEL_NAME]
+    checksums = json.dumps(pickle_checksums(model_dir), sort_keys=True)
+    return hashlib.sha256(checksums.encode()).hexdigest()[:12]
+
+
+def check_arms(manifest: dict):
+    """
+    Refuse artifacts exported for other treatment arms.
+
+    Raises:
+        ArtifactError: if the manifest arms differ from TREATMENT_ARMS
+    """
+    expected = [arm.name for arm in TREATMENT_ARMS]
+    if manifest.get("arms") != expected:
+        raise ArtifactError(
+            f"Artifact was exported for arms {manifest.get('arms')}, expected {expected}"
+        )
+
+
+def _load_current_artifact(path: Path, loader, checksums: dict):
+    """
+    Load an artifact if it was exported from the given pickles.
+
+    Returns:
+        The loaded object, or None if there is no artifact or it was
+        exported from other pickles
+    """
+    if not (path / MANIFEST_NAME).exists():
+        return None
+    artifact = loader(path)
+    check_arms(artifact.manifest)
+    source = artifact.manifest.get("source")
+    if source is not None and source != checksums:
+        return None
+    return artifact
+
+
+@dataclass(frozen=True)
+class ModelBundle:
+    """
+    One immutable version of the CATE models, ready to score.
+
+    Requests hold on to the bundle they started with, so swapping in a
+    new bundle never changes the models under a running request.
+
+    Attributes:
+        version: Version label of the models
+        backend: Scoring backend, one of BACKENDS
+        arm_models: Fitted GradientBoostingRegressor per arm, if loaded
+        flat_models: FlatTreeEnsemble for the flat backend, and of
+            multi-treatment models
+        lookup_table: CATELookupTable for the lookup backend
+    """
+    version: str
+    backend: str
+    arm_models: list | None = None
+    flat_models: FlatTreeEnsemble | None = None
+    lookup_table: CATELookupTable | None = None
+
+    @classmethod
+    def load(cls, model_dir=MODELS_DIR, backend: str | None = None, version: str | None = None) -> "ModelBundle":
+        """
+        Load the models of a model directory for the given backend.
+
+        Args:
+            model_dir: Directory with the pickles, and optionally their
+                flat and lookup artifacts
+            backend: "sklearn" to score with the pickled models, "flat"
+                to use the flattened tree arrays, or "lookup" to read
+                the precomputed grid (the pickled models score rows off
+                the grid). Defaults to the CATE_BACKEND setting.
+            version: Version label, defaults to a hash of the pickles
+
+        A multi-treatment model only exists as trees: the sklearn
+        backend serves it with the flat one, and the lookup backend
+        scores rows off the grid with the trees.
+
+        Returns:
+            ModelBundle
+        """
+        model_dir = Path(model_dir)
+        backend = backend or settings.backend
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+
+        if has_multi_model(model_dir):
+            return cls._load_multi(model_dir, backend, version)
+
+        checksums = pickle_checksums(model_dir) if all(
+            (model_dir / arm.model_file).exists() for arm in TREATMENT_ARMS
+        ) else None
+        if version is None:
+            version = model_dir_version(model_dir)
+
+        if backend == "flat":
+            flat_models = _load_current_artifact(
+                model_dir / FLAT_MODELS_NAME, FlatTreeEnsemble.load, checksums
+            )
+            if flat_models is None:
+                flat_models = FlatTreeEnsemble.from_gradient_boosting(load_pickles(model_dir))
+            return cls(version, backend, flat_models=flat_models)
+
+        arm_models = load_pickles(model_dir)
+        if backend == "lookup":
+            lookup_table = _load_current_artifact(
+                model_dir / LOOKUP_TABLE_NAME, CATELookupTable.load, checksums
+            )
+            if lookup_table is None:
+                lookup_table = build_lookup_table(arm_models)
+            return cls(version, backend, arm_models=arm_models, lookup_table=lookup_table)
+
+        return cls(version, backend, arm_models=arm_models)
+
+    @classmethod
+    def _load_multi(cls, model_dir: Path, backend: str, version: str | None) -> "ModelBundle":
+        flat_models = FlatTreeEnsemble.load(model_dir / MULTI_MODEL_NAME)
+        check_arms(flat_models.manifest)
+        version = version or flat_models.manifest["version"]
+        if backend == "lookup":
+            lookup_table = _load_current_artifact(
+                model_dir / LOOKUP_TABLE_NAME, CATELookupTable.load, model_checksums(model_dir)
+            )
+            if lookup_table is None:
+                lookup_table = CATELookupTable.build(flat_models, flat_models.predict)
+            return cls(version, backend, flat_models=flat_models, lookup_table=lookup_table)
+        return cls(version, "flat", flat_models=flat_models)
+
+    def predict_matrix(self, X) -> np.ndarray:
+        """CATE of every arm, shape (n_samples, n_arms), without caching."""
+        if self.backend == "flat":
+            return self.flat_models.predict(X)
+        if self.backend == "lookup":
+            fallback = self._predict_sklearn if self.arm_models is not None else self.flat_models.predict
+            return self.lookup_table.predict(X, fallback)
+        return self._predict_sklearn(X)
+
+    def _predict_sklearn(self, X) -> np.ndarray:
+        return np.column_stack([model.predict(X) for model in self.arm_models])
+
 
 class CATEModels:
-    """Singleton class to load and hold CATE models."""
+    """
+    Singleton holding the current ModelBundle.
+
+    Reloading builds a new bundle next to the current one and then swaps
+    it in with a single assignment, so requests in flight finish on the
+    version they started with.
+    """
 
     _instance = None
-    _models_loaded = False
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
-            cls._instance.cate_model_mens = None
-            cls._instance.cate_model_womens = None
+            cls._instance.bundle = None
+            cls._instance.cache = PredictionCache(
+                settings.cache_size, settings.cache_history_step
+            )
+            cls._instance._reload_lock = threading.Lock()
         return cls._instance
 
-    def load_models(self):
-        """Load models from pickle files."""
-        if self._models_loaded:
-            return
+    @staticmethod
+    def load_pickles(model_dir=MODELS_DIR) -> list:
+        """Load the model of each treatment arm from pickle files."""
+        return load_pickles(model_dir)
 
-        mens_path = MODELS_DIR / "cate_model_mens.pkl"
-        womens_path = MODELS_DIR / "cate_model_womens.pkl"
+    def load_models(self, backend: str | None = None):
+        """
+        Load the current models once, see `reload`.
 
-        if not mens_path.exists() or not womens_path.exists():
-            raise FileNotFoundError(
-                f"Model files not found. Expected:\n"
-                f"  - {mens_path}\n"
-                f"  - {womens_path}\n"
-                f"Run notebook 03_causal_ml.ipynb to generate them."
-            )
+        Args:
+            backend: Scoring backend, see ModelBundle.load
+        """
+        if self.bundle is None:
+            self.reload(backend=backend)
+
+    def reload(self, version: str | None = None, backend: str | None = None) -> ModelBundle:
+        """
+        Load a model version and make it current.
+
+        Args:
+            version: Version to load, defaults to the active registry
+                version, or the pickles in models/ without a registry
+            backend: Scoring backend, defaults to the current one
+
+        Returns:
+            The new current ModelBundle
+
+        Raises:
+            FileNotFoundError: if the version does not exist
+        """
+        from .registry import resolve_version
+
+        with self._reload_lock:
+            started = time.perf_counter()
+            model_dir, version = resolve_version(version)
+            if backend is None and self.bundle is not None:
+                backend = self.bundle.backend
+            bundle = ModelBundle.load(model_dir, backend, version)
 
-        self.cate_model_mens = joblib.load(mens_path)
-        self.cate_model_womens = joblib.load(womens_path)
-        self._models_loaded = True
+            self.bundle = bundle
+            # Cached predictions came from the previous models
+            self.cache.clear()
+            metrics.observe_model_load(bundle.version, bundle.backend, time.perf_counter() - started)
+            return bundle
+
+    def ensure_version(self, version: str):
+        """Reload if the current bundle is not the given version."""
+        bundle = self.bundle
+        if bundle is None or bundle.version != version:
+            self.reload(version)
+
+    def current(self) -> ModelBundle:
+        """The current bundle, loading the models if needed."""
+        if self.bundle is None:
+            self.load_models()
+        return self.bundle
 
     @property
     def is_loaded(self) -> bool:
-        return self._models_loaded
+        return self.bundle is not None
 
-    def predict(self, X):
+    @property
+    def version(self) -> str | None:
+        bundle = self.bundle
+        return bundle.version if bundle is not None else None
+
+    @property
+    def backend(self) -> str | None:
+        bundle = self.bundle
+        return bundle.backend if bundle is not None else None
+
+    @property
+    def arms(self) -> list[TreatmentArm]:
+        return TREATMENT_ARMS
+
+    @property
+    def treatment_labels(self) -> list[str]:
+        """Label of each treatment code, the last one being no email."""
+        return [arm.label for arm in TREATMENT_ARMS] + [NO_TREATMENT]
+
+    def predict_matrix(self, X, bundle: ModelBundle | None = None) -> np.ndarray:
         """
-        Predict CATE for both treatments.
+        Predict CATE for every treatment arm.
+
+        With the flat backend all arms are scored in a single pass
+        over X. Batches of up to cache_max_rows rows go through the
+        prediction cache.
 
         Args:
             X: Feature array of shape (n_samples, 12)
+            bundle: Models to use, defaults to the current bundle. Pass
+                the same bundle to score several parts of one request.
 
         Returns:
-            Tuple of (cate_mens, cate_womens) arrays
+            CATE array of shape (n_samples, n_arms), columns ordered as
+            TREATMENT_ARMS
         """
-        if not self._models_loaded:
-            self.load_models()
+        bundle = bundle or self.current()
+
+        if len(X) == 0:
+            return np.empty((0, len(TREATMENT_ARMS)))
 
-        cate_mens = self.cate_model_mens.predict(X)
-        cate_womens = self.cate_model_womens.predict(X)
+        if self.cache.enabled and len(X) <= settings.cache_max_rows:
+            return self.cache.predict(X, bundle.predict_matrix, bundle.version)
+        return bundle.predict_matrix(X)
+
+    def predict(self, X):
+        """
+        Predict CATE for each treatment.
 
-        return cate_mens, cate_womens
+        Args:
+            X: Feature array of shape (n_samples, 12)
+
+        Returns:
+            Tuple with one CATE array per arm, i.e. (cate_mens, cate_womens)
+        """
+        return tuple(self.predict_matrix(X).T)
 
 
 # Global instance
@@ -0,0 +1,52 @@
+"""Vectorized treatment decisions on CATE matrices."""
+import numpy as np
+
+
+def optimal_treatment(cate: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Pick the treatment with the highest positive CATE for each customer.
+
+    An arm is recommended only if its CATE is positive and strictly
+    greater than every other arm; otherwise (including ties) no email
+    is sent.
+
+    Args:
+        cate: CATE matrix of shape (n_samples, n_arms)
+
+    Returns:
+        Tuple of (codes, lift). codes holds the recommended arm index,
+        or n_arms for no email. lift is the CATE of the recommended
+        arm, 0 for no email.
+    """
+    n_samples, n_arms = cate.shape
+    best = cate.argmax(axis=1)
+    top = cate[np.arange(n_samples), best]
+
+    if n_arms > 1:
+        second = np.partition(cate, n_arms - 2, axis=1)[:, n_arms - 2]
+    else:
+        second = np.full(n_samples, -np.inf)
+
+    treat = (top > 0) & (top > second)
+    codes = np.where(treat, best, n_arms)
+    lift = np.where(treat, top, 0.0)
+    return codes, lift
+
+
+def treatment_distribution(counts: np.ndarray, labels: list[str]) -> dict:
+    """
+    Count and percentage of customers assigned to each treatment.
+
+    Args:
+        counts: Number of customers per treatment code, e.g.
+            np.bincount of the codes returned by `optimal_treatment`
+        labels: Treatment label of each code
+
+    Returns:
+        Dictionary mapping each label to its count and percentage
+    """
+    n = max(int(counts.sum()), 1)
+    return {
+        label: {"count": int(count), "percentage": round(int(count) / n * 100, 1)}
+        for label, count in zip(labels, counts)
+    }
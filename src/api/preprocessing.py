@@ -1,3 +1,5 @@
+from itertools import repeat
+
 import numpy as np
 
 # History segment ordinal mapping
@@ -19,6 +21,16 @@ FEATURE_NAMES = [
     'channel_Multichannel', 'channel_Phone', 'channel_Web'
 ]
 
+# Raw input columns, in the order of CustomerInput
+INPUT_COLUMNS = [
+    'recency', 'history', 'history_segment',
+    'mens', 'womens', 'newbie', 'zip_code', 'channel'
+]
+
+# Categories of the one-hot encoded columns, in FEATURE_NAMES order
+ZIP_CODES = ['Rural', 'Suburban', 'Urban']
+CHANNELS = ['Multichannel', 'Phone', 'Web']
+
 
 def preprocess_customer(customer: dict) -> np.ndarray:
     """
@@ -67,4 +79,75 @@ def preprocess_batch(customers: list[dict]) -> np.ndarray:
     Returns:
         numpy array of shape (n_customers, 12)
     """
-    return np.vstack([preprocess_customer(c) for c in customers])
+    columns = {
+        name: [c[name] for c in customers] for name in INPUT_COLUMNS
+    }
+    return preprocess_columns(columns)
+
+
+def _category_codes(values, categories: list[str]) -> np.ndarray:
+    """
+    Map an array of labels to their index in `categories`.
+
+    Labels not found in `categories` get code -1.
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'US':
+        # Fixed-width string arrays (e.g. from pandas): one compare per category
+        codes = np.full(len(values), -1, dtype=np.intp)
+        for code, label in enumerate(categories):
+            codes[values == label] = code
+        return codes
+
+    # Python strings: a single dict lookup per label beats building a
+    # fixed-width numpy string array first
+    lookup = {label: code for code, label in enumerate(categories)}
+    return np.fromiter(
+        map(lookup.get, values, repeat(-1)), dtype=np.intp, count=len(values)
+    )
+
+
+def preprocess_columns(columns: dict) -> np.ndarray:
+    """
+    Convert a batch given as column arrays to feature array.
+
+    Produces the same encoding as `preprocess_customer`, but fills a
+    single preallocated array with vectorized operations instead of
+    encoding one customer at a time.
+
+    Args:
+        columns: Mapping of each name in INPUT_COLUMNS to an array-like
+            of length n_customers
+
+    Returns:
+        numpy array of shape (n_customers, 12)
+    """
+    n = len(columns['recency'])
+    features = np.zeros((n, len(FEATURE_NAMES)))
+    if n == 0:
+        return features
+
+    # Numeric and binary features
+    features[:, 0] = columns['recency']
+    features[:, 1] = columns['history']
+    features[:, 3] = columns['mens']
+    features[:, 4] = columns['womens']
+    features[:, 5] = columns['newbie']
+
+    # Ordinal history segment, unknown segments default to 1
+    segment_codes = _category_codes(
+        columns['history_segment'], list(HISTORY_SEGMENT_MAP)
+    )
+    segment_values = np.array(list(HISTORY_SEGMENT_MAP.values()), dtype=float)
+    features[:, 2] = np.where(segment_codes >= 0, segment_values[segment_codes], 1)
+
+    # One-hot encode zip_code and channel, unknown labels stay all-zero
+    rows = np.arange(n)
+    for offset, column, categories in (
+        (6, 'zip_code', ZIP_CODES),
+        (9, 'channel', CHANNELS),
+    ):
+        codes = _category_codes(columns[column], categories)
+        known = codes >= 0
+        features[rows[known], offset + codes[known]] = 1
+
+    return features
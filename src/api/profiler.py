@@ -0,0 +1,151 @@
+"""
+On-demand sampling profiler of the API process.
+
+While a profile is recording, a daemon thread wakes up every interval,
+reads the stack of every other thread with sys._current_frames() and
+counts identical stacks. Nothing runs between profiles. The result is in
+the collapsed stack format ("frame;frame;frame count" per line) read by
+flamegraph.pl, speedscope and most flame graph viewers.
+"""
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+# Functions of the inference path, as (file name, qualified name prefix)
+INFERENCE_FRAMES = (
+    ("preprocessing.py", "preprocess_"),
+    ("models.py", "CATEModels.predict"),
+)
+
+# Frames where a thread waits for work, dropped unless idle stacks are kept
+IDLE_FRAMES = {
+    ("threading.py", "Condition.wait"),
+    ("threading.py", "Thread._wait_for_tstate_lock"),
+    ("selectors.py", "EpollSelector.select"),
+    ("selectors.py", "PollSelector.select"),
+    ("selectors.py", "SelectSelector.select"),
+    ("selectors.py", "KqueueSelector.select"),
+    ("queue.py", "Queue.get"),
+    ("queue.py", "SimpleQueue.get"),
+    ("thread.py", "_worker"),
+}
+
+TARGETS = ("all", "inference")
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when a profile is requested while another one is recording."""
+
+
+def _frame_key(code) -> tuple[str, str]:
+    return Path(code.co_filename).name, getattr(code, "co_qualname", code.co_name)
+
+
+def _frame_label(code) -> str:
+    filename, qualname = _frame_key(code)
+    return f"{qualname} ({filename}:{code.co_firstlineno})"
+
+
+def _is_inference(code) -> bool:
+    filename, qualname = _frame_key(code)
+    return any(
+        filename == target_file and qualname.startswith(prefix)
+        for target_file, prefix in INFERENCE_FRAMES
+    )
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads for a bounded time.
+
+    Attributes:
+        running: Whether a profile is being recorded
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.running = False
+
+    def record(
+        self,
+        duration_s: float,
+        interval_ms: float = 5.0,
+        target: str = "all",
+        include_idle: bool = False
+    ) -> dict:
+        """
+        Record a profile, blocking for duration_s.
+
+        Args:
+            duration_s: Recording time in seconds
+            interval_ms: Time between two samples
+            target: "all" for every stack, or "inference" for the stacks
+                under preprocess_* and CATEModels.predict*, rooted at
+                their outermost matching frame
+            include_idle: Keep stacks of threads waiting for work
+
+        Returns:
+            Dict with the collapsed stacks and sampling counters
+
+        Raises:
+            ProfilerBusyError: if a profile is already recording
+        """
+        if target not in TARGETS:
+            raise ValueError(f"Unknown target {target!r}, expected one of {TARGETS}")
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("A profile is already being recorded")
+
+        try:
+            self.running = True
+            stacks = Counter()
+            samples = 0
+            me = threading.get_ident()
+            interval = interval_ms / 1000
+            started = time.perf_counter()
+            deadline = started + duration_s
+
+            while time.perf_counter() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == me:
+                        continue
+                    stack = self._collapse(frame, target, include_idle)
+                    if stack:
+                        stacks[stack] += 1
+                samples += 1
+                time.sleep(interval)
+
+            return {
+                "collapsed": "".join(
+                    f"{stack} {count}\n" for stack, count in stacks.most_common()
+                ),
+                "samples": samples,
+                "stacks": sum(stacks.values()),
+                "duration_s": time.perf_counter() - started,
+            }
+        finally:
+            self.running = False
+            self._lock.release()
+
+    @staticmethod
+    def _collapse(frame, target: str, include_idle: bool) -> str | None:
+        """Collapsed stack of a frame, root first, or None to drop it."""
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        codes.reverse()
+
+        if not include_idle and _frame_key(codes[-1]) in IDLE_FRAMES:
+            return None
+        if target == "inference":
+            root = next((i for i, code in enumerate(codes) if _is_inference(code)), None)
+            if root is None:
+                return None
+            codes = codes[root:]
+        return ";".join(_frame_label(code) for code in codes)
+
+
+# Global instance
+profiler = SamplingProfiler()
@@ -0,0 +1,212 @@
+"""
+Versioned registry of CATE models.
+
+Each version is an immutable directory under models/registry holding the
+pickles of every treatment arm and, optionally, their flat and lookup
+artifacts, or a multi-treatment model artifact in place of the pickles.
+The file CURRENT names the active version. Without a registry, the
+pickles in models/ are served, versioned by their hash.
+
+Usage:
+    python -m src.api.registry list
+    python -m src.api.registry publish [--source models/] [--version v2] [--activate] [--lookup]
+    python -m src.api.registry activate VERSION
+"""
+import argparse
+import os
+import re
+import shutil
+from pathlib import Path
+
+from .config import settings
+from .models import (
+    FLAT_MODELS_NAME,
+    LOOKUP_TABLE_NAME,
+    MODELS_DIR,
+    MULTI_MODEL_NAME,
+    TREATMENT_ARMS,
+    has_multi_model,
+    model_dir_version
+)
+
+# Version labels double as directory names
+VERSION_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$")
+
+CURRENT_NAME = "CURRENT"
+
+
+def registry_dir() -> Path:
+    """Root of the registry, the CATE_REGISTRY_DIR setting or models/registry."""
+    return Path(settings.registry_dir) if settings.registry_dir else MODELS_DIR / "registry"
+
+
+def check_version(version: str):
+    """
+    Raises:
+        ValueError: if version is not a valid version label
+    """
+    if not VERSION_PATTERN.match(version):
+        raise ValueError(
+            f"Invalid version {version!r}: use letters, digits, '.', '_' and '-'"
+        )
+
+
+def version_dir(version: str) -> Path:
+    """
+    Directory of a published version.
+
+    Raises:
+        ValueError: if version is not a valid version label
+        FileNotFoundError: if the version is not published
+    """
+    check_version(version)
+    path = registry_dir() / version
+    if not path.is_dir():
+        raise FileNotFoundError(f"Model version {version!r} is not in the registry")
+    return path
+
+
+def list_versions() -> list[str]:
+    """Published versions, oldest first."""
+    root = registry_dir()
+    if not root.is_dir():
+        return []
+    paths = [
+        path for path in root.iterdir()
+        if path.is_dir() and VERSION_PATTERN.match(path.name)
+    ]
+    return [path.name for path in sorted(paths, key=lambda path: path.stat().st_mtime)]
+
+
+def current_version() -> str | None:
+    """The active version, or None without a registry."""
+    path = registry_dir() / CURRENT_NAME
+    if not path.exists():
+        return None
+    return path.read_text().strip() or None
+
+
+def resolve_version(version: str | None = None) -> tuple[Path, str]:
+    """
+    Find the model directory of a version.
+
+    Args:
+        version: Version to find, defaults to the active version
+
+    Returns:
+        Tuple of (model directory, version)
+    """
+    if version is None:
+        version = current_version()
+        if version is None:
+            return MODELS_DIR, model_dir_version(MODELS_DIR)
+
+    try:
+        return version_dir(version), version
+    except FileNotFoundError:
+        # The unregistered pickles in models/ are addressed by their hash
+        if version == model_dir_version(MODELS_DIR):
+            return MODELS_DIR, version
+        raise
+
+
+def activate(version: str):
+    """Make version the active version, atomically replacing CURRENT."""
+    version_dir(version)
+    root = registry_dir()
+    tmp = root / f".{CURRENT_NAME}.{os.getpid()}"
+    tmp.write_text(version + "\n")
+    os.replace(tmp, root / CURRENT_NAME)
+
+
+def publish(
+    source_dir=MODELS_DIR,
+    version: str | None = None,
+    make_active: bool = False,
+    export_lookup: bool = False
+) -> str:
+    """
+    Copy the pickles of source_dir into a new registry version.
+
+    The flat artifact of the pickles is always exported, the lookup
+    table on request (it takes about 20 s to build). The version
+    directory is assembled under a temporary name and renamed, so it
+    never appears half written.
+
+    Args:
+        source_dir: Directory with the pickles of every arm, or with a
+            multi-treatment model
+        version: Version label, defaults to a hash of the pickles
+        make_active: Also make it the active version
+        export_lookup: Also build the lookup table
+
+    Returns:
+        The published version
+
+    Raises:
+        FileExistsError: if the version is already published
+    """
+    from .lookup import export_lookup_table
+    from .trees import export_flat_models
+
+    source_dir = Path(source_dir)
+    version = version or model_dir_version(source_dir)
+    check_version(version)
+
+    root = registry_dir()
+    target = root / version
+    if target.exists():
+        raise FileExistsError(f"Model version {version!r} is already published")
+
+    tmp = root / f".{version}.{os.getpid()}.tmp"
+    tmp.mkdir(parents=True)
+    try:
+        if has_multi_model(source_dir):
+            shutil.copytree(source_dir / MULTI_MODEL_NAME, tmp / MULTI_MODEL_NAME)
+        else:
+            for arm in TREATMENT_ARMS:
+                shutil.copy2(source_dir / arm.model_file, tmp / arm.model_file)
+            export_flat_models(tmp / FLAT_MODELS_NAME, model_dir=tmp)
+        if export_lookup:
+            export_lookup_table(tmp / LOOKUP_TABLE_NAME, model_dir=tmp)
+        os.rename(tmp, target)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    if make_active:
+        activate(version)
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the CATE model registry.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="List published versions")
+
+    publish_parser = commands.add_parser("publish", help="Publish the pickles of a directory")
+    publish_parser.add_argument("--source", default=str(MODELS_DIR), help="Directory with the pickles")
+    publish_parser.add_argument("--version", default=None, help="Version label (default: content hash)")
+    publish_parser.add_argument("--activate", action="store_true", help="Make it the active version")
+    publish_parser.add_argument("--lookup", action="store_true", help="Also build the lookup table")
+
+    activate_parser = commands.add_parser("activate", help="Make a version active")
+    activate_parser.add_argument("version")
+
+    args = parser.parse_args()
+
+    if args.command == "list":
+        active = current_version()
+        for version in list_versions():
+            print(f"{'*' if version == active else ' '} {version}")
+    elif args.command == "publish":
+        version = publish(args.source, args.version, args.activate, args.lookup)
+        print(f"Published model version {version}" + (" (active)" if args.activate else ""))
+    else:
+        activate(args.version)
+        print(f"Active model version: {args.version}")
+
+
+if __name__ == "__main__":
+    main()
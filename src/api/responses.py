@@ -0,0 +1,132 @@
+"""
+Serialization of scored batches.
+
+Besides the default list of prediction objects, batches can be returned
+as parallel arrays (columnar) or streamed as newline-delimited JSON, both
+serialized straight from the NumPy results without pydantic models.
+"""
+import json
+from collections.abc import Iterator
+
+import numpy as np
+from . import metrics
+from .models import ModelBundle, cate_models
+from .policy import optimal_treatment, treatment_distribution
+from .shadow import shadow
+
+RESPONSE_FORMATS = ("objects", "columnar", "ndjson")
+
+# Rows scored per chunk when streaming NDJSON
+NDJSON_CHUNK_SIZE = 1000
+
+
+def prediction_records(cate: np.ndarray, codes: np.ndarray, lift: np.ndarray) -> list[dict]:
+    """Build one prediction dict per customer from the scored arrays."""
+    fields = [arm.output_field for arm in cate_models.arms]
+    labels = cate_models.treatment_labels
+
+    columns = [cate[:, j].tolist() for j in range(cate.shape[1])]
+    optimal = [labels[code] for code in codes.tolist()]
+
+    return [
+        {
+            **dict(zip(fields, row_cate)),
+            "optimal_treatment": row_optimal,
+            "lift_vs_no_email": row_lift,
+        }
+        for *row_cate, row_optimal, row_lift in zip(*columns, optimal, lift.tolist())
+    ]
+
+
+def batch_summary(counts: np.ndarray, cate_sums: np.ndarray) -> dict:
+    """
+    Summary statistics of a scored batch.
+
+    Args:
+        counts: Number of customers assigned to each treatment code
+        cate_sums: Sum of the CATE of each arm over the batch
+
+    Returns:
+        Dictionary with total, treatment distribution and average CATE
+    """
+    n = int(counts.sum())
+    return {
+        "total_customers": n,
+        "treatment_distribution": treatment_distribution(
+            counts, cate_models.treatment_labels
+        ),
+        **{
+            f"avg_cate_{arm.name}": round(float(cate_sums[j]) / n, 4) if n else 0.0
+            for j, arm in enumerate(cate_models.arms)
+        }
+    }
+
+
+def summarize(cate: np.ndarray, codes: np.ndarray) -> dict:
+    """Summary statistics from the CATE matrix and treatment codes."""
+    counts = np.bincount(codes, minlength=len(cate_models.treatment_labels))
+    return batch_summary(counts, cate.sum(axis=0))
+
+
+def columnar_content(
+    cate: np.ndarray,
+    codes: np.ndarray,
+    lift: np.ndarray,
+    model_version: str | None = None
+) -> dict:
+    """
+    A scored batch as parallel arrays.
+
+    optimal_treatment holds treatment codes, decoded with the
+    treatment_labels lookup.
+    """
+    return {
+        **{
+            arm.output_field: cate[:, j].tolist()
+            for j, arm in enumerate(cate_models.arms)
+        },
+        "optimal_treatment": codes.tolist(),
+        "lift_vs_no_email": lift.tolist(),
+        "treatment_labels": cate_models.treatment_labels,
+        "summary": summarize(cate, codes),
+        "model_version": model_version,
+    }
+
+
+def ndjson_lines(
+    X: np.ndarray,
+    chunk_size: int = NDJSON_CHUNK_SIZE,
+    bundle: ModelBundle | None = None
+) -> Iterator[str]:
+    """
+    Score X chunk by chunk and yield one JSON prediction per line.
+
+    Each chunk is sent as soon as it is scored, all with the same
+    models. The last line holds the batch summary under a "summary"
+    key and the model version under "model_version".
+    """
+    bundle = bundle or cate_models.current()
+    n_labels = len(cate_models.treatment_labels)
+    counts = np.zeros(n_labels, dtype=np.int64)
+    cate_sums = np.zeros(len(cate_models.arms))
+
+    for start in range(0, len(X), chunk_size):
+        chunk = X[start:start + chunk_size]
+        with metrics.stage("predict"):
+            cate = cate_models.predict_matrix(chunk, bundle)
+        shadow.submit(chunk, cate, bundle.version)
+        with metrics.stage("decide"):
+            codes, lift = optimal_treatment(cate)
+        metrics.count_treatments(codes, cate_models.treatment_labels)
+        counts += np.bincount(codes, minlength=n_labels)
+        cate_sums += cate.sum(axis=0)
+
+        with metrics.stage("serialize"):
+            records = prediction_records(cate, codes, lift)
+            lines = "".join(json.dumps(record) + "\n" for record in records)
+        yield lines
+
+    yield json.dumps({
+        "summary": batch_summary(counts, cate_sums),
+        "model_version": bundle.version,
+    }) + "\n"
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Literal
+from typing import Annotated, Literal
 
 
 class CustomerInput(BaseModel):
@@ -37,6 +37,10 @@ class PredictionOutput(BaseModel):
     cate_womens_email: float = Field(..., description="CATE for Womens E-Mail treatment")
     optimal_treatment: str = Field(..., description="Recommended treatment")
     lift_vs_no_email: float = Field(..., description="Expected conversion lift vs no email")
+    model_version: str | None = Field(None, description="Version of the models that scored this prediction")
+
+    # Additional treatment arms are returned as extra cate_<name>_email fields
+    model_config = {"extra": "allow", "protected_namespaces": ()}
 
 
 class BatchInput(BaseModel):
@@ -44,13 +48,190 @@ class BatchInput(BaseModel):
     customers: list[CustomerInput] = Field(..., description="List of customers")
 
 
+class ColumnarBatchInput(BaseModel):
+    """
+    Input schema for batch predictions given as one array per field.
+
+    Row i of the batch is made of the i-th element of every array, with
+    the CustomerInput constraints. The body is checked column by column
+    (see validation.py) rather than through this model.
+    """
+    recency: list[int] = Field(..., description="Months since last purchase (1-12)")
+    history: list[float] = Field(..., description="Total amount spent historically (>= 0)")
+    history_segment: list[str] = Field(..., description="History segment category")
+    mens: list[Literal[0, 1]] = Field(..., description="Has purchased mens products (0 or 1)")
+    womens: list[Literal[0, 1]] = Field(..., description="Has purchased womens products (0 or 1)")
+    newbie: list[Literal[0, 1]] = Field(..., description="Is a new customer (0 or 1)")
+    zip_code: list[Literal["Rural", "Suburban", "Urban"]] = Field(..., description="Customer zip code type")
+    channel: list[Literal["Web", "Phone", "Multichannel"]] = Field(..., description="Purchase channel")
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "recency": [5, 10],
+                    "history": [200.0, 29.99],
+                    "history_segment": ["3) $200 - $350", "1) $0 - $100"],
+                    "mens": [1, 0],
+                    "womens": [0, 1],
+                    "newbie": [0, 1],
+                    "zip_code": ["Urban", "Rural"],
+                    "channel": ["Web", "Phone"]
+                }
+            ]
+        }
+    }
+
+
 class BatchOutput(BaseModel):
     """Output schema for batch predictions."""
     predictions: list[PredictionOutput] = Field(..., description="List of predictions")
     summary: dict = Field(..., description="Summary statistics")
+    model_version: str | None = Field(None, description="Version of the models that scored the batch")
+
+    model_config = {"protected_namespaces": ()}
 
 
 class HealthResponse(BaseModel):
     """Health check response."""
     status: str
     models_loaded: bool
+    model_version: str | None = None
+
+    model_config = {"protected_namespaces": ()}
+
+
+class CacheStats(BaseModel):
+    """Prediction cache counters."""
+    enabled: bool
+    size: int = Field(..., description="Cached feature vectors")
+    max_size: int
+    history_step: float = Field(..., description="Rounding step of history in cache keys, 0 if exact")
+    hits: int
+    misses: int
+    evictions: int
+    hit_rate: float
+
+
+class ReloadRequest(BaseModel):
+    """Admin request to load a model version."""
+    version: str | None = Field(None, description="Registry version, defaults to the active one")
+    backend: Literal["sklearn", "flat", "lookup"] | None = Field(None, description="Scoring backend, defaults to the current one")
+    activate: bool = Field(False, description="Also make it the active registry version, for other workers to pick up")
+
+
+class ReloadResponse(BaseModel):
+    """Result of a model reload."""
+    version: str
+    previous_version: str | None
+    backend: str
+    load_time_s: float
+
+
+class ModelsStatus(BaseModel):
+    """Loaded model version and registry contents."""
+    version: str | None
+    backend: str | None
+    active_version: str | None = Field(..., description="Version named by the registry CURRENT file")
+    versions: list[str] = Field(..., description="Published registry versions, oldest first")
+
+
+class ShadowRequest(BaseModel):
+    """Admin request to start shadow scoring a candidate version."""
+    version: str = Field(..., description="Registry version of the candidate")
+    sample_rate: float | None = Field(None, gt=0, le=1, description="Fraction of scored rows to shadow")
+    backend: Literal["sklearn", "flat", "lookup"] | None = Field(None, description="Scoring backend of the candidate")
+
+
+class ShadowStats(BaseModel):
+    """Disagreement between the candidate and production models."""
+    active: bool
+    candidate_version: str | None
+    production_versions: list[str]
+    sample_rate: float
+    sampled_rows: int = Field(..., description="Rows queued for shadow scoring")
+    dropped_rows: int = Field(..., description="Rows dropped because the shadow queue was full")
+    scored_rows: int
+    pending_batches: int
+    busy_s: float = Field(..., description="Time spent scoring in the shadow thread")
+    overall: dict | None = Field(..., description="CATE deltas (candidate - production) and flips over all rows")
+    flips: dict[str, int] = Field(..., description="Rows per production -> candidate treatment change")
+    buckets: dict[str, dict[str, dict]] = Field(..., description="The overall stats per bucket of each input feature")
+
+
+class AllocationConstraints(BaseModel):
+    """Costs and limits of a campaign, per treatment arm name (e.g. "mens")."""
+    cost: dict[str, Annotated[float, Field(ge=0)]] = Field(
+        default_factory=dict, description="Cost of one email of each arm, 0 when missing"
+    )
+    capacity: dict[str, Annotated[int, Field(ge=0)]] = Field(
+        default_factory=dict, description="Maximum emails of each arm, unlimited when missing"
+    )
+    budget: float | None = Field(None, ge=0, description="Maximum total cost of the emails")
+    value_per_conversion: float | None = Field(
+        None, gt=0,
+        description=(
+            "Value of one conversion, e.g. the average spend. When set, the net value "
+            "(value x CATE - cost) is maximized, otherwise the incremental conversions."
+        )
+    )
+
+
+class AllocationRequest(AllocationConstraints):
+    """Customers as columns, and the constraints of the campaign."""
+    customers: ColumnarBatchInput
+
+
+class AllocationOutput(BaseModel):
+    """Treatment of every customer under the constraints."""
+    treatment: list[int] = Field(..., description="Treatment code of each customer, into treatment_labels")
+    expected_lift: list[float] = Field(..., description="CATE of the assigned treatment, 0 for no email")
+    treatment_labels: list[str]
+    summary: dict = Field(..., description="Expected conversions, cost and assignment counts")
+    model_version: str | None = None
+
+    model_config = {"protected_namespaces": ()}
+
+
+class MonitorEvents(BaseModel):
+    """A batch of live campaign events, as columns of equal length."""
+    treatment: list[str | int] = Field(
+        ..., description="Treatment label of each event (e.g. \"Mens E-Mail\") or its group index"
+    )
+    conversion: list[Literal[0, 1]]
+    spend: list[float] | None = Field(None, description="Spend of each event, when tracked")
+
+
+class MonitorIngestResponse(BaseModel):
+    ingested: int
+    events: int = Field(..., description="Events ingested since the last reset")
+
+
+class MonitorGroup(BaseModel):
+    """Posterior summary of one group of the campaign."""
+    label: str
+    customers: int
+    conversions: int
+    rate_mean: float
+    rate_hdi_low: float
+    rate_hdi_high: float
+    lift_vs_control: float | None
+    p_beats_control: float | None
+    p_best: float
+    expected_loss: float = Field(..., description="Expected conversion rate lost by choosing this group")
+    spend_mean: float | None
+    spend_sem: float | None
+
+
+class MonitorReport(BaseModel):
+    """Posteriors of a live campaign and the stopping recommendation."""
+    events: int
+    batches: int
+    started_at: float
+    updated_at: float | None
+    threshold: float
+    min_customers: int
+    groups: dict[str, MonitorGroup]
+    leader: str = Field(..., description="Group with the highest P(best)")
+    stop: bool = Field(..., description="The leader is best with probability threshold")
+    reason: str
@@ -0,0 +1,161 @@
+"""
+Synchronous scoring pipelines run by the inference executor.
+
+Each function takes a request payload and returns ready-to-send content,
+so that validation, encoding, scoring and serialization all happen off
+the event loop. They are module-level functions so that they can also
+be sent to worker processes.
+"""
+import json
+
+import numpy as np
+from pydantic import ValidationError
+
+from . import metrics
+from .models import cate_models
+from .policy import optimal_treatment
+from .preprocessing import INPUT_COLUMNS, preprocess_batch, preprocess_columns, preprocess_customer
+from .responses import columnar_content, prediction_records, summarize
+from .schemas import BatchInput
+from .shadow import shadow
+from .validation import BatchValidationError, ColumnValidationError, decode_json, validate_columns
+
+
+def parse_batch(body: bytes) -> np.ndarray:
+    """
+    Validate a BatchInput JSON body and encode it to features.
+
+    Raises:
+        BatchValidationError: with FastAPI-style error locations
+    """
+    try:
+        with metrics.stage("validate"):
+            batch = BatchInput.model_validate_json(body)
+    except ValidationError as e:
+        raise BatchValidationError([
+            {**error, "loc": ("body", *error["loc"])}
+            for error in e.errors(include_url=False, include_context=False)
+        ])
+    with metrics.stage("preprocess"):
+        return preprocess_batch([c.model_dump() for c in batch.customers])
+
+
+def check_columns(content, loc: tuple = ("body",)) -> dict:
+    """
+    Validate decoded ColumnarBatchInput content, see `validate_columns`.
+
+    Args:
+        content: Decoded JSON, expected to hold one list per field
+        loc: Location of content in the request, prefixed to errors
+
+    Returns:
+        Dict of validated column arrays
+
+    Raises:
+        BatchValidationError: with (*loc, column, row) error locations
+    """
+    if not isinstance(content, dict):
+        raise BatchValidationError([{
+            "type": "model_attributes_type",
+            "loc": loc,
+            "msg": "Input should be an object with one array per field",
+            "input": None,
+        }])
+
+    not_lists = [
+        name for name in INPUT_COLUMNS
+        if name in content and not isinstance(content[name], list)
+    ]
+    if not_lists:
+        raise BatchValidationError([
+            {"type": "list_type", "loc": (*loc, name), "msg": "Input should be a valid list", "input": None}
+            for name in not_lists
+        ])
+
+    try:
+        return validate_columns({name: content[name] for name in INPUT_COLUMNS if name in content})
+    except ColumnValidationError as e:
+        # validate_columns reports [row, column], FastAPI style is (body, column, row)
+        raise BatchValidationError([
+            {**error, "loc": (*loc, *reversed(error["loc"]))}
+            for error in e.errors
+        ])
+
+
+def parse_columns(body: bytes) -> np.ndarray:
+    """
+    Validate a ColumnarBatchInput JSON body and encode it to features.
+
+    The body is decoded to one list per column and checked with the
+    vectorized CustomerInput constraints of `validate_columns`, without
+    building an object per customer.
+
+    Raises:
+        BatchValidationError: with ("body", column, row) error locations
+    """
+    with metrics.stage("validate"):
+        columns = check_columns(decode_json(body))
+    with metrics.stage("preprocess"):
+        return preprocess_columns(columns)
+
+
+def predict_and_decide(X: np.ndarray, bundle) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Score X with bundle, offer it to shadow scoring and pick treatments.
+
+    Returns:
+        Tuple of (cate, treatment codes, lift)
+    """
+    with metrics.stage("predict"):
+        cate = cate_models.predict_matrix(X, bundle)
+    shadow.submit(X, cate, bundle.version)
+    with metrics.stage("decide"):
+        codes, lift = optimal_treatment(cate)
+    metrics.count_treatments(codes, cate_models.treatment_labels)
+    return cate, codes, lift
+
+
+def score_matrix(X: np.ndarray) -> list[dict]:
+    """Score encoded customers into PredictionOutput dicts."""
+    bundle = cate_models.current()
+    cate, codes, lift = predict_and_decide(X, bundle)
+    with metrics.stage("serialize"):
+        records = prediction_records(cate, codes, lift)
+        for record in records:
+            record["model_version"] = bundle.version
+    return records
+
+
+def score_customer(customer: dict) -> dict:
+    """Score one customer into a PredictionOutput dict."""
+    return score_matrix(preprocess_customer(customer))[0]
+
+
+def score_batch(body: bytes, response_format: str, parse=parse_batch) -> bytes:
+    """
+    Validate, score and serialize a batch JSON body.
+
+    Args:
+        body: Raw request body
+        response_format: "objects" or "columnar"
+        parse: `parse_batch` for a BatchInput body, `parse_columns` for
+            a ColumnarBatchInput body
+
+    Returns:
+        JSON response body
+    """
+    X = parse(body)
+    metrics.observe_batch(f"batch_{response_format}", len(X))
+    bundle = cate_models.current()
+    cate, codes, lift = predict_and_decide(X, bundle)
+
+    with metrics.stage("serialize"):
+        if response_format == "columnar":
+            content = columnar_content(cate, codes, lift, bundle.version)
+        else:
+            content = {
+                "predictions": prediction_records(cate, codes, lift),
+                "summary": summarize(cate, codes),
+                "model_version": bundle.version
+            }
+        return json.dumps(content, separators=(",", ":")).encode()
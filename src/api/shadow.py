@@ -0,0 +1,341 @@
+"""
+Shadow scoring of a candidate model version against production.
+
+A sampled fraction of the rows scored by /predict and /predict/batch is
+handed, with the production CATE, to a bounded queue. A daemon thread
+scores them with the candidate models and aggregates the disagreement
+per feature bucket. The request path only draws the sample and enqueues
+it. When the queue is full, the sample is dropped rather than waiting.
+
+Batches scored in the process pool are sampled in the worker, which
+returns its sample with the response for the API process to enqueue.
+"""
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from .config import settings
+from .lookup import CHANNEL_ONE_HOT, FLAGS, RECENCY, SEGMENT, ZIP_ONE_HOT
+from .models import TREATMENT_ARMS, ModelBundle, cate_models
+from .policy import optimal_treatment
+from .preprocessing import CHANNELS, HISTORY_SEGMENT_MAP, ZIP_CODES
+
+
+def feature_buckets(X: np.ndarray) -> dict:
+    """
+    Bucket of each row for every categorical input feature.
+
+    Args:
+        X: Feature array of shape (n_samples, 12)
+
+    Returns:
+        Mapping of feature name to (bucket codes, bucket labels)
+    """
+    segments = sorted(HISTORY_SEGMENT_MAP, key=HISTORY_SEGMENT_MAP.get)
+    recency = np.clip(X[:, RECENCY].astype(np.intp), 1, 12) - 1
+    segment = np.clip(X[:, SEGMENT].astype(np.intp), 1, len(segments)) - 1
+    buckets = {
+        "recency": (recency, [str(value) for value in range(1, 13)]),
+        "history_segment": (segment, segments),
+    }
+    for name, column in zip(("mens", "womens", "newbie"), FLAGS):
+        buckets[name] = ((X[:, column] > 0).astype(np.intp), ["0", "1"])
+    buckets["zip_code"] = (X[:, ZIP_ONE_HOT].argmax(axis=1), ZIP_CODES)
+    buckets["channel"] = (X[:, CHANNEL_ONE_HOT].argmax(axis=1), CHANNELS)
+    return buckets
+
+
+class DisagreementStats:
+    """
+    Running sums of candidate - production CATE differences.
+
+    For each bucket of each feature, keeps the row count, the sum, sum of
+    absolute values and sum of squares of the CATE delta of every arm,
+    and the number of optimal treatment flips.
+    """
+
+    def __init__(self, n_arms: int, n_treatments: int):
+        self.n_arms = n_arms
+        self.rows = 0
+        self.max_abs_delta = np.zeros(n_arms)
+        self.flips = np.zeros((n_treatments, n_treatments), dtype=np.int64)
+        self.buckets = {}
+
+    def update(self, X: np.ndarray, production: np.ndarray, candidate: np.ndarray):
+        delta = candidate - production
+        production_codes, _ = optimal_treatment(production)
+        candidate_codes, _ = optimal_treatment(candidate)
+        flipped = production_codes != candidate_codes
+        n_treatments = len(self.flips)
+
+        self.rows += len(X)
+        self.max_abs_delta = np.maximum(self.max_abs_delta, np.abs(delta).max(axis=0))
+        self.flips += np.bincount(
+            production_codes * n_treatments + candidate_codes,
+            minlength=n_treatments * n_treatments
+        ).reshape(n_treatments, n_treatments)
+
+        for name, (codes, labels) in feature_buckets(X).items():
+            sums = self.buckets.setdefault(name, {
+                "labels": labels,
+                "count": np.zeros(len(labels), dtype=np.int64),
+                "flips": np.zeros(len(labels), dtype=np.int64),
+                "delta": np.zeros((len(labels), self.n_arms)),
+                "abs_delta": np.zeros((len(labels), self.n_arms)),
+                "sq_delta": np.zeros((len(labels), self.n_arms)),
+            })
+            n = len(labels)
+            sums["count"] += np.bincount(codes, minlength=n)
+            sums["flips"] += np.bincount(codes, weights=flipped, minlength=n).astype(np.int64)
+            for j in range(self.n_arms):
+                sums["delta"][:, j] += np.bincount(codes, weights=delta[:, j], minlength=n)
+                sums["abs_delta"][:, j] += np.bincount(codes, weights=np.abs(delta[:, j]), minlength=n)
+                sums["sq_delta"][:, j] += np.bincount(codes, weights=delta[:, j] ** 2, minlength=n)
+
+    @staticmethod
+    def _summary(count, flips, delta, abs_delta, sq_delta) -> dict:
+        count = int(count)
+        out = {"rows": count, "flips": int(flips), "flip_rate": float(flips / count) if count else 0.0}
+        for j, arm in enumerate(TREATMENT_ARMS):
+            mean = delta[j] / count if count else 0.0
+            out[f"mean_delta_{arm.name}"] = float(mean)
+            out[f"mean_abs_delta_{arm.name}"] = float(abs_delta[j] / count) if count else 0.0
+            out[f"rmse_{arm.name}"] = float(np.sqrt(sq_delta[j] / count)) if count else 0.0
+        return out
+
+    def to_dict(self, treatment_labels: list[str]) -> dict:
+        # Every feature partitions all rows, so any of them gives the totals
+        totals = next(iter(self.buckets.values()), None)
+        if totals is None:
+            overall = self._summary(0, 0, *np.zeros((3, self.n_arms)))
+        else:
+            overall = self._summary(
+                totals["count"].sum(), totals["flips"].sum(),
+                *(totals[key].sum(axis=0) for key in ("delta", "abs_delta", "sq_delta"))
+            )
+        overall.update({
+            f"max_abs_delta_{arm.name}": float(self.max_abs_delta[j])
+            for j, arm in enumerate(TREATMENT_ARMS)
+        })
+
+        return {
+            "overall": overall,
+            "flips": {
+                f"{treatment_labels[i]} -> {treatment_labels[j]}": int(self.flips[i, j])
+                for i, j in zip(*np.nonzero(self.flips))
+                if i != j
+            },
+            "buckets": {
+                name: {
+                    label: self._summary(
+                        sums["count"][b], sums["flips"][b],
+                        sums["delta"][b], sums["abs_delta"][b], sums["sq_delta"][b]
+                    )
+                    for b, label in enumerate(sums["labels"])
+                    if sums["count"][b]
+                }
+                for name, sums in self.buckets.items()
+            },
+        }
+
+
+class ShadowScorer:
+    """
+    Scores sampled production traffic with a candidate model off the
+    request path.
+
+    Attributes:
+        candidate: ModelBundle of the candidate, None when inactive
+        candidate_version: Version of the current or last candidate
+        sample_rate: Fraction of rows sent to the candidate
+        queue_size: Maximum number of pending samples
+        sampled: Rows enqueued for shadow scoring
+        dropped: Rows dropped because the queue was full
+    """
+
+    def __init__(self, sample_rate: float = 0.1, queue_size: int = 256):
+        self.sample_rate = sample_rate
+        self.queue_size = queue_size
+        self.candidate = None
+        self.candidate_version = None
+        self.sampled = 0
+        self.dropped = 0
+        self.production_versions = set()
+        self.stats = None
+        self.busy_seconds = 0.0
+        self._queue = None
+        self._thread = None
+        self._collected = None
+        # _lock guards the stats, _counter_lock the request-path counters
+        self._lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        self._rng = np.random.default_rng()
+
+    @classmethod
+    def from_settings(cls) -> "ShadowScorer":
+        return cls(settings.shadow_sample_rate, settings.shadow_queue_size)
+
+    @property
+    def active(self) -> bool:
+        return self.candidate is not None
+
+    def start(self, version: str, sample_rate: float | None = None, backend: str | None = None) -> ModelBundle:
+        """
+        Load a candidate version and start shadow scoring, resetting the stats.
+
+        Args:
+            version: Registry version of the candidate
+            sample_rate: Fraction of rows to shadow, defaults to the
+                current sample_rate
+            backend: Scoring backend of the candidate, defaults to the
+                production one
+
+        Returns:
+            The candidate ModelBundle
+        """
+        from .registry import resolve_version
+
+        model_dir, version = resolve_version(version)
+        candidate = ModelBundle.load(model_dir, backend or cate_models.backend, version)
+
+        self.stop()
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        self.sampled = 0
+        self.dropped = 0
+        self.busy_seconds = 0.0
+        self.production_versions = set()
+        self.stats = DisagreementStats(len(TREATMENT_ARMS), len(cate_models.treatment_labels))
+        self._queue = queue.Queue(self.queue_size)
+        self.candidate = candidate
+        self.candidate_version = candidate.version
+        self._thread = threading.Thread(
+            target=self._run, args=(self._queue, candidate), name="shadow-scorer", daemon=True
+        )
+        self._thread.start()
+        return candidate
+
+    def stop(self):
+        """Stop shadow scoring, keeping the stats of the last run."""
+        if self._thread is None:
+            return
+        self.candidate = None
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, X: np.ndarray, production: np.ndarray, production_version: str):
+        """
+        Offer scored rows for shadow scoring. Never blocks.
+
+        Args:
+            X: Feature array that was scored, shape (n_samples, 12)
+            production: Production CATE of X, shape (n_samples, n_arms)
+            production_version: Version that scored production
+        """
+        collected = self._collected
+        if collected is None and (self.candidate is None or self._queue is None):
+            return
+        if len(X) == 0:
+            return
+
+        if self.sample_rate >= 1:
+            rows = slice(None)
+        else:
+            rows = np.flatnonzero(self._rng.random(len(X)) < self.sample_rate)
+            if not len(rows):
+                return
+
+        sample = (X[rows].copy(), production[rows].copy(), production_version)
+        if collected is not None:
+            collected.append(sample)
+        else:
+            self.enqueue(*sample)
+
+    def enqueue(self, X: np.ndarray, production: np.ndarray, production_version: str):
+        """
+        Queue rows that are already sampled for shadow scoring. Never blocks.
+
+        The arrays are queued as they are and must not be modified
+        afterwards.
+        """
+        queue_ = self._queue
+        if self.candidate is None or queue_ is None or len(X) == 0:
+            return
+        try:
+            queue_.put_nowait((X, production, production_version))
+            accepted = True
+        except queue.Full:
+            accepted = False
+        with self._counter_lock:
+            if accepted:
+                self.sampled += len(X)
+            else:
+                self.dropped += len(X)
+
+    def reseed(self):
+        """Draw the row samples from a fresh random generator."""
+        self._rng = np.random.default_rng()
+
+    @contextmanager
+    def collecting(self, sample_rate: float):
+        """
+        Collect the samples offered to `submit` in a list instead of
+        queueing them, in a worker process that has no candidate loaded.
+
+        Yields:
+            List that receives (X, production, production_version)
+            samples, to pass to `enqueue` in the API process
+        """
+        previous_rate = self.sample_rate
+        self.sample_rate = sample_rate
+        self._collected = []
+        try:
+            yield self._collected
+        finally:
+            self.sample_rate = previous_rate
+            self._collected = None
+
+    def _run(self, queue_: queue.Queue, candidate: ModelBundle):
+        while True:
+            item = queue_.get()
+            if item is None:
+                return
+            X, production, production_version = item
+            started = time.perf_counter()
+            try:
+                scored = candidate.predict_matrix(X)
+            except Exception as e:
+                print(f"Warning: shadow scoring failed: {e}")
+                continue
+            with self._lock:
+                self.stats.update(X, production, scored)
+                self.production_versions.add(production_version)
+                self.busy_seconds += time.perf_counter() - started
+
+    def to_dict(self) -> dict:
+        """Disagreement stats, in the ShadowStats schema."""
+        with self._lock:
+            stats = (
+                self.stats.to_dict(cate_models.treatment_labels)
+                if self.stats is not None else None
+            )
+            return {
+                "active": self.active,
+                "candidate_version": self.candidate_version,
+                "production_versions": sorted(self.production_versions),
+                "sample_rate": self.sample_rate,
+                "sampled_rows": self.sampled,
+                "dropped_rows": self.dropped,
+                "scored_rows": self.stats.rows if self.stats is not None else 0,
+                "pending_batches": self._queue.qsize() if self._queue is not None else 0,
+                "busy_s": self.busy_seconds,
+                **(stats or {"overall": None, "flips": {}, "buckets": {}}),
+            }
+
+
+# Global instance
+shadow = ShadowScorer.from_settings()
@@ -0,0 +1,292 @@
+"""
+Flat array representation of the CATE tree ensembles.
+
+The GradientBoostingRegressor models are exported into contiguous NumPy
+node arrays so that every treatment arm is scored in a single vectorized
+traversal, without sklearn's per-call input validation. The arrays are
+saved as a memory-mappable artifact (see artifacts.py), which loads
+faster than the pickles and without executing code.
+
+Usage:
+    python -m src.api.trees [output_dir]
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from .artifacts import load_artifact, save_artifact
+
+# Rows scored per traversal, bounds the (rows, trees) working arrays
+CHUNK_SIZE = 512
+
+# Artifact kind written by FlatTreeEnsemble.save
+ARTIFACT_KIND = "flat_tree_ensemble"
+
+# Arrays that fully describe a FlatTreeEnsemble
+ARRAY_NAMES = [
+    'feature', 'threshold', 'left', 'right', 'value', 'roots', 'baseline'
+]
+
+# Traversal layout derived from them, saved too so that loaded
+# ensembles traverse memory-mapped arrays instead of private copies
+LAYOUT_NAMES = ['children', 'arm_values']
+
+
+class FlatTreeEnsemble:
+    """
+    Additive tree ensembles predicting one output per treatment arm.
+
+    Nodes of every tree are stored in shared arrays. Leaves point to
+    themselves with an infinite threshold, so a fixed number of
+    traversal steps lands every sample on a leaf without branching.
+
+    Attributes:
+        feature: Feature index tested at each node, shape (n_nodes,)
+        threshold: Split threshold at each node, shape (n_nodes,)
+        left: Index of the node taken when X[feature] <= threshold
+        right: Index of the node taken otherwise
+        value: Contribution of each leaf to every arm, already scaled
+            by the learning rate, shape (n_nodes, n_arms)
+        roots: Index of the root node of each tree, shape (n_trees,)
+        baseline: Initial prediction of each arm, shape (n_arms,)
+        children: Traversal layout, left and right interleaved so that
+            the next node is a single gather at 2 * node + (x > threshold)
+        arm_values: value per arm, shape (n_arms, n_nodes), for
+            contiguous gathers
+        manifest: Artifact manifest when loaded from disk, else None
+    """
+
+    def __init__(
+        self, feature, threshold, left, right, value, roots, baseline,
+        children=None, arm_values=None, manifest=None
+    ):
+        self.feature = np.asarray(feature, dtype=np.intp)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.asarray(left, dtype=np.intp)
+        self.right = np.asarray(right, dtype=np.intp)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.baseline = np.asarray(baseline, dtype=np.float64)
+        self.manifest = manifest
+        self.max_depth = self._max_depth()
+
+        if children is None:
+            children = np.stack([self.left, self.right], axis=1).ravel()
+        if arm_values is None:
+            arm_values = self.value.T
+        self.children = np.asarray(children, dtype=np.intp)
+        self.arm_values = np.ascontiguousarray(arm_values, dtype=np.float64)
+
+    @classmethod
+    def from_gradient_boosting(cls, models: list) -> "FlatTreeEnsemble":
+        """
+        Flatten fitted GradientBoostingRegressor models, one per arm.
+
+        Args:
+            models: List of fitted GradientBoostingRegressor
+
+        Returns:
+            FlatTreeEnsemble with one output per model
+        """
+        n_arms = len(models)
+        feature, threshold, left, right, value, roots = [], [], [], [], [], []
+        baseline = np.zeros(n_arms)
+        offset = 0
+
+        for arm, model in enumerate(models):
+            baseline[arm] = model.init_.constant_.ravel()[0]
+
+            for estimator in model.estimators_[:, 0]:
+                tree = estimator.tree_
+                n_nodes = tree.node_count
+                nodes = np.arange(n_nodes)
+                is_leaf = tree.children_left == -1
+
+                tree_value = np.zeros((n_nodes, n_arms))
+                tree_value[is_leaf, arm] = (
+                    model.learning_rate * tree.value[is_leaf, 0, 0]
+                )
+
+                feature.append(np.where(is_leaf, 0, tree.feature))
+                threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+                left.append(offset + np.where(is_leaf, nodes, tree.children_left))
+                right.append(offset + np.where(is_leaf, nodes, tree.children_right))
+                value.append(tree_value)
+                roots.append(offset)
+                offset += n_nodes
+
+        return cls(
+            feature=np.concatenate(feature),
+            threshold=np.concatenate(threshold),
+            left=np.concatenate(left),
+            right=np.concatenate(right),
+            value=np.vstack(value),
+            roots=np.array(roots),
+            baseline=baseline,
+        )
+
+    @classmethod
+    def from_multi_output_trees(cls, trees: list, learning_rate: float, baseline) -> "FlatTreeEnsemble":
+        """
+        Flatten boosted multi-output regression trees, one output per arm.
+
+        Every tree predicts all arms at once, so scoring traverses half
+        as many trees as one GradientBoostingRegressor per arm.
+
+        Args:
+            trees: Fitted DecisionTreeRegressor with n_arms outputs
+            learning_rate: Shrinkage applied to every tree
+            baseline: Initial prediction of each arm
+
+        Returns:
+            FlatTreeEnsemble
+        """
+        feature, threshold, left, right, value, roots = [], [], [], [], [], []
+        offset = 0
+        for estimator in trees:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            nodes = np.arange(n_nodes)
+            is_leaf = tree.children_left == -1
+
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+            left.append(offset + np.where(is_leaf, nodes, tree.children_left))
+            right.append(offset + np.where(is_leaf, nodes, tree.children_right))
+            value.append(np.where(is_leaf[:, None], learning_rate * tree.value[:, :, 0], 0.0))
+            roots.append(offset)
+            offset += n_nodes
+
+        return cls(
+            feature=np.concatenate(feature),
+            threshold=np.concatenate(threshold),
+            left=np.concatenate(left),
+            right=np.concatenate(right),
+            value=np.vstack(value),
+            roots=np.array(roots),
+            baseline=np.asarray(baseline, dtype=np.float64),
+        )
+
+    @property
+    def n_arms(self) -> int:
+        return len(self.baseline)
+
+    def _max_depth(self) -> int:
+        """Number of traversal steps needed to reach every leaf."""
+        depth = 0
+        node = self.roots
+        while True:
+            next_node = self.left[node]
+            is_internal = next_node != node
+            if not is_internal.any():
+                return depth
+            node = np.concatenate([next_node[is_internal], self.right[node][is_internal]])
+            depth += 1
+
+    def apply(self, X) -> np.ndarray:
+        """
+        Find the leaf reached by each sample in each tree.
+
+        Args:
+            X: Feature array of shape (n_samples, n_features)
+
+        Returns:
+            Leaf node indices of shape (n_samples, n_trees)
+        """
+        # sklearn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        n_samples, n_features = X.shape
+        X_flat = X.ravel()
+        row_offsets = (np.arange(n_samples) * n_features)[:, None]
+
+        node = np.broadcast_to(self.roots, (n_samples, len(self.roots)))
+        for _ in range(self.max_depth):
+            x = np.take(X_flat, row_offsets + np.take(self.feature, node))
+            node = np.take(self.children, 2 * node + (x > np.take(self.threshold, node)))
+        return node
+
+    def predict(self, X) -> np.ndarray:
+        """
+        Predict every arm in one pass over the input.
+
+        Args:
+            X: Feature array of shape (n_samples, n_features)
+
+        Returns:
+            Predictions of shape (n_samples, n_arms)
+        """
+        X = np.asarray(X)
+        out = np.empty((len(X), self.n_arms))
+        for start in range(0, len(X), CHUNK_SIZE):
+            leaves = self.apply(X[start:start + CHUNK_SIZE])
+            for arm, arm_values in enumerate(self.arm_values):
+                out[start:start + CHUNK_SIZE, arm] = (
+                    self.baseline[arm] + np.take(arm_values, leaves).sum(axis=1)
+                )
+        return out
+
+    def save(self, path, **metadata) -> dict:
+        """
+        Save the node arrays as an artifact directory.
+
+        Args:
+            path: Output directory
+            **metadata: Extra manifest entries, see save_artifact
+
+        Returns:
+            The manifest
+        """
+        self.manifest = save_artifact(
+            path, ARTIFACT_KIND,
+            {name: getattr(self, name) for name in ARRAY_NAMES + LAYOUT_NAMES},
+            **metadata
+        )
+        return self.manifest
+
+    @classmethod
+    def load(cls, path, mmap_mode: str | None = 'r', verify: bool = True) -> "FlatTreeEnsemble":
+        """
+        Load node arrays saved with `save`, memory-mapped by default.
+
+        Artifacts exported before the traversal layout was saved get
+        it rebuilt in memory.
+        """
+        arrays, manifest = load_artifact(path, ARTIFACT_KIND, mmap_mode=mmap_mode, verify=verify)
+        return cls(
+            **{name: arrays[name] for name in ARRAY_NAMES},
+            **{name: arrays.get(name) for name in LAYOUT_NAMES},
+            manifest=manifest
+        )
+
+
+def export_flat_models(path=None, model_dir=None) -> Path:
+    """
+    Export the pickled CATE models to a flat artifact.
+
+    Args:
+        path: Output directory, defaults to cate_models_flat in model_dir
+        model_dir: Directory with the pickles, defaults to models/
+
+    Returns:
+        Path of the written directory
+    """
+    from .models import (
+        FLAT_MODELS_NAME, MODELS_DIR, TREATMENT_ARMS,
+        load_pickles, model_dir_version, pickle_checksums
+    )
+
+    model_dir = Path(model_dir) if model_dir is not None else MODELS_DIR
+    path = Path(path) if path is not None else model_dir / FLAT_MODELS_NAME
+    FlatTreeEnsemble.from_gradient_boosting(load_pickles(model_dir)).save(
+        path,
+        version=model_dir_version(model_dir),
+        arms=[arm.name for arm in TREATMENT_ARMS],
+        source=pickle_checksums(model_dir),
+    )
+    return path
+
+
+if __name__ == "__main__":
+    output = export_flat_models(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(f"Flat CATE models written to {output}")
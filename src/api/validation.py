@@ -0,0 +1,189 @@
+"""
+Vectorized validation of customer batches given as columns.
+
+Applies the CustomerInput constraints to whole column arrays at once
+and reports errors with the index of the offending row, in the same
+shape as FastAPI validation errors.
+
+Also holds the request body errors shared with the campaign monitor,
+which needs them without loading the models and the scoring stack.
+"""
+import json
+
+import numpy as np
+
+from .preprocessing import CHANNELS, INPUT_COLUMNS, ZIP_CODES
+
+# Spellings found in data/raw/hillstrom.csv, mapped to CustomerInput values
+ZIP_CODE_ALIASES = {"Surburban": "Suburban"}
+
+# Stop collecting errors past this many, the batch is rejected anyway
+MAX_ERRORS = 50
+
+
+class ColumnValidationError(ValueError):
+    """Raised when a columnar batch violates the CustomerInput constraints."""
+
+    def __init__(self, errors: list[dict]):
+        self.errors = errors
+        super().__init__(f"{len(errors)} validation error(s)")
+
+    def __reduce__(self):
+        # Keep the errors when raised in a worker process
+        return type(self), (self.errors,)
+
+
+class BatchValidationError(ValueError):
+    """Raised when a batch request body does not match its schema."""
+
+    def __init__(self, errors: list[dict]):
+        self.errors = errors
+        super().__init__(f"{len(errors)} validation error(s)")
+
+    def __reduce__(self):
+        # Keep the errors when raised in a worker process
+        return type(self), (self.errors,)
+
+
+def decode_json(body: bytes):
+    """
+    Decode a JSON request body.
+
+    Raises:
+        BatchValidationError: if the body is not valid JSON
+    """
+    try:
+        return json.loads(body)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise BatchValidationError([{
+            "type": "json_invalid",
+            "loc": ("body", getattr(e, "pos", 0)),
+            "msg": "JSON decode error",
+            "input": {},
+            "ctx": {"error": str(e)},
+        }])
+
+
+def _error(row, column: str, error_type: str, msg: str, value=None) -> dict:
+    """One error in the FastAPI format, with the pydantic type of the failed check."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        value = None
+    return {"type": error_type, "loc": [int(row), column], "msg": msg, "input": value}
+
+
+def _as_numeric(values, column: str, errors: list[dict]) -> np.ndarray:
+    """Convert a column to float, flagging values that are not numbers."""
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        pass
+
+    # Slow path, only taken when the column has bad entries
+    out = np.empty(len(values))
+    for row, value in enumerate(values):
+        try:
+            out[row] = float(value)
+        except (TypeError, ValueError):
+            out[row] = np.nan
+            errors.append(_error(row, column, "float_parsing", "Input should be a valid number", value))
+    return out
+
+
+def _check(mask: np.ndarray, values, column: str, error_type: str, msg: str, errors: list[dict]):
+    """Record an error for every row where mask is True, unless the row already has one for column."""
+    reported = [error["loc"][0] for error in errors if error["loc"][1:] == [column]]
+    if reported:
+        mask = mask.copy()
+        mask[reported] = False
+    rows = np.flatnonzero(mask)[:MAX_ERRORS]
+    if len(rows):
+        values = np.asarray(values, dtype=object)
+        errors.extend(_error(row, column, error_type, msg, values[row]) for row in rows)
+
+
+def validate_columns(columns: dict) -> dict:
+    """
+    Validate and normalize a batch of customers given as columns.
+
+    Args:
+        columns: Mapping of each name in INPUT_COLUMNS to an array-like
+            of length n_customers
+
+    Returns:
+        Dictionary of NumPy arrays ready for `preprocess_columns`
+
+    Raises:
+        ColumnValidationError: if a column is missing, lengths differ,
+            or any row violates the CustomerInput constraints
+    """
+    missing = [name for name in INPUT_COLUMNS if name not in columns]
+    if missing:
+        raise ColumnValidationError([
+            {"type": "missing", "loc": [name], "msg": "Field required", "input": None}
+            for name in missing
+        ])
+
+    lengths = {name: len(columns[name]) for name in INPUT_COLUMNS}
+    if len(set(lengths.values())) > 1:
+        raise ColumnValidationError([{
+            "type": "value_error",
+            "loc": [],
+            "msg": f"All columns must have the same length, got {lengths}",
+            "input": None
+        }])
+
+    errors = []
+    out = {}
+
+    # recency: integer in [1, 12]
+    recency = _as_numeric(columns['recency'], 'recency', errors)
+    _check(
+        ~((recency >= 1) & (recency <= 12) & (recency == np.round(recency))),
+        columns['recency'], 'recency', "value_error", "Input should be an integer between 1 and 12", errors
+    )
+    out['recency'] = recency
+
+    # history: number >= 0
+    history = _as_numeric(columns['history'], 'history', errors)
+    _check(
+        ~(history >= 0),
+        columns['history'], 'history', "greater_than_equal", "Input should be greater than or equal to 0", errors
+    )
+    out['history'] = history
+
+    # Binary flags: 0 or 1
+    for name in ('mens', 'womens', 'newbie'):
+        values = _as_numeric(columns[name], name, errors)
+        _check(~np.isin(values, (0, 1)), columns[name], name, "literal_error", "Input should be 0 or 1", errors)
+        out[name] = values
+
+    # Categorical columns
+    segment = columns['history_segment']
+    if not (isinstance(segment, np.ndarray) and segment.dtype.kind == 'U'):
+        segment = np.asarray(segment, dtype=object)
+        _check(
+            np.array([not isinstance(v, str) for v in segment], dtype=bool),
+            segment, 'history_segment', "string_type", "Input should be a valid string", errors
+        )
+    out['history_segment'] = segment
+
+    zip_code = np.asarray(columns['zip_code'], dtype=object)
+    for alias, value in ZIP_CODE_ALIASES.items():
+        zip_code = np.where(zip_code == alias, value, zip_code)
+    for name, values, allowed in (
+        ('zip_code', zip_code, ZIP_CODES),
+        ('channel', np.asarray(columns['channel'], dtype=object), CHANNELS),
+    ):
+        _check(
+            ~np.isin(values, allowed),
+            values, name, "literal_error", f"Input should be one of {', '.join(map(repr, allowed))}", errors
+        )
+        out[name] = values
+
+    if errors:
+        errors.sort(key=lambda e: e["loc"][0])
+        raise ColumnValidationError(errors[:MAX_ERRORS])
+
+    return out
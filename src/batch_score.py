@@ -0,0 +1,168 @@
+"""
+Offline CATE scoring of large customer files.
+
+Reads a CSV in the data/raw/hillstrom.csv schema in fixed-size chunks,
+scores the chunks across a process pool and appends the results to the
+output CSV in input order. At most two chunks per worker are in flight
+or waiting to be written, so memory stays bounded whatever the input
+size.
+
+Usage:
+    python -m src.batch_score input.csv output.csv [--chunksize 100000] [--workers 4]
+"""
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+from src.api.bulk import frame_columns, score_columns
+from src.api.models import BACKENDS, cate_models
+from src.api.preprocessing import INPUT_COLUMNS
+from src.api.validation import ColumnValidationError
+
+
+def _init_worker(backend: str | None):
+    """Load the models once per worker process."""
+    cate_models.load_models(backend=backend)
+
+
+def _score_chunk(index: int, start_row: int, df: pd.DataFrame) -> tuple:
+    """
+    Validate and score one chunk in a worker process.
+
+    Returns:
+        Tuple of (index, csv_text, n_rows, seconds, worker pid)
+    """
+    started = time.perf_counter()
+    try:
+        columns = frame_columns(df)
+    except ColumnValidationError as e:
+        # Report rows relative to the whole file
+        for error in e.errors:
+            if error["loc"] and isinstance(error["loc"][0], int):
+                error["loc"][0] += start_row
+        raise
+    csv_text = score_columns(columns).to_csv(index=False, header=index == 0)
+    return index, csv_text, len(df), time.perf_counter() - started, os.getpid()
+
+
+def score_file(
+    input_path,
+    output_path,
+    chunksize: int = 100_000,
+    workers: int | None = None,
+    backend: str | None = None
+) -> dict:
+    """
+    Score a hillstrom-format CSV file into a predictions CSV.
+
+    Args:
+        input_path: CSV file with at least the INPUT_COLUMNS
+        output_path: Destination CSV, in the cate_predictions_sample.csv format
+        chunksize: Rows read and scored per task
+        workers: Number of worker processes, defaults to the CPU count
+        backend: Scoring backend, see CATEModels.load_models
+
+    Returns:
+        Dictionary with total rows, wall time and per-worker statistics
+    """
+    workers = workers or os.cpu_count()
+    max_pending = 2 * workers
+
+    reader = pd.read_csv(
+        input_path,
+        usecols=lambda name: name in INPUT_COLUMNS,
+        dtype={'history_segment': str, 'zip_code': str, 'channel': str},
+        chunksize=chunksize,
+    )
+
+    worker_rows = defaultdict(int)
+    worker_seconds = defaultdict(float)
+    done = {}
+    started = time.perf_counter()
+
+    def collect(futures):
+        for future in futures:
+            chunk_index, csv_text, n_rows, seconds, pid = future.result()
+            done[chunk_index] = csv_text
+            worker_rows[pid] += n_rows
+            worker_seconds[pid] += seconds
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(backend,)) as pool, \
+            open(output_path, "w", newline="") as out:
+        pending = set()
+        next_to_write = 0
+        start_row = 0
+
+        for index, df in enumerate(reader):
+            pending.add(pool.submit(_score_chunk, index, start_row, df))
+            start_row += len(df)
+
+            # Bound the number of chunks held in memory, scored or not:
+            # a slow chunk stalls writing, so completed ones count too
+            while len(pending) + len(done) >= max_pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+
+                # Write completed chunks in input order
+                while next_to_write in done:
+                    out.write(done.pop(next_to_write))
+                    next_to_write += 1
+
+        collect(pending)
+        for index in sorted(done):
+            out.write(done.pop(index))
+
+    total_rows = sum(worker_rows.values())
+    wall_time = time.perf_counter() - started
+    return {
+        "rows": total_rows,
+        "wall_time_s": wall_time,
+        "rows_per_s": total_rows / wall_time if wall_time else 0.0,
+        "workers": {
+            pid: {
+                "rows": worker_rows[pid],
+                "busy_s": worker_seconds[pid],
+                "rows_per_s": worker_rows[pid] / worker_seconds[pid] if worker_seconds[pid] else 0.0,
+            }
+            for pid in worker_rows
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a hillstrom-format CSV with the CATE models.")
+    parser.add_argument("input", help="Input CSV in the hillstrom.csv schema")
+    parser.add_argument("output", help="Output CSV with CATE predictions")
+    parser.add_argument("--chunksize", type=int, default=100_000, help="Rows per chunk")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--backend", choices=BACKENDS, default=None, help="Scoring backend")
+    args = parser.parse_args()
+
+    try:
+        stats = score_file(args.input, args.output, args.chunksize, args.workers, args.backend)
+    except ColumnValidationError as e:
+        print(f"Validation failed: {e}", file=sys.stderr)
+        for error in e.errors:
+            print(f"  {error['loc']}: {error['msg']} (got {error['input']!r})", file=sys.stderr)
+        sys.exit(1)
+
+    for pid, worker in sorted(stats["workers"].items()):
+        print(
+            f"worker {pid}: {worker['rows']:,} rows in {worker['busy_s']:.2f}s "
+            f"({worker['rows_per_s']:,.0f} rows/s)",
+            file=sys.stderr
+        )
+    print(
+        f"Scored {stats['rows']:,} rows in {stats['wall_time_s']:.2f}s "
+        f"({stats['rows_per_s']:,.0f} rows/s) -> {args.output}",
+        file=sys.stderr
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""
+Closed-form Bayesian A/B/C analysis of the campaign groups.
+
+Notebook 02 samples a Beta(1, 1) prior and Binomial likelihood with PyMC
+NUTS to produce data/processed/bayesian_results.json. The posterior of
+that model is known exactly: the conversion rate of a group with k
+conversions out of n customers follows Beta(1 + k, 1 + n - k). Here:
+
+- posterior means and the lift of the mean rates are analytic;
+- HDIs of the rates, P(A > B), P(best) and the expected loss of
+  choosing each group are integrals of the Beta densities and CDFs over
+  a grid fitted to the posteriors;
+- HDIs of the lifts and the spend model, which notebook 02 approximates
+  by Normal(mean, 3 * sem) per group, use vectorized draws.
+
+The lifts keep the notebook's definition, the posterior mean of the
+ratio to control. For spend that mean does not exist (a Normal control
+mean can come close to zero), so its draw average moves with the seed.
+Every section therefore also reports the lift of the posterior means,
+which is exact, under lift_of_means keys.
+
+Everything works from per-group sufficient statistics (customers,
+conversions, sum and sum of squares of the spend), so the results can
+be recomputed in milliseconds on every data refresh.
+
+Usage:
+    python -m src.bayesian.conjugate [--data data/raw/hillstrom.csv]
+        [--output data/processed/bayesian_results.json] [--hdi-prob 0.94]
+"""
+import argparse
+import json
+import time
+from dataclasses import dataclass
+from itertools import permutations
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from ..api.models import NO_TREATMENT, TREATMENT_ARMS
+
+# Result keys of the groups in bayesian_results.json, control last
+GROUP_KEYS = [f"{arm.name}_email" for arm in TREATMENT_ARMS] + ["control"]
+GROUP_LABELS = [arm.label for arm in TREATMENT_ARMS] + [NO_TREATMENT]
+CONTROL = len(TREATMENT_ARMS)
+
+# Beta(1, 1) prior, uniform over the conversion rate
+PRIOR_ALPHA = 1.0
+PRIOR_BETA = 1.0
+
+# Notebook 02 reports 94% HDIs, the ArviZ default
+HDI_PROB = 0.94
+
+# The quadrature grid covers each posterior over this many standard
+# deviations either side of its mean, with GRID_POINTS points
+GRID_WIDTH_SD = 12.0
+GRID_POINTS = 2048
+
+# Draws for the quantities without a closed form
+N_DRAWS = 100_000
+RANDOM_SEED = 42
+
+# numpy < 2.0 only has the old name of np.trapezoid
+_trapezoid = getattr(np, "trapezoid", None) or np.trapz
+
+
+@dataclass(frozen=True)
+class GroupStats:
+    """
+    Sufficient statistics of the outcomes of each group.
+
+    Attributes:
+        n: Customers per group
+        conversions: Converted customers per group
+        spend_sum: Sum of the spend per group, if known
+        spend_sum_sq: Sum of the squared spend per group, if known
+    """
+    n: np.ndarray
+    conversions: np.ndarray
+    spend_sum: np.ndarray | None = None
+    spend_sum_sq: np.ndarray | None = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "GroupStats":
+        """
+        Aggregate customers in the hillstrom.csv schema.
+
+        Args:
+            df: Customers with treatment and conversion columns, and
+                optionally spend
+
+        Raises:
+            ValueError: if a treatment label is unknown
+        """
+        unknown = sorted(set(df["treatment"].unique()) - set(GROUP_LABELS))
+        if unknown:
+            raise ValueError(f"Unknown treatments {unknown}, expected {GROUP_LABELS}")
+
+        columns = {"conversions": ("conversion", "sum"), "n": ("conversion", "size")}
+        if "spend" in df:
+            df = df.assign(spend_sq=df["spend"] ** 2)
+            columns.update(spend_sum=("spend", "sum"), spend_sum_sq=("spend_sq", "sum"))
+        grouped = df.groupby("treatment").agg(**columns).reindex(GROUP_LABELS, fill_value=0)
+        return cls(**{name: grouped[name].to_numpy(dtype=np.float64) for name in columns})
+
+    @property
+    def has_spend(self) -> bool:
+        return self.spend_sum is not None
+
+    def spend_mean(self) -> np.ndarray:
+        return self.spend_sum / self.n
+
+    def spend_sem(self) -> np.ndarray:
+        """Standard error of the mean spend, from the sample variance."""
+        variance = (self.spend_sum_sq - self.n * self.spend_mean() ** 2) / (self.n - 1)
+        return np.sqrt(np.maximum(variance, 0.0) / self.n)
+
+
+def sample_hdi(samples: np.ndarray, prob: float = HDI_PROB) -> np.ndarray:
+    """
+    Narrowest interval holding prob of the draws, as ArviZ computes it.
+
+    Args:
+        samples: Draws of shape (n_draws, ...), one HDI per trailing index
+
+    Returns:
+        Array of shape (2, ...) with the lower and upper bounds
+    """
+    ordered = np.sort(samples, axis=0)
+    n = len(ordered)
+    inside = int(np.floor(prob * n))
+    widths = ordered[inside:] - ordered[:n - inside]
+    start = np.expand_dims(widths.argmin(axis=0), 0)
+    return np.concatenate([
+        np.take_along_axis(ordered, start, axis=0),
+        np.take_along_axis(ordered, start + inside, axis=0),
+    ])
+
+
+@dataclass(frozen=True)
+class BetaPosteriors:
+    """Independent Beta posteriors of the conversion rate of each group."""
+    alpha: np.ndarray
+    beta: np.ndarray
+
+    @classmethod
+    def from_counts(cls, n, conversions, prior_alpha=PRIOR_ALPHA, prior_beta=PRIOR_BETA) -> "BetaPosteriors":
+        n = np.asarray(n, dtype=np.float64)
+        conversions = np.asarray(conversions, dtype=np.float64)
+        return cls(prior_alpha + conversions, prior_beta + n - conversions)
+
+    def mean(self) -> np.ndarray:
+        return self.alpha / (self.alpha + self.beta)
+
+    def sd(self) -> np.ndarray:
+        total = self.alpha + self.beta
+        return np.sqrt(self.alpha * self.beta / (total ** 2 * (total + 1)))
+
+    def lift_mean(self, control: int = CONTROL) -> np.ndarray:
+        """
+        Posterior mean of theta_g / theta_control - 1 for every group.
+
+        Uses E[1 / theta] = (alpha + beta - 1) / (alpha - 1), finite once
+        the control group has a conversion.
+        """
+        inverse = (self.alpha[control] + self.beta[control] - 1) / (self.alpha[control] - 1)
+        lift = self.mean() * inverse - 1
+        lift[control] = 0.0
+        return lift
+
+    def grids(self, points: int = GRID_POINTS) -> np.ndarray:
+        """Rates covering each posterior, shape (n_groups, points)."""
+        mean, sd = self.mean(), self.sd()
+        low = np.maximum(mean - GRID_WIDTH_SD * sd, 0.0)
+        high = np.minimum(mean + GRID_WIDTH_SD * sd, 1.0)
+        return np.linspace(low, high, points, axis=1)
+
+    def hdi(self, prob: float = HDI_PROB) -> np.ndarray:
+        """
+        Narrowest interval holding prob of each posterior.
+
+        Every grid rate is tried as the lower bound, its upper bound read
+        from the interpolated CDF.
+
+        Returns:
+            Array of shape (2, n_groups)
+        """
+        x = self.grids()
+        cdf = stats.beta.cdf(x, self.alpha[:, None], self.beta[:, None])
+        bounds = np.empty((2, len(x)))
+        for g in range(len(x)):
+            starts = cdf[g] <= cdf[g, -1] - prob
+            upper = np.interp(cdf[g, starts] + prob, cdf[g], x[g])
+            best = np.argmin(upper - x[g, starts])
+            bounds[:, g] = x[g, starts][best], upper[best]
+        return bounds
+
+    def _quadrature(self):
+        """Common grid of every posterior, with their densities and CDFs on it."""
+        x = np.unique(self.grids(GRID_POINTS // 2))
+        pdf = stats.beta.pdf(x, self.alpha[:, None], self.beta[:, None])
+        cdf = stats.beta.cdf(x, self.alpha[:, None], self.beta[:, None])
+        return x, pdf, cdf
+
+    def prob_greater(self) -> np.ndarray:
+        """
+        P(theta_a > theta_b) of every pair of groups.
+
+        Returns:
+            Array of shape (n_groups, n_groups), entry [a, b]
+        """
+        x, pdf, cdf = self._quadrature()
+        return _trapezoid(pdf[:, None, :] * cdf[None, :, :], x, axis=-1)
+
+    def prob_best(self) -> np.ndarray:
+        """P(theta_g is the largest rate) of every group."""
+        x, pdf, cdf = self._quadrature()
+        others = np.stack([np.prod(np.delete(cdf, g, axis=0), axis=0) for g in range(len(cdf))])
+        return _trapezoid(pdf * others, x, axis=-1)
+
+    def expected_loss(self) -> np.ndarray:
+        """
+        E[max_h theta_h - theta_g] of choosing each group.
+
+        E[max] is the integral of 1 - P(every theta <= x) over the rates.
+        """
+        x, _, cdf = self._quadrature()
+        expected_max = x[0] + _trapezoid(1 - np.prod(cdf, axis=0), x)
+        return np.maximum(expected_max - self.mean(), 0.0)
+
+    def draws(self, n_draws: int = N_DRAWS, rng=None) -> np.ndarray:
+        """Draws of the rates, shape (n_draws, n_groups)."""
+        rng = rng if rng is not None else np.random.default_rng(RANDOM_SEED)
+        return rng.beta(self.alpha, self.beta, size=(n_draws, len(self.alpha)))
+
+
+def spend_draws(group_stats: GroupStats, n_draws: int = N_DRAWS, rng=None) -> np.ndarray:
+    """
+    Draws of the mean spend of each group, shape (n_draws, n_groups).
+
+    Notebook 02 models the mean spend of a group as Normal(mean, 3 * sem)
+    around the observed mean, relying on the CLT for groups of 20k+.
+    """
+    rng = rng if rng is not None else np.random.default_rng(RANDOM_SEED)
+    mean, sem = group_stats.spend_mean(), group_stats.spend_sem()
+    return rng.normal(mean, 3 * sem, size=(n_draws, len(mean)))
+
+
+def bayesian_results(
+    group_stats: GroupStats,
+    hdi_prob: float = HDI_PROB,
+    n_draws: int = N_DRAWS,
+    seed: int = RANDOM_SEED
+) -> dict:
+    """
+    Results of notebook 02 in the bayesian_results.json format.
+
+    The keys of the notebook keep its definitions. lift_of_means keys
+    add the lift of the posterior means, exact and seed-free.
+
+    Args:
+        group_stats: Outcomes of each group, in GROUP_KEYS order
+        hdi_prob: Mass of the HDIs
+        n_draws: Draws of the spend means
+        seed: Seed of the draws
+
+    Returns:
+        Dict with a "conversion" section, and a "spend" section when the
+        spend statistics are known
+    """
+    posteriors = BetaPosteriors.from_counts(group_stats.n, group_stats.conversions)
+    mean, hdi = posteriors.mean(), posteriors.hdi(hdi_prob)
+    lift = posteriors.lift_mean()
+    lift_of_means = mean / mean[CONTROL] - 1
+    greater = posteriors.prob_greater()
+    best = posteriors.prob_best()
+
+    conversion = {}
+    for g, key in enumerate(GROUP_KEYS):
+        conversion[key] = {
+            "rate_mean": float(mean[g]),
+            "rate_hdi_low": float(hdi[0, g]),
+            "rate_hdi_high": float(hdi[1, g]),
+        }
+        if g != CONTROL:
+            conversion[key]["lift_vs_control"] = float(lift[g])
+            conversion[key]["lift_of_means_vs_control"] = float(lift_of_means[g])
+            conversion[key]["p_beats_control"] = float(greater[g, CONTROL])
+
+    comparisons = {}
+    for a, b in permutations(range(CONTROL), 2):
+        if a < b:
+            comparisons[f"p_{TREATMENT_ARMS[a].name}_beats_{TREATMENT_ARMS[b].name}"] = float(greater[a, b])
+    for a, arm in enumerate(TREATMENT_ARMS):
+        comparisons[f"p_{arm.name}_best"] = float(best[a])
+    conversion["comparisons"] = comparisons
+    results = {"conversion": conversion}
+
+    if group_stats.has_spend:
+        draws = spend_draws(group_stats, n_draws, np.random.default_rng(seed))
+        spend_lift = (draws - draws[:, [CONTROL]]) / draws[:, [CONTROL]]
+        spend_mean, spend_lift = draws.mean(axis=0), spend_lift.mean(axis=0)
+        # Posterior means of Normal(mean, 3 * sem) are the observed means
+        exact_mean = group_stats.spend_mean()
+        spend_lift_of_means = exact_mean / exact_mean[CONTROL] - 1
+        spend = {}
+        for g, key in enumerate(GROUP_KEYS):
+            spend[key] = {"mean": float(spend_mean[g])}
+            if g != CONTROL:
+                spend[key]["lift"] = float(spend_lift[g])
+                spend[key]["lift_of_means"] = float(spend_lift_of_means[g])
+        results["spend"] = spend
+    return results
+
+
+def main():
+    from ..training.crossfit import HILLSTROM_PATH
+
+    parser = argparse.ArgumentParser(description="Closed-form Bayesian A/B/C results of a campaign.")
+    parser.add_argument("--data", default=str(HILLSTROM_PATH), help="Campaign CSV")
+    parser.add_argument("--output", default=None, help="Write the results JSON, e.g. data/processed/bayesian_results.json")
+    parser.add_argument("--hdi-prob", type=float, default=HDI_PROB)
+    parser.add_argument("--draws", type=int, default=N_DRAWS, help="Draws of the spend means and lift HDIs")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.data, usecols=lambda name: name in ("treatment", "conversion", "spend"))
+    group_stats = GroupStats.from_frame(df)
+
+    started = time.perf_counter()
+    results = bayesian_results(group_stats, args.hdi_prob, args.draws)
+    elapsed = time.perf_counter() - started
+
+    posteriors = BetaPosteriors.from_counts(group_stats.n, group_stats.conversions)
+    rates = posteriors.draws(args.draws)
+    lift_hdi = sample_hdi(rates / rates[:, [CONTROL]] - 1, args.hdi_prob)
+    loss = posteriors.expected_loss()
+
+    print(f"{int(group_stats.n.sum()):,} customers, results computed in {elapsed * 1e3:.1f} ms\n")
+    print(f"{'group':<15} {'conversion':>10} {f'HDI {args.hdi_prob:.0%}':>18} {'lift vs control':>24} {'exp. loss':>10}")
+    for g, (key, label) in enumerate(zip(GROUP_KEYS, GROUP_LABELS)):
+        group = results["conversion"][key]
+        hdi = f"[{group['rate_hdi_low']:.4%}, {group['rate_hdi_high']:.4%}]"
+        lift = (
+            f"{group['lift_vs_control']:+.1%} [{lift_hdi[0, g]:+.0%}, {lift_hdi[1, g]:+.0%}]"
+            if g != CONTROL else ""
+        )
+        print(f"{label:<15} {group['rate_mean']:>10.4%} {hdi:>18} {lift:>24} {loss[g]:>10.4%}")
+    print()
+    for name, value in results["conversion"]["comparisons"].items():
+        print(f"{name:<22} {value:.6f}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Sequential Bayesian monitoring of a live campaign.
+
+Events (a customer of a group, whether they converted, and optionally
+their spend) arrive in batches. The monitor keeps the sufficient
+statistics of each group, customers, conversions and the first two
+spend moments, so ingesting a batch is one bincount per statistic and
+memory does not grow with the events. Reports recompute the conjugate
+posteriors from those counts (see conjugate.py):
+P(beats control), P(best) and the expected loss of choosing each group,
+with the recommendation to stop once the leading group is best with
+probability threshold and every group has min_customers customers.
+
+Checking the posterior after every batch and stopping at the first
+crossing is what a live campaign does; P(best) then stays the posterior
+probability, but the frequentist error rate of the stopping rule is
+higher than 1 - threshold.
+
+Usage (replays a campaign CSV in random order):
+    python -m src.bayesian.monitor [--data data/raw/hillstrom.csv]
+        [--batch-size 1000] [--threshold 0.95] [--min-customers 1000]
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from ..api.config import settings
+from ..api.validation import BatchValidationError, decode_json
+from .conjugate import CONTROL, GROUP_KEYS, GROUP_LABELS, BetaPosteriors, GroupStats
+
+N_GROUPS = len(GROUP_KEYS)
+
+
+def _finite(value) -> float | None:
+    """JSON-safe float, None when undefined (e.g. a lift without control conversions)."""
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def group_codes(treatment) -> np.ndarray:
+    """
+    Group index of each event, from treatment labels or group indices.
+
+    Raises:
+        ValueError: if a label or index is unknown
+    """
+    treatment = np.asarray(treatment)
+    if treatment.dtype.kind in "iu":
+        if len(treatment) and (treatment.min() < 0 or treatment.max() >= N_GROUPS):
+            raise ValueError(f"Group indices must be 0 to {N_GROUPS - 1} ({', '.join(GROUP_LABELS)})")
+        return treatment.astype(np.intp)
+
+    labels, codes = np.unique(treatment.astype(str), return_inverse=True)
+    unknown = sorted(set(labels.tolist()) - set(GROUP_LABELS))
+    if unknown:
+        raise ValueError(f"Unknown treatments {unknown}, expected {GROUP_LABELS}")
+    return np.array([GROUP_LABELS.index(label) for label in labels], dtype=np.intp)[codes]
+
+
+class SequentialMonitor:
+    """
+    Running conversion and spend statistics per group, safe to share
+    between threads.
+    """
+
+    def __init__(self, threshold: float = 0.95, min_customers: int = 1000):
+        self.threshold = threshold
+        self.min_customers = min_customers
+        self._lock = threading.Lock()
+        self.reset()
+
+    @classmethod
+    def from_settings(cls) -> "SequentialMonitor":
+        return cls(settings.monitor_threshold, settings.monitor_min_customers)
+
+    def reset(self):
+        """Forget every event."""
+        with self._lock:
+            self._n = np.zeros(N_GROUPS)
+            self._conversions = np.zeros(N_GROUPS)
+            self._spend_n = np.zeros(N_GROUPS)
+            self._spend_sum = np.zeros(N_GROUPS)
+            self._spend_sum_sq = np.zeros(N_GROUPS)
+            self._batches = 0
+            self._started_at = time.time()
+            self._updated_at = None
+
+    @property
+    def events(self) -> int:
+        """Events ingested since the last reset."""
+        with self._lock:
+            return int(self._n.sum())
+
+    def ingest(self, codes, conversion, spend=None) -> int:
+        """
+        Add a batch of events.
+
+        Args:
+            codes: Group index of each event, see group_codes
+            conversion: 0/1 outcome of each event
+            spend: Spend of each event, or None when not tracked
+
+        Returns:
+            Number of events ingested
+
+        Raises:
+            ValueError: if the arrays differ in length or hold invalid values
+        """
+        codes = np.asarray(codes, dtype=np.intp)
+        conversion = np.asarray(conversion, dtype=np.float64)
+        n = len(codes)
+        if conversion.shape != (n,) or (spend is not None and np.shape(spend) != (n,)):
+            raise ValueError("Expected one treatment, conversion and spend per event")
+        if n and (codes.min() < 0 or codes.max() >= N_GROUPS):
+            raise ValueError(f"Group indices must be 0 to {N_GROUPS - 1}")
+        if ((conversion != 0) & (conversion != 1)).any():
+            raise ValueError("Conversions must be 0 or 1")
+
+        counts = np.bincount(codes, minlength=N_GROUPS)
+        conversions = np.bincount(codes, weights=conversion, minlength=N_GROUPS)
+        if spend is not None:
+            spend = np.asarray(spend, dtype=np.float64)
+            if not np.isfinite(spend).all():
+                raise ValueError("Spend must be finite")
+            spend_sum = np.bincount(codes, weights=spend, minlength=N_GROUPS)
+            spend_sum_sq = np.bincount(codes, weights=spend * spend, minlength=N_GROUPS)
+
+        with self._lock:
+            self._n += counts
+            self._conversions += conversions
+            if spend is not None:
+                self._spend_n += counts
+                self._spend_sum += spend_sum
+                self._spend_sum_sq += spend_sum_sq
+            self._batches += 1
+            self._updated_at = time.time()
+        return n
+
+    def ingest_json(self, body: bytes) -> int:
+        """
+        Add the events of a MonitorEvents JSON body.
+
+        Raises:
+            BatchValidationError: with FastAPI-style error locations
+        """
+        content = decode_json(body)
+        if not isinstance(content, dict):
+            raise BatchValidationError([{
+                "type": "model_attributes_type", "loc": ("body",), "msg": "Input should be an object", "input": None
+            }])
+
+        columns = {}
+        for name in ("treatment", "conversion", "spend"):
+            values = content.get(name)
+            if values is None and name != "spend":
+                raise BatchValidationError([{
+                    "type": "missing", "loc": ("body", name), "msg": "Field required", "input": None
+                }])
+            if values is not None and not isinstance(values, list):
+                raise BatchValidationError([{
+                    "type": "list_type", "loc": ("body", name), "msg": "Input should be a valid list", "input": None
+                }])
+            columns[name] = values
+
+        try:
+            codes = group_codes(columns["treatment"])
+            return self.ingest(codes, columns["conversion"], columns["spend"])
+        except (ValueError, TypeError) as e:
+            raise BatchValidationError([{"type": "value_error", "loc": ("body",), "msg": str(e), "input": None}])
+
+    def snapshot(self) -> tuple[GroupStats, GroupStats | None]:
+        """Conversion statistics of every group, and spend statistics once every group has some."""
+        with self._lock:
+            conversion = GroupStats(self._n.copy(), self._conversions.copy())
+            spend = None
+            if (self._spend_n > 1).all():
+                spend = GroupStats(
+                    self._spend_n.copy(), np.zeros(N_GROUPS), self._spend_sum.copy(), self._spend_sum_sq.copy()
+                )
+        return conversion, spend
+
+    def report(self) -> dict:
+        """Posterior summary of every group and the stopping recommendation, see MonitorReport."""
+        with self._lock:
+            batches, started_at, updated_at = self._batches, self._started_at, self._updated_at
+        conversion, spend = self.snapshot()
+
+        posteriors = BetaPosteriors.from_counts(conversion.n, conversion.conversions)
+        mean, hdi = posteriors.mean(), posteriors.hdi()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lift = posteriors.lift_mean()
+        beats_control = posteriors.prob_greater()[:, CONTROL]
+        best, loss = posteriors.prob_best(), posteriors.expected_loss()
+
+        groups = {}
+        for g, (key, label) in enumerate(zip(GROUP_KEYS, GROUP_LABELS)):
+            groups[key] = {
+                "label": label,
+                "customers": int(conversion.n[g]),
+                "conversions": int(conversion.conversions[g]),
+                "rate_mean": float(mean[g]),
+                "rate_hdi_low": float(hdi[0, g]),
+                "rate_hdi_high": float(hdi[1, g]),
+                "lift_vs_control": _finite(lift[g]) if g != CONTROL else None,
+                "p_beats_control": float(beats_control[g]) if g != CONTROL else None,
+                "p_best": float(best[g]),
+                "expected_loss": float(loss[g]),
+                "spend_mean": float(spend.spend_mean()[g]) if spend else None,
+                "spend_sem": float(spend.spend_sem()[g]) if spend else None,
+            }
+
+        leader = int(np.argmax(best))
+        if conversion.n.min() < self.min_customers:
+            reason = f"Waiting for {self.min_customers:,} customers in every group"
+            stop = False
+        elif best[leader] >= self.threshold:
+            reason = f"{GROUP_LABELS[leader]} is best with probability {best[leader]:.4f}"
+            stop = True
+        else:
+            reason = f"No group is best with probability {self.threshold} yet"
+            stop = False
+
+        return {
+            "events": int(conversion.n.sum()),
+            "batches": batches,
+            "started_at": started_at,
+            "updated_at": updated_at,
+            "threshold": self.threshold,
+            "min_customers": self.min_customers,
+            "groups": groups,
+            "leader": GROUP_KEYS[leader],
+            "stop": stop,
+            "reason": reason,
+        }
+
+
+monitor = SequentialMonitor.from_settings()
+
+
+def main():
+    from ..training.crossfit import HILLSTROM_PATH
+
+    parser = argparse.ArgumentParser(description="Replay a campaign through the sequential monitor.")
+    parser.add_argument("--data", default=str(HILLSTROM_PATH), help="Campaign CSV")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Events per ingested batch")
+    parser.add_argument("--threshold", type=float, default=settings.monitor_threshold)
+    parser.add_argument("--min-customers", type=int, default=settings.monitor_min_customers)
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the event order")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.data, usecols=["treatment", "conversion", "spend"])
+    order = np.random.default_rng(args.seed).permutation(len(df))
+    codes = group_codes(df["treatment"].to_numpy())[order]
+    conversion = df["conversion"].to_numpy(dtype=np.float64)[order]
+    spend = df["spend"].to_numpy(dtype=np.float64)[order]
+
+    replay = SequentialMonitor(args.threshold, args.min_customers)
+    started = time.perf_counter()
+    ingested = replay.ingest(codes, conversion, spend)
+    rate = ingested / (time.perf_counter() - started)
+    replay.reset()
+
+    stopped_at = None
+    report_s = []
+    for start in range(0, len(df), args.batch_size):
+        block = slice(start, start + args.batch_size)
+        replay.ingest(codes[block], conversion[block], spend[block])
+        started = time.perf_counter()
+        report = replay.report()
+        report_s.append(time.perf_counter() - started)
+        if report["stop"] and stopped_at is None:
+            stopped_at = report
+            print(f"Stop after {report['events']:,} events: {report['reason']}")
+
+    print(f"Ingestion: {rate / 1e6:.1f}M events/s in one batch")
+    print(f"Report: {np.median(report_s) * 1e3:.1f} ms median over {len(report_s)} batches\n")
+    if stopped_at is None:
+        print(f"No stop after {len(df):,} events: {report['reason']}")
+    print(f"{'group':<15} {'customers':>10} {'conversion':>10} {'P(best)':>9} {'exp. loss':>10}")
+    for group in report["groups"].values():
+        print(
+            f"{group['label']:<15} {group['customers']:>10,} {group['rate_mean']:>10.4%}"
+            f" {group['p_best']:>9.4f} {group['expected_loss']:>10.4%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Off-policy evaluation of treatment policies on randomized campaign data.
+
+Notebook 03 judged the max-CATE policy by the conversion of customers
+whose random treatment happened to match it, against the others. Those
+groups differ in more than the policy, and the comparison has no error
+bars. Here a policy is the treatment code it sends each customer, and
+its value (expected conversion rate if every customer got the policy's
+treatment) is estimated from the randomized campaign:
+
+- IPW: mean of y * 1[T = pi(x)] / e(T), unbiased with the known
+  randomization propensities e (1/3 per treatment in Hillstrom);
+- doubly robust: mean of mu(x, pi(x)) + 1[T = pi(x)] * (y - mu(x, T)) / e(T),
+  with cross-fitted outcome models mu, unbiased as well and of lower
+  variance when mu is any good.
+
+Standard errors come from the per-customer terms, and the lift over
+sending no email is estimated on the same customers (paired). Policies
+are evaluated as a (n_policies, n_customers) matrix of treatment codes,
+so hundreds of thresholds or budgets take one vectorized pass.
+
+Picking the best of many policies and reading its estimate is
+optimistic, and so is evaluating CATE models on the customers they were
+trained on (the served models were fitted on all of Hillstrom).
+
+Usage:
+    python -m src.evaluation.off_policy [--data data/raw/hillstrom.csv]
+        [--thresholds 200] [--budgets 100] [--folds 5] [--output results.json]
+"""
+import argparse
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import StratifiedKFold
+
+from ..api.models import TREATMENT_ARMS
+from ..training.xlearner import XLearnerConfig, positive_proba
+from .uplift import arm_codes
+
+# Treatment codes: the index of each arm, then the control group
+N_TREATMENTS = len(TREATMENT_ARMS) + 1
+CONTROL = len(TREATMENT_ARMS)
+
+# Hillstrom randomized customers uniformly over the treatments
+RANDOMIZED_PROPENSITY = np.full(N_TREATMENTS, 1 / N_TREATMENTS)
+
+# Policy-customer cells per chunk of the vectorized evaluation
+CHUNK_CELLS = 4_000_000
+
+
+def outcome_predictions(
+    X: np.ndarray, codes: np.ndarray, y: np.ndarray, n_folds: int = 5,
+    config: XLearnerConfig | None = None
+) -> np.ndarray:
+    """
+    Cross-fitted P(y = 1 | x, t) of every customer under every treatment.
+
+    Each fold is predicted by one classifier per treatment fitted on the
+    customers of that treatment in the other folds.
+
+    Args:
+        X: Features
+        codes: Treatment code received by each customer
+        y: Binary outcome
+        n_folds: Cross-fitting folds
+        config: Hyperparameters of the forests
+
+    Returns:
+        Array of shape (n_customers, N_TREATMENTS)
+    """
+    config = config or XLearnerConfig()
+    mu = np.empty((len(y), N_TREATMENTS))
+    splitter = StratifiedKFold(n_folds, shuffle=True, random_state=config.random_state)
+    for train, test in splitter.split(X, codes):
+        for code in range(N_TREATMENTS):
+            rows = train[codes[train] == code]
+            model = RandomForestClassifier(**config.forest_params()).fit(X[rows], y[rows])
+            mu[test, code] = positive_proba(model, X[test])
+    return mu
+
+
+@dataclass(frozen=True)
+class PolicyEstimates:
+    """
+    Value estimates of a batch of policies, one entry per policy.
+
+    Values are conversion rates over the whole population, lifts are
+    the difference with sending no email, *_se their standard errors.
+    """
+    names: list
+    emailed: np.ndarray
+    ipw: np.ndarray
+    ipw_se: np.ndarray
+    ipw_lift: np.ndarray
+    ipw_lift_se: np.ndarray
+    dr: np.ndarray | None = None
+    dr_se: np.ndarray | None = None
+    dr_lift: np.ndarray | None = None
+    dr_lift_se: np.ndarray | None = None
+
+    def to_frame(self) -> pd.DataFrame:
+        """One row per policy, indexed by name."""
+        columns = {
+            name: value for name, value in vars(self).items()
+            if name != "names" and value is not None
+        }
+        return pd.DataFrame(columns, index=pd.Index(self.names, name="policy"))
+
+
+def _mean_se(terms: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Mean of per-customer terms along the last axis and its standard error."""
+    n = terms.shape[-1]
+    return terms.mean(axis=-1), terms.std(axis=-1, ddof=1) / np.sqrt(n)
+
+
+def evaluate_policies(
+    assignments,
+    codes,
+    y,
+    mu: np.ndarray | None = None,
+    propensity=RANDOMIZED_PROPENSITY,
+    names=None
+) -> PolicyEstimates:
+    """
+    IPW and doubly robust values of a batch of policies.
+
+    Args:
+        assignments: Treatment code sent to each customer by each
+            policy, shape (n_policies, n_customers)
+        codes: Treatment code received by each customer
+        y: Outcome of each customer
+        mu: Outcome predictions of shape (n_customers, N_TREATMENTS),
+            see outcome_predictions. Without them only IPW is estimated.
+        propensity: Probability of each treatment code in the campaign
+        names: Name of each policy, defaults to its index
+
+    Returns:
+        PolicyEstimates
+    """
+    assignments = np.atleast_2d(np.asarray(assignments))
+    codes = np.asarray(codes)
+    y = np.asarray(y, dtype=np.float64)
+    n_policies, n = assignments.shape
+    if codes.shape != (n,) or y.shape != (n,):
+        raise ValueError(f"Expected {n} treatment codes and outcomes, one per customer")
+    if assignments.min() < 0 or assignments.max() >= N_TREATMENTS:
+        raise ValueError(f"Policies must assign treatment codes 0 to {N_TREATMENTS - 1}")
+
+    inverse_propensity = 1 / np.asarray(propensity, dtype=np.float64)[codes]
+    ipw_weight = y * inverse_propensity
+    ipw_base = np.where(codes == CONTROL, ipw_weight, 0.0)
+    if mu is not None:
+        residual = (y - mu[np.arange(n), codes]) * inverse_propensity
+        dr_base = mu[:, CONTROL] + np.where(codes == CONTROL, residual, 0.0)
+
+    fields = ["ipw", "ipw_se", "ipw_lift", "ipw_lift_se"]
+    if mu is not None:
+        fields += ["dr", "dr_se", "dr_lift", "dr_lift_se"]
+    out = {field: np.empty(n_policies) for field in fields}
+    emailed = np.empty(n_policies)
+
+    chunk = max(1, CHUNK_CELLS // n)
+    for start in range(0, n_policies, chunk):
+        block = slice(start, start + chunk)
+        policy = assignments[block]
+        match = policy == codes
+        emailed[block] = (policy != CONTROL).mean(axis=1)
+
+        ipw = np.where(match, ipw_weight, 0.0)
+        out["ipw"][block], out["ipw_se"][block] = _mean_se(ipw)
+        out["ipw_lift"][block], out["ipw_lift_se"][block] = _mean_se(ipw - ipw_base)
+        if mu is not None:
+            dr = mu[np.arange(n), policy]
+            dr += np.where(match, residual, 0.0)
+            out["dr"][block], out["dr_se"][block] = _mean_se(dr)
+            out["dr_lift"][block], out["dr_lift_se"][block] = _mean_se(dr - dr_base)
+
+    names = list(names) if names is not None else [str(i) for i in range(n_policies)]
+    return PolicyEstimates(names, emailed, **out)
+
+
+def evaluate_policy(policy, X, codes, y, mu=None, propensity=RANDOMIZED_PROPENSITY, names=None) -> PolicyEstimates:
+    """
+    Estimate the value of a policy function.
+
+    Args:
+        policy: Function of the encoded features X returning the
+            treatment code of each customer, shape (n_customers,), or of
+            several policies, shape (n_policies, n_customers)
+        X: Encoded features, see preprocess_columns
+
+    See evaluate_policies for the other arguments.
+    """
+    return evaluate_policies(policy(X), codes, y, mu, propensity, names)
+
+
+def constant_policies() -> tuple[list, list]:
+    """Names and codes of the policies sending everybody the same treatment."""
+    names = [f"all {arm.name}" for arm in TREATMENT_ARMS] + ["no email"]
+    return names, list(range(N_TREATMENTS))
+
+
+def threshold_policies(cate: np.ndarray, thresholds) -> np.ndarray:
+    """
+    Send the best arm to customers whose best CATE exceeds each threshold.
+
+    The API recommendation is the threshold 0.
+
+    Returns:
+        Treatment codes of shape (len(thresholds), n_customers)
+    """
+    best = cate.argmax(axis=1)
+    best_cate = cate.max(axis=1)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    return np.where(best_cate > thresholds[:, None], best, CONTROL).astype(np.int8)
+
+
+def budget_policies(cate: np.ndarray, fractions) -> np.ndarray:
+    """
+    Send the best arm to the given fraction of customers of highest best CATE.
+
+    Returns:
+        Treatment codes of shape (len(fractions), n_customers)
+    """
+    n = len(cate)
+    rank = np.empty(n, dtype=np.intp)
+    rank[np.argsort(-cate.max(axis=1), kind="stable")] = np.arange(n)
+    quota = np.round(np.asarray(fractions, dtype=np.float64) * n)
+    return np.where(rank < quota[:, None], cate.argmax(axis=1), CONTROL).astype(np.int8)
+
+
+def main():
+    from ..api.models import cate_models
+    from ..training.crossfit import HILLSTROM_PATH
+    from ..training.data import load_campaign
+
+    parser = argparse.ArgumentParser(description="IPW and doubly robust values of targeting policies.")
+    parser.add_argument("--data", default=str(HILLSTROM_PATH), help="Campaign CSV")
+    parser.add_argument("--thresholds", type=int, default=200, help="Number of CATE thresholds")
+    parser.add_argument("--budgets", type=int, default=100, help="Number of budget fractions")
+    parser.add_argument("--folds", type=int, default=5, help="Cross-fitting folds of the outcome models")
+    parser.add_argument("--n-estimators", type=int, default=XLearnerConfig.n_estimators)
+    parser.add_argument("--output", default=None, help="Write every estimate to this JSON file")
+    args = parser.parse_args()
+
+    batch = load_campaign(args.data)
+    codes = arm_codes(batch.treatment)
+    cate = cate_models.predict_matrix(batch.X)
+    mu = outcome_predictions(
+        batch.X, codes, batch.y, args.folds, XLearnerConfig(n_estimators=args.n_estimators)
+    )
+
+    names, constant = constant_policies()
+    thresholds = np.quantile(cate.max(axis=1), np.linspace(0, 1, args.thresholds))
+    fractions = np.linspace(0, 1, args.budgets + 1)[1:]
+    assignments = np.vstack([
+        np.repeat(np.array(constant, dtype=np.int8)[:, None], len(batch), axis=1),
+        threshold_policies(cate, [0.0]),
+        threshold_policies(cate, thresholds),
+        budget_policies(cate, fractions),
+    ])
+    names += (
+        ["max CATE"]
+        + [f"CATE > {t:.5f}" for t in thresholds]
+        + [f"top {f:.0%}" for f in fractions]
+    )
+
+    # Notebook 03: conversion of customers who received the max-CATE treatment
+    matched = threshold_policies(cate, [0.0])[0] == codes
+    print(
+        f"Matched vs unmatched conversion (notebook 03): "
+        f"{batch.y[matched].mean():.4f} vs {batch.y[~matched].mean():.4f}"
+    )
+
+    estimates = evaluate_policies(assignments, codes, batch.y, mu, names=names).to_frame()
+    grid = estimates.iloc[len(constant) + 1:]
+    shown = pd.concat([
+        estimates.iloc[:len(constant) + 1],
+        grid.loc[[grid["dr"].idxmax()]],
+    ])
+    print(f"{len(estimates)} policies evaluated, with 95% intervals\n")
+    print(f"{'policy':<20} {'emailed':>8} {'IPW':>16} {'DR':>16} {'DR lift vs no email':>22}")
+    for name, row in shown.iterrows():
+        print(
+            f"{name:<20} {row['emailed']:>8.1%} {row['ipw']:>8.4f} ±{1.96 * row['ipw_se']:.4f}"
+            f" {row['dr']:>8.4f} ±{1.96 * row['dr_se']:.4f} {row['dr_lift']:>+13.4f} ±{1.96 * row['dr_lift_se']:.4f}"
+        )
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(estimates.reset_index().to_dict("records"), indent=2) + "\n")
+        print(f"\nEstimates written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
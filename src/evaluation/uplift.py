@@ -0,0 +1,435 @@
+"""
+Uplift metrics of CATE scores on randomized campaign data.
+
+Replaces the compute_qini_curve and compute_gain_curve of notebook 03.
+Customers are ranked by score once, and every curve is a cumulative sum
+over the ranking, evaluated at the ends of groups of tied scores (a tie
+group is targeted all at once, which is the average over the orders in
+which ties could be broken). Customers may carry sample weights.
+
+- Qini curve: treated conversions among the targeted customers minus
+  control conversions rescaled to the treated count.
+- Cumulative gain: uplift of the targeted customers (treated minus
+  control conversion rate) times their number. AUUC is its area.
+- Policy value, for several arms: conversion rate of the policy that
+  sends each of the top customers their best arm and no email to the
+  others, estimated by inverse propensity weighting.
+
+Bootstrap bands resample customers with batches of index matrices, and
+reduce every replicate to the same ranking segments with one bincount
+per statistic, instead of looping over replicates.
+
+Usage:
+    python -m src.evaluation.uplift [--predictions models/training/crossfit.npz]
+        [--bootstrap 1000] [--points 100]
+"""
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from ..api.models import NO_TREATMENT, TREATMENT_ARMS
+
+# Resampled rows per batch of bootstrap replicates, bounds the memory
+# of the index matrices (8 bytes per row)
+BOOTSTRAP_BATCH_ROWS = 4_000_000
+
+# numpy < 2.0 only has the old name of np.trapezoid
+_trapezoid = getattr(np, "trapezoid", None) or np.trapz
+
+
+def _weights(weight, n: int) -> np.ndarray:
+    if weight is None:
+        return np.ones(n)
+    weight = np.asarray(weight, dtype=np.float64)
+    if weight.shape != (n,) or (weight < 0).any():
+        raise ValueError("Weights must be non-negative, one per customer")
+    return weight
+
+
+def _rank(score: np.ndarray, n_points: int | None, cuts=()) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Rank by decreasing score and find the ends of the curve segments.
+
+    Args:
+        score: Score of each customer
+        n_points: Maximum number of segments, None for every tie group
+        cuts: Scores whose boundary is always kept, e.g. 0
+
+    Returns:
+        Tuple of (order, ends): the ranking, and the exclusive end
+        position of each segment, the last one being len(score)
+    """
+    score = np.asarray(score, dtype=np.float64)
+    if np.isnan(score).any():
+        raise ValueError("Scores must not be NaN")
+    order = np.argsort(-score, kind="stable")
+    ranked = score[order]
+    ends = np.append(np.flatnonzero(ranked[1:] != ranked[:-1]) + 1, len(score))
+    if n_points is not None and len(ends) > n_points:
+        targets = np.linspace(0, len(score), n_points + 1)[1:]
+        # Number of customers scored above each cut, always a tie group end
+        cut_ends = np.array([end for end in ((score > cut).sum() for cut in cuts) if end > 0], dtype=np.intp)
+        ends = np.union1d(ends[np.searchsorted(ends, targets)], cut_ends)
+    return order, ends
+
+
+def _segment_sums(stats: np.ndarray, order: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Cumulative sums of stats (n, m) at 0 and each segment end, shape (P + 1, m)."""
+    starts = np.concatenate([[0], ends[:-1]])
+    sums = np.add.reduceat(stats[order], starts, axis=0)
+    return np.concatenate([np.zeros((1, stats.shape[1])), np.cumsum(sums, axis=0)])
+
+
+def _bootstrap_sums(
+    stats: np.ndarray, order: np.ndarray, ends: np.ndarray, n_boot: int, seed: int | None
+) -> np.ndarray:
+    """
+    Cumulative segment sums of stats in bootstrap resamples of the rows.
+
+    Returns:
+        Array of shape (n_boot, P + 1, m)
+    """
+    n, m = stats.shape
+    n_segments = len(ends)
+    segment = np.empty(n, dtype=np.intp)
+    segment[order] = np.searchsorted(ends, np.arange(n), side="right")
+
+    rng = np.random.default_rng(seed)
+    batch = max(1, BOOTSTRAP_BATCH_ROWS // max(n, 1))
+    out = np.zeros((n_boot, n_segments + 1, m))
+    for start in range(0, n_boot, batch):
+        size = min(batch, n_boot - start)
+        index = rng.integers(0, n, size=(size, n))
+        bins = (segment[index] + n_segments * np.arange(size)[:, None]).ravel()
+        for j in range(m):
+            sums = np.bincount(bins, weights=stats[index, j].ravel(), minlength=size * n_segments)
+            out[start:start + size, 1:, j] = np.cumsum(sums.reshape(size, n_segments), axis=1)
+    return out
+
+
+def _area(fraction: np.ndarray, curve: np.ndarray) -> np.ndarray:
+    """Trapezoidal area under curve(s), along the last axis."""
+    return _trapezoid(curve, fraction, axis=-1)
+
+
+def _interval(samples: np.ndarray, alpha: float) -> np.ndarray:
+    return np.quantile(samples, [alpha / 2, 1 - alpha / 2], axis=0)
+
+
+@dataclass(frozen=True)
+class UpliftCurve:
+    """
+    Qini and cumulative gain of customers targeted by decreasing score.
+
+    Attributes:
+        fraction: Weighted share of customers targeted, from 0 to 1
+        qini: Treated conversions minus control conversions rescaled
+            to the treated count, among the targeted customers
+        gain: Uplift of the targeted customers times their weight
+    """
+    fraction: np.ndarray
+    qini: np.ndarray
+    gain: np.ndarray
+
+    @classmethod
+    def from_sums(cls, sums: np.ndarray) -> "UpliftCurve":
+        """Curves from cumulative (n_t, n_c, y_t, y_c) sums, shape (..., P + 1, 4)."""
+        n_t, n_c, y_t, y_c = np.moveaxis(sums, -1, 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            qini = np.where(n_c > 0, y_t - y_c * n_t / n_c, 0.0)
+            gain = np.where((n_t > 0) & (n_c > 0), (y_t / n_t - y_c / n_c) * (n_t + n_c), 0.0)
+        total = n_t + n_c
+        return cls(total / total[..., -1:], qini, gain)
+
+    def metrics(self) -> dict:
+        """
+        Areas under the curves, over the targeted fraction.
+
+        Returns:
+            Dict with "qini_auc", "qini_coefficient" (area between the
+            Qini curve and random targeting), "auuc" (area under the
+            gain curve) and "auuc_coefficient" (the same against random
+            targeting), floats or arrays for batched curves
+        """
+        qini_auc = _area(self.fraction, self.qini)
+        auuc = _area(self.fraction, self.gain)
+        return {
+            "qini_auc": qini_auc,
+            "qini_coefficient": qini_auc - self.qini[..., -1] / 2,
+            "auuc": auuc,
+            "auuc_coefficient": auuc - self.gain[..., -1] / 2,
+        }
+
+
+@dataclass(frozen=True)
+class PolicyCurve:
+    """
+    Value of targeting the top customers with their best arm.
+
+    Attributes:
+        fraction: Weighted share of customers targeted, from 0 to 1
+        value: Estimated conversion rate of the whole population when
+            the targeted customers get their best arm and the others no
+            email
+        positive_index: Point of the customers whose best CATE is
+            positive, those the max-CATE policy of the API emails
+    """
+    fraction: np.ndarray
+    value: np.ndarray
+    positive_index: int
+
+    @classmethod
+    def from_sums(cls, sums: np.ndarray, positive_index: int) -> "PolicyCurve":
+        """Curve from cumulative (w, control value, value change) sums, shape (..., P + 1, 3)."""
+        w, control, change = np.moveaxis(sums, -1, 0)
+        total = w[..., -1:]
+        return cls(w / total, (control[..., -1:] + change) / total, positive_index)
+
+    def metrics(self) -> dict:
+        """
+        Value of the policies, floats or arrays for batched curves.
+
+        Returns:
+            Dict with "no_email" (value with nobody targeted), "all_best"
+            (everybody gets their best arm), "max_cate" (customers with
+            a positive best CATE get it) and "max_cate_lift" (the
+            latter minus no email)
+        """
+        index = self.positive_index
+        return {
+            "no_email": self.value[..., 0],
+            "all_best": self.value[..., -1],
+            "max_cate": self.value[..., index],
+            "max_cate_lift": self.value[..., index] - self.value[..., 0],
+        }
+
+
+def _uplift_stats(y, treated, weight) -> np.ndarray:
+    y = np.asarray(y, dtype=np.float64)
+    treated = np.asarray(treated, dtype=bool)
+    w = _weights(weight, len(y))
+    return np.column_stack([w * treated, w * ~treated, w * y * treated, w * y * ~treated])
+
+
+def uplift_curve(y, treated, score, weight=None, n_points: int | None = None) -> UpliftCurve:
+    """
+    Qini and gain curves of one arm against the control group.
+
+    Args:
+        y: Outcome of each customer
+        treated: Boolean, True for customers of the arm, False for control
+        score: CATE score ranking the customers
+        weight: Optional sample weights
+        n_points: Maximum number of points, None for every tie group
+
+    Returns:
+        UpliftCurve
+    """
+    order, ends = _rank(score, n_points)
+    return UpliftCurve.from_sums(_segment_sums(_uplift_stats(y, treated, weight), order, ends))
+
+
+def _policy_inputs(y, codes, cate, weight, propensity) -> tuple[np.ndarray, np.ndarray]:
+    """Per-customer policy statistics, and the best CATE ranking them."""
+    y = np.asarray(y, dtype=np.float64)
+    codes = np.asarray(codes)
+    cate = np.asarray(cate, dtype=np.float64)
+    n_arms = cate.shape[1]
+    w = _weights(weight, len(y))
+    if propensity is None:
+        propensity = np.bincount(codes, weights=w, minlength=n_arms + 1) / w.sum()
+    propensity = np.asarray(propensity, dtype=np.float64)
+
+    best = cate.argmax(axis=1)
+    ipw = w * y / propensity[codes]
+    control = np.where(codes == n_arms, ipw, 0.0)
+    # Targeting a customer swaps the control term for that of their best arm
+    change = np.where(codes == best, ipw, 0.0) - control
+    return np.column_stack([w, control, change]), cate.max(axis=1)
+
+
+def _positive_index(best_cate: np.ndarray, ends: np.ndarray) -> int:
+    """Curve point after the customers of positive best CATE, see _rank cuts."""
+    return int(np.searchsorted(ends, (best_cate > 0).sum())) + 1 if (best_cate > 0).any() else 0
+
+
+def policy_curve(
+    y, codes, cate, weight=None, propensity=None, n_points: int | None = None
+) -> PolicyCurve:
+    """
+    IPW value of targeting the customers of highest best CATE.
+
+    Args:
+        y: Outcome of each customer
+        codes: Treatment received, the index of the arm in the columns
+            of cate, n_arms for the control group
+        cate: CATE matrix of shape (n_customers, n_arms)
+        weight: Optional sample weights
+        propensity: Probability of each treatment code, defaults to the
+            observed (weighted) shares, 1/3 each in Hillstrom
+        n_points: Maximum number of points, None for every tie group
+
+    Returns:
+        PolicyCurve
+    """
+    stats, best_cate = _policy_inputs(y, codes, cate, weight, propensity)
+    order, ends = _rank(best_cate, n_points, cuts=(0.0,))
+    return PolicyCurve.from_sums(_segment_sums(stats, order, ends), _positive_index(best_cate, ends))
+
+
+@dataclass(frozen=True)
+class Bootstrap:
+    """
+    Point estimate and bootstrap confidence intervals of a curve.
+
+    Attributes:
+        curve: UpliftCurve or PolicyCurve of the data
+        bands: Curve name -> (low, high) arrays at the points of curve
+        intervals: Metric name -> (estimate, low, high)
+        n_boot: Number of bootstrap replicates
+    """
+    curve: UpliftCurve | PolicyCurve
+    bands: dict
+    intervals: dict
+    n_boot: int
+
+
+def _bootstrap(curve, replicates, names: tuple, alpha: float, n_boot: int) -> Bootstrap:
+    point, samples = curve.metrics(), replicates.metrics()
+    return Bootstrap(
+        curve=curve,
+        bands={name: _interval(getattr(replicates, name), alpha) for name in names},
+        intervals={
+            name: (float(point[name]), *map(float, _interval(samples[name], alpha)))
+            for name in point
+        },
+        n_boot=n_boot,
+    )
+
+
+def bootstrap_uplift(
+    y, treated, score, weight=None, n_boot: int = 1000, n_points: int = 100,
+    alpha: float = 0.05, seed: int | None = 0
+) -> Bootstrap:
+    """
+    Bootstrap confidence bands of the Qini and gain curves of one arm.
+
+    The ranking is that of the full data, each replicate resamples the
+    customers. See uplift_curve for the arguments.
+
+    Args:
+        n_boot: Number of bootstrap replicates
+        n_points: Points of the curves and bands
+        alpha: 1 - confidence level of the intervals
+        seed: Seed of the resampling
+
+    Returns:
+        Bootstrap with "qini" and "gain" bands
+    """
+    stats = _uplift_stats(y, treated, weight)
+    order, ends = _rank(score, n_points)
+    curve = UpliftCurve.from_sums(_segment_sums(stats, order, ends))
+    replicates = UpliftCurve.from_sums(_bootstrap_sums(stats, order, ends, n_boot, seed))
+    return _bootstrap(curve, replicates, ("qini", "gain"), alpha, n_boot)
+
+
+def bootstrap_policy(
+    y, codes, cate, weight=None, propensity=None, n_boot: int = 1000, n_points: int = 100,
+    alpha: float = 0.05, seed: int | None = 0
+) -> Bootstrap:
+    """
+    Bootstrap confidence bands of the policy value curve.
+
+    See policy_curve and bootstrap_uplift for the arguments.
+
+    Returns:
+        Bootstrap with "value" bands
+    """
+    stats, best_cate = _policy_inputs(y, codes, cate, weight, propensity)
+    order, ends = _rank(best_cate, n_points, cuts=(0.0,))
+    positive = _positive_index(best_cate, ends)
+    curve = PolicyCurve.from_sums(_segment_sums(stats, order, ends), positive)
+    replicates = PolicyCurve.from_sums(_bootstrap_sums(stats, order, ends, n_boot, seed), positive)
+    return _bootstrap(curve, replicates, ("value",), alpha, n_boot)
+
+
+def arm_codes(treatment) -> np.ndarray:
+    """Treatment codes of treatment labels: the arm index, len(TREATMENT_ARMS) for control."""
+    labels = [arm.label for arm in TREATMENT_ARMS] + [NO_TREATMENT]
+    treatment = np.asarray(treatment)
+    codes = np.full(len(treatment), -1, dtype=np.intp)
+    for code, label in enumerate(labels):
+        codes[treatment == label] = code
+    if (codes < 0).any():
+        raise ValueError(f"Unknown treatments {sorted(set(treatment[codes < 0]))}, expected {labels}")
+    return codes
+
+
+def _served_predictions(data_path) -> dict:
+    """In-sample CATE of the served models on a campaign CSV."""
+    from ..api.models import cate_models
+    from ..training.data import load_campaign
+
+    batch = load_campaign(data_path)
+    cate = cate_models.predict_matrix(batch.X)
+    return {
+        "treatment": batch.treatment,
+        "y": batch.y,
+        **{f"{arm.name}_served": cate[:, a] for a, arm in enumerate(TREATMENT_ARMS)},
+    }
+
+
+def main():
+    from ..training.crossfit import HILLSTROM_PATH
+
+    parser = argparse.ArgumentParser(description="Qini, AUUC and policy value of CATE predictions.")
+    parser.add_argument(
+        "--predictions", default=None,
+        help="npz of src.training.crossfit, default: the served models scored on --data"
+    )
+    parser.add_argument("--data", default=str(HILLSTROM_PATH), help="Campaign CSV")
+    parser.add_argument("--bootstrap", type=int, default=1000, help="Bootstrap replicates")
+    parser.add_argument("--points", type=int, default=100, help="Points of the curves")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    args = parser.parse_args()
+
+    if args.predictions:
+        predictions = dict(np.load(Path(args.predictions)))
+    else:
+        predictions = _served_predictions(args.data)
+    codes = arm_codes(predictions["treatment"])
+    y = predictions["y"]
+    n_arms = len(TREATMENT_ARMS)
+    learners = sorted({
+        key.split("_", 1)[1] for key in predictions if key.startswith(f"{TREATMENT_ARMS[0].name}_")
+    })
+
+    level = f"{1 - args.alpha:.0%}"
+    print(f"{'arm':<8} {'learner':<8} {'metric':<18} {'estimate':>10}  {level} interval")
+    for learner in learners:
+        for a, arm in enumerate(TREATMENT_ARMS):
+            score = predictions[f"{arm.name}_{learner}"]
+            rows = np.isin(codes, (a, n_arms)) & ~np.isnan(score)
+            result = bootstrap_uplift(
+                y[rows], codes[rows] == a, score[rows],
+                n_boot=args.bootstrap, n_points=args.points, alpha=args.alpha
+            )
+            for name, (estimate, low, high) in result.intervals.items():
+                print(f"{arm.name:<8} {learner:<8} {name:<18} {estimate:>10.3f}  [{low:.3f}, {high:.3f}]")
+
+        cate = np.column_stack([predictions[f"{arm.name}_{learner}"] for arm in TREATMENT_ARMS])
+        if np.isnan(cate).any():
+            # Out-of-fold CATE only exists for the arm each customer was in
+            continue
+        result = bootstrap_policy(
+            y, codes, cate, propensity=np.full(n_arms + 1, 1 / (n_arms + 1)),
+            n_boot=args.bootstrap, n_points=args.points, alpha=args.alpha
+        )
+        for name, (estimate, low, high) in result.intervals.items():
+            print(f"{'policy':<8} {learner:<8} {name:<18} {estimate:>10.5f}  [{low:.5f}, {high:.5f}]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Parallel cross-fitting of the meta-learners of notebook 03.
+
+Every (treatment arm, learner, fold) combination is an independent task:
+fit the S-, T- or X-learner of the arm on the other folds and estimate
+the CATE of the held-out fold. Tasks run in a process pool whose workers
+map one shared, read-only copy of the encoded campaign instead of each
+receiving the data, so memory and start-up cost do not grow with the
+number of workers. The result holds the out-of-fold CATE of every arm
+and learner, and the wall time of every task.
+
+Usage:
+    python -m src.training.crossfit [--data data/raw/hillstrom.csv] [--folds 5]
+        [--learners s t x] [--processes 8] [--output models/training/crossfit.npz]
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import StratifiedKFold
+
+from ..api.models import MODELS_DIR, NO_TREATMENT, TREATMENT_ARMS
+from .data import DEFAULT_OUTCOME, CampaignBatch, load_campaign
+from .pipeline import TRAINING_DIR
+from .xlearner import EffectModels, OutcomeModels, XLearnerConfig, positive_proba, predict_cate
+
+HILLSTROM_PATH = MODELS_DIR.parent / "data" / "raw" / "hillstrom.csv"
+
+LEARNERS = ("s", "t", "x")
+
+
+class SharedArrays:
+    """
+    NumPy arrays in shared memory, attachable by name from other processes.
+
+    Attributes:
+        arrays: The arrays, as views of the shared memory blocks
+        spec: Picklable description used by `attach`
+    """
+
+    def __init__(self, blocks: dict, spec: dict):
+        self._blocks = blocks
+        self.spec = spec
+        self.arrays = {
+            name: np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf)
+            for name, (_, shape, dtype) in spec.items()
+        }
+
+    @classmethod
+    def create(cls, arrays: dict) -> "SharedArrays":
+        """Copy arrays into new shared memory blocks."""
+        blocks, spec = {}, {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            blocks[name] = block
+            spec[name] = (block.name, array.shape, array.dtype.str)
+        shared = cls(blocks, spec)
+        for array in shared.arrays.values():
+            array.flags.writeable = False
+        return shared
+
+    @classmethod
+    def attach(cls, spec: dict) -> "SharedArrays":
+        """Map the blocks created by another process, read-only."""
+        blocks = {}
+        for name, (block_name, _, _) in spec.items():
+            blocks[name] = shared_memory.SharedMemory(name=block_name)
+            # Only the creating process owns the block: without this the
+            # resource tracker unlinks it when a worker exits (Python < 3.13)
+            resource_tracker.unregister(blocks[name]._name, "shared_memory")
+        shared = cls(blocks, spec)
+        for array in shared.arrays.values():
+            array.flags.writeable = False
+        return shared
+
+    def close(self):
+        self.arrays = {}
+        for block in self._blocks.values():
+            block.close()
+
+    def unlink(self):
+        """Close and free the blocks, in the creating process."""
+        self.close()
+        for block in self._blocks.values():
+            block.unlink()
+
+
+# Data of the worker processes, see _init_worker
+_shared = None
+
+
+def _init_worker(spec: dict):
+    """Map the shared campaign once per worker process."""
+    global _shared
+    _shared = SharedArrays.attach(spec)
+
+
+def fit_fold(learner: str, X: np.ndarray, treated: np.ndarray, y: np.ndarray,
+             X_test: np.ndarray, config: XLearnerConfig) -> np.ndarray:
+    """
+    Fit a meta-learner on one arm and estimate the CATE of held-out rows.
+
+    Args:
+        learner: "s", "t" or "x"
+        X: Training features of the arm and control customers
+        treated: Boolean mask of the training customers who got the arm
+        y: Binary training outcome
+        X_test: Features of the held-out customers
+        config: Hyperparameters of the forests
+
+    Returns:
+        CATE of X_test
+    """
+    if learner == "s":
+        model = RandomForestClassifier(**config.forest_params()).fit(
+            np.column_stack([X, treated]), y
+        )
+        return (
+            positive_proba(model, np.column_stack([X_test, np.ones(len(X_test))]))
+            - positive_proba(model, np.column_stack([X_test, np.zeros(len(X_test))]))
+        )
+    if learner == "t":
+        control = RandomForestClassifier(**config.forest_params()).fit(X[~treated], y[~treated])
+        treated_model = RandomForestClassifier(**config.forest_params()).fit(X[treated], y[treated])
+        return positive_proba(treated_model, X_test) - positive_proba(control, X_test)
+    if learner == "x":
+        outcomes = OutcomeModels.fit(X, treated, y, config)
+        effects = EffectModels.fit(X, treated, y, [outcomes], config)
+        return predict_cate([outcomes], [effects], X_test)
+    raise ValueError(f"Unknown learner {learner!r}, expected one of {LEARNERS}")
+
+
+def _run_task(arm_index: int, learner: str, fold: int, config: XLearnerConfig) -> dict:
+    """Fit one (arm, learner, fold) task on the shared campaign."""
+    started = time.perf_counter()
+    data = _shared.arrays
+    folds = data["folds"][arm_index]
+    train = np.flatnonzero((folds >= 0) & (folds != fold))
+    test = np.flatnonzero(folds == fold)
+    treated = data["treatment"] == arm_index
+
+    cate = fit_fold(learner, data["X"][train], treated[train], data["y"][train], data["X"][test], config)
+    return {
+        "arm": TREATMENT_ARMS[arm_index].name,
+        "learner": learner,
+        "fold": fold,
+        "train_rows": len(train),
+        "test_rows": len(test),
+        "rows": test,
+        "cate": cate,
+        "seconds": time.perf_counter() - started,
+        "pid": os.getpid(),
+    }
+
+
+def assign_folds(batch: CampaignBatch, n_folds: int, random_state: int) -> np.ndarray:
+    """
+    Fold of every customer for each arm, stratified by treatment.
+
+    Returns:
+        Array of shape (n_arms, n_customers), -1 for customers outside
+        the arm and its control group
+    """
+    folds = np.full((len(TREATMENT_ARMS), len(batch)), -1, dtype=np.int8)
+    for a, arm in enumerate(TREATMENT_ARMS):
+        rows = batch.arm_rows(arm)
+        splitter = StratifiedKFold(n_folds, shuffle=True, random_state=random_state)
+        for fold, (_, test) in enumerate(splitter.split(rows, batch.treatment[rows] == arm.label)):
+            folds[a, rows[test]] = fold
+    return folds
+
+
+def cross_fit(
+    batch: CampaignBatch,
+    n_folds: int = 5,
+    learners=LEARNERS,
+    processes: int | None = None,
+    config: XLearnerConfig | None = None
+) -> dict:
+    """
+    Out-of-fold CATE of every arm and learner, fitted in parallel.
+
+    Args:
+        batch: Encoded campaign
+        n_folds: Number of cross-fitting folds
+        learners: Meta-learners to fit, among LEARNERS
+        processes: Worker processes, defaults to the CPU count. 0 runs
+            the tasks one after the other in this process.
+        config: Hyperparameters of the forests
+
+    Returns:
+        Dict with "cate" (arm_learner -> CATE array over all customers,
+        NaN outside the arm and its control group), "tasks" (timing of
+        every task) and "wall_s"
+    """
+    config = config or XLearnerConfig()
+    processes = os.cpu_count() if processes is None else processes
+    labels = [arm.label for arm in TREATMENT_ARMS] + [NO_TREATMENT]
+    shared = SharedArrays.create({
+        "X": batch.X,
+        "y": batch.y,
+        "treatment": np.array([labels.index(t) for t in batch.treatment], dtype=np.int8),
+        "folds": assign_folds(batch, n_folds, config.random_state),
+    })
+
+    tasks = [
+        (a, learner, fold, config)
+        for a in range(len(TREATMENT_ARMS))
+        for learner in learners
+        for fold in range(n_folds)
+    ]
+    started = time.perf_counter()
+    try:
+        if processes:
+            # Longest tasks (X-learners) first, to keep every worker busy
+            tasks.sort(key=lambda task: LEARNERS.index(task[1]), reverse=True)
+            with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(shared.spec,)) as pool:
+                results = list(pool.map(_run_task, *zip(*tasks)))
+        else:
+            global _shared
+            _shared = shared
+            try:
+                results = [_run_task(*task) for task in tasks]
+            finally:
+                _shared = None
+    finally:
+        shared.unlink()
+    wall = time.perf_counter() - started
+
+    cate = {}
+    for result in results:
+        key = f"{result['arm']}_{result['learner']}"
+        out = cate.setdefault(key, np.full(len(batch), np.nan))
+        out[result.pop("rows")] = result.pop("cate")
+
+    return {
+        "cate": cate,
+        "tasks": results,
+        "wall_s": wall,
+        "task_s": sum(result["seconds"] for result in results),
+        "processes": processes,
+        "n_folds": n_folds,
+        "config": asdict(config),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-fit the meta-learners in parallel.")
+    parser.add_argument("--data", default=str(HILLSTROM_PATH), help="Campaign CSV")
+    parser.add_argument("--outcome", default=DEFAULT_OUTCOME)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--learners", nargs="+", choices=LEARNERS, default=list(LEARNERS))
+    parser.add_argument("--processes", type=int, default=None, help="Default: CPU count, 0 runs inline")
+    parser.add_argument("--n-estimators", type=int, default=XLearnerConfig.n_estimators)
+    parser.add_argument("--output", default=str(TRAINING_DIR / "crossfit.npz"))
+    args = parser.parse_args()
+
+    batch = load_campaign(args.data, args.outcome)
+    result = cross_fit(
+        batch, args.folds, args.learners, args.processes,
+        XLearnerConfig(n_estimators=args.n_estimators)
+    )
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    np.savez(output, treatment=batch.treatment.astype(str), y=batch.y, **result["cate"])
+    report = {key: value for key, value in result.items() if key != "cate"}
+    output.with_suffix(".json").write_text(json.dumps(report, indent=2) + "\n")
+
+    print(f"{'arm':<8} {'learner':<8} {'fold':>4} {'train':>8} {'seconds':>8}")
+    for task in sorted(result["tasks"], key=lambda t: (t["arm"], t["learner"], t["fold"])):
+        print(f"{task['arm']:<8} {task['learner']:<8} {task['fold']:>4} {task['train_rows']:>8,} {task['seconds']:>8.2f}")
+    print(
+        f"\n{len(result['tasks'])} tasks, {result['task_s']:.1f}s of task time in "
+        f"{result['wall_s']:.1f}s wall time on {result['processes'] or 1} process(es) "
+        f"({result['task_s'] / result['wall_s']:.1f}x)"
+    )
+    for key, values in result["cate"].items():
+        print(f"  {key}: mean out-of-fold CATE {np.nanmean(values):.4f}")
+    print(f"Out-of-fold CATE written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Campaign data in the data/raw/hillstrom.csv schema.
+
+A campaign batch holds the encoded features, the treatment received and
+the outcome of every customer of one campaign export. Batches are
+identified by a fingerprint of their contents, so the same data gives
+the same fingerprint whatever the file it was read from.
+"""
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from ..api.bulk import frame_columns
+from ..api.models import NO_TREATMENT, TREATMENT_ARMS, TreatmentArm
+from ..api.preprocessing import INPUT_COLUMNS, preprocess_columns
+
+DEFAULT_OUTCOME = "conversion"
+
+
+@dataclass(frozen=True)
+class CampaignBatch:
+    """
+    One campaign export, encoded for training.
+
+    Attributes:
+        X: Feature array of shape (n_customers, 12)
+        treatment: Treatment label received by each customer
+        y: Outcome of each customer
+        fingerprint: SHA-256 of X, treatment and y
+        source: File the batch was read from
+    """
+    X: np.ndarray
+    treatment: np.ndarray
+    y: np.ndarray
+    fingerprint: str
+    source: str = ""
+
+    def __len__(self) -> int:
+        return len(self.y)
+
+    def arm_rows(self, arm: TreatmentArm) -> np.ndarray:
+        """Indices of the customers who received arm or no email."""
+        return np.flatnonzero(np.isin(self.treatment, (arm.label, NO_TREATMENT)))
+
+
+def fingerprint(X: np.ndarray, treatment: np.ndarray, y: np.ndarray) -> str:
+    """SHA-256 of the encoded contents of a batch."""
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(X, dtype=np.float64).tobytes())
+    digest.update("\n".join(treatment.tolist()).encode())
+    digest.update(np.ascontiguousarray(y, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def campaign_batch(df: pd.DataFrame, outcome: str = DEFAULT_OUTCOME, source: str = "") -> CampaignBatch:
+    """
+    Validate and encode a campaign DataFrame.
+
+    Args:
+        df: Customers with the INPUT_COLUMNS, a treatment column and the
+            outcome column
+        outcome: Name of the outcome column, e.g. "conversion" or "visit"
+        source: Where the data comes from, for the training log
+
+    Returns:
+        CampaignBatch
+
+    Raises:
+        ColumnValidationError: if the customer columns are invalid
+        ValueError: if the treatment or outcome columns are missing or
+            hold unknown values
+    """
+    missing = [name for name in ("treatment", outcome) if name not in df]
+    if missing:
+        raise ValueError(f"Campaign data has no {', '.join(missing)} column")
+
+    treatment = df["treatment"].astype(str).to_numpy()
+    labels = [arm.label for arm in TREATMENT_ARMS] + [NO_TREATMENT]
+    unknown = sorted(set(np.unique(treatment)) - set(labels))
+    if unknown:
+        raise ValueError(f"Unknown treatments {unknown}, expected {labels}")
+
+    y = pd.to_numeric(df[outcome], errors="coerce").to_numpy(dtype=np.float64)
+    if np.isnan(y).any():
+        raise ValueError(f"Outcome {outcome!r} has missing or non-numeric values")
+
+    X = preprocess_columns(frame_columns(df))
+    return CampaignBatch(X, treatment, y, fingerprint(X, treatment, y), source)
+
+
+def load_campaign(path, outcome: str = DEFAULT_OUTCOME) -> CampaignBatch:
+    """Read a campaign CSV in the hillstrom.csv schema, see `campaign_batch`."""
+    df = pd.read_csv(
+        path,
+        usecols=lambda name: name in INPUT_COLUMNS or name in ("treatment", outcome),
+        dtype={"history_segment": str, "zip_code": str, "channel": str, "treatment": str},
+    )
+    return campaign_batch(df, outcome, str(Path(path)))
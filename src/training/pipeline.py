@@ -0,0 +1,333 @@
+"""
+Incremental training of the CATE models from campaign batches.
+
+Scripted version of notebook 03: an X-learner per treatment arm, whose
+CATE is distilled into the GradientBoostingRegressor pickles served by
+the API. Campaign batches are ingested one at a time:
+
+- the outcome and propensity models of a batch are fitted on that batch
+  only and cached under its fingerprint, and the X-learner averages the
+  models of all batches;
+- the effect models of a batch are cached under the fingerprint of the
+  batch sequence they were imputed with;
+- the distilled model of each arm gains trees fitted on the new batch
+  with warm_start, instead of being refitted on the whole history.
+
+Ingesting a batch thus costs time in proportion to its own size. The
+state lives in models/training and the distilled models are published
+to the model registry.
+
+Usage:
+    python -m src.training.pipeline ingest data/raw/hillstrom.csv [--publish] [--activate]
+    python -m src.training.pipeline rebuild [--publish] [--activate]
+    python -m src.training.pipeline status
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+import joblib
+import numpy as np
+from sklearn.ensemble import GradientBoostingRegressor
+
+from ..api import registry
+from ..api.models import MODELS_DIR, TREATMENT_ARMS, TreatmentArm
+from .data import DEFAULT_OUTCOME, CampaignBatch, load_campaign
+from .xlearner import EffectModels, OutcomeModels, XLearnerConfig, predict_cate
+
+TRAINING_DIR = MODELS_DIR / "training"
+
+STATE_NAME = "state.json"
+
+
+@dataclass(frozen=True)
+class DistillConfig:
+    """
+    Hyperparameters of the served GradientBoostingRegressor of each arm.
+
+    The first batch fits n_estimators trees as in notebook 03, every
+    later batch adds trees_per_batch trees fitted on that batch.
+    """
+    n_estimators: int = 100
+    max_depth: int = 5
+    trees_per_batch: int = 20
+    random_state: int = 42
+
+
+def _sha256(*parts: str) -> str:
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+class TrainingPipeline:
+    """
+    Ingests campaign batches and keeps the distilled CATE models current.
+
+    Attributes:
+        work_dir: Directory of the training state and caches
+        state: Ingested batches, configuration and distilled model sizes
+    """
+
+    def __init__(
+        self,
+        work_dir=TRAINING_DIR,
+        config: XLearnerConfig | None = None,
+        distill: DistillConfig | None = None,
+        outcome: str | None = None
+    ):
+        self.work_dir = Path(work_dir)
+        state_path = self.work_dir / STATE_NAME
+        if state_path.exists():
+            self.state = json.loads(state_path.read_text())
+            self._check_setting("config", config)
+            self._check_setting("distill", distill)
+            if outcome is not None and outcome != self.state["outcome"]:
+                raise ValueError(
+                    f"{self.work_dir} was trained on {self.state['outcome']!r}, use another work_dir"
+                )
+        else:
+            self.state = {
+                "config": asdict(config or XLearnerConfig()),
+                "distill": asdict(distill or DistillConfig()),
+                "outcome": outcome or DEFAULT_OUTCOME,
+                "batches": [],
+                "distilled": {},
+            }
+        self.config = XLearnerConfig(**self.state["config"])
+        self.distill = DistillConfig(**self.state["distill"])
+        # Models of previous batches, loaded once per process
+        self._models = {}
+
+    def _check_setting(self, name: str, value):
+        if value is not None and asdict(value) != self.state[name]:
+            raise ValueError(
+                f"{self.work_dir} was trained with {name} {self.state[name]}, use another work_dir"
+            )
+
+    @property
+    def outcome(self) -> str:
+        return self.state["outcome"]
+
+    @property
+    def distilled_dir(self) -> Path:
+        """Directory of the distilled pickles, laid out like models/."""
+        return self.work_dir / "distilled"
+
+    @property
+    def config_key(self) -> str:
+        """Part of the cache keys that changes with the hyperparameters."""
+        return _sha256(json.dumps(self.state["config"], sort_keys=True), self.outcome)[:12]
+
+    def _path(self, kind: str, key: str, arm: TreatmentArm, suffix: str = ".joblib") -> Path:
+        return self.work_dir / kind / f"{key[:16]}-{arm.name}-{self.config_key}{suffix}"
+
+    def _save_state(self):
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.work_dir / f".{STATE_NAME}.{os.getpid()}"
+        tmp.write_text(json.dumps(self.state, indent=2) + "\n")
+        os.replace(tmp, self.work_dir / STATE_NAME)
+
+    def _cached(self, path: Path, fit=None):
+        """Load a fitted object from path, or fit and store it."""
+        if path in self._models:
+            return self._models[path]
+        if path.exists():
+            fitted = joblib.load(path)
+        elif fit is None:
+            raise FileNotFoundError(f"{path} is missing from the training cache, start a new work_dir")
+        else:
+            fitted = fit()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            joblib.dump(fitted, path)
+        self._models[path] = fitted
+        return fitted
+
+    def _previous_models(self, arm: TreatmentArm) -> tuple[list, list]:
+        """Outcome and effect models of arm of every ingested batch."""
+        batches = self.state["batches"]
+        return (
+            [self._cached(self._path("outcomes", b["fingerprint"], arm)) for b in batches],
+            [self._cached(self._path("effects", b["chain"], arm)) for b in batches],
+        )
+
+    def ingest(self, batch: CampaignBatch) -> dict | None:
+        """
+        Fit the nuisance models of a new batch and extend the distilled models.
+
+        Args:
+            batch: Campaign batch, in the pipeline's outcome
+
+        Returns:
+            Training report of the batch, or None if it was already ingested
+        """
+        if any(b["fingerprint"] == batch.fingerprint for b in self.state["batches"]):
+            return None
+
+        started = time.perf_counter()
+        previous_chain = self.state["batches"][-1]["chain"] if self.state["batches"] else ""
+        chain = _sha256(previous_chain, batch.fingerprint)
+        report = {
+            "fingerprint": batch.fingerprint,
+            "chain": chain,
+            "source": batch.source,
+            "rows": len(batch),
+            "arms": {},
+        }
+
+        for arm in TREATMENT_ARMS:
+            rows = batch.arm_rows(arm)
+            X, y = batch.X[rows], batch.y[rows]
+            treated = batch.treatment[rows] == arm.label
+
+            outcomes, effects = self._previous_models(arm)
+            outcomes.append(self._cached(
+                self._path("outcomes", batch.fingerprint, arm),
+                lambda: OutcomeModels.fit(X, treated, y, self.config)
+            ))
+            effects.append(self._cached(
+                self._path("effects", chain, arm),
+                lambda: EffectModels.fit(X, treated, y, outcomes, self.config)
+            ))
+
+            cate = predict_cate(outcomes, effects, X)
+            cate_path = self._path("cate", chain, arm, ".npz")
+            cate_path.parent.mkdir(parents=True, exist_ok=True)
+            np.savez(cate_path, X=X, cate=cate)
+
+            n_estimators = self._distill_batch(arm, X, cate)
+            report["arms"][arm.name] = {
+                "rows": len(rows),
+                "mean_cate": float(cate.mean()),
+                "n_estimators": n_estimators,
+            }
+
+        report["train_s"] = time.perf_counter() - started
+        report["ingested_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self.state["batches"].append(report)
+        self._save_state()
+        return report
+
+    def _distill_batch(self, arm: TreatmentArm, X: np.ndarray, cate: np.ndarray) -> int:
+        """Add trees fitted on one batch to the distilled model of arm."""
+        path = self.distilled_dir / arm.model_file
+        if path.exists() and arm.name in self.state["distilled"]:
+            model = joblib.load(path)
+            model.set_params(
+                warm_start=True,
+                n_estimators=model.n_estimators + self.distill.trees_per_batch
+            )
+        else:
+            model = GradientBoostingRegressor(
+                n_estimators=self.distill.n_estimators,
+                max_depth=self.distill.max_depth,
+                random_state=self.distill.random_state
+            )
+        model.fit(X, cate)
+        self._save_distilled(arm, model, len(X))
+        return model.n_estimators
+
+    def _save_distilled(self, arm: TreatmentArm, model: GradientBoostingRegressor, rows: int):
+        self.distilled_dir.mkdir(parents=True, exist_ok=True)
+        path = self.distilled_dir / arm.model_file
+        tmp = path.with_name(f".{path.name}.{os.getpid()}")
+        joblib.dump(model, tmp)
+        os.replace(tmp, path)
+        distilled = self.state["distilled"].setdefault(arm.name, {"rows": 0})
+        distilled["n_estimators"] = model.n_estimators
+        distilled["rows"] += rows
+
+    def rebuild(self) -> dict:
+        """
+        Refit the distilled models from scratch on the CATE of every batch.
+
+        The nuisance models are not refitted: the CATE of each batch was
+        stored when it was ingested.
+
+        Returns:
+            Number of trees and rows of each distilled model
+        """
+        if not self.state["batches"]:
+            raise ValueError("No batch has been ingested yet")
+        self.state["distilled"] = {}
+        for arm in TREATMENT_ARMS:
+            parts = [np.load(self._path("cate", b["chain"], arm, ".npz")) for b in self.state["batches"]]
+            X = np.concatenate([part["X"] for part in parts])
+            cate = np.concatenate([part["cate"] for part in parts])
+            model = GradientBoostingRegressor(
+                n_estimators=self.distill.n_estimators,
+                max_depth=self.distill.max_depth,
+                random_state=self.distill.random_state
+            ).fit(X, cate)
+            self._save_distilled(arm, model, len(X))
+        self._save_state()
+        return self.state["distilled"]
+
+    def publish(self, version: str | None = None, make_active: bool = False) -> str:
+        """Publish the distilled models to the model registry, see `registry.publish`."""
+        if not self.state["distilled"]:
+            raise ValueError("No model has been trained yet")
+        return registry.publish(self.distilled_dir, version, make_active)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the CATE models from campaign batches.")
+    parser.add_argument("--work-dir", default=str(TRAINING_DIR), help="Training state and caches")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = commands.add_parser("ingest", help="Train on new campaign CSV files, in order")
+    ingest_parser.add_argument("paths", nargs="+")
+    ingest_parser.add_argument("--outcome", default=None, help=f"Outcome column (default: {DEFAULT_OUTCOME})")
+    ingest_parser.add_argument("--n-estimators", type=int, default=None, help="Trees per nuisance forest")
+
+    rebuild_parser = commands.add_parser("rebuild", help="Refit the distilled models on every batch")
+
+    for command in (ingest_parser, rebuild_parser):
+        command.add_argument("--publish", action="store_true", help="Publish to the model registry")
+        command.add_argument("--version", default=None, help="Registry version (default: content hash)")
+        command.add_argument("--activate", action="store_true", help="Make the published version active")
+
+    commands.add_parser("status", help="Show the ingested batches")
+
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        config = XLearnerConfig(n_estimators=args.n_estimators) if args.n_estimators else None
+        pipeline = TrainingPipeline(args.work_dir, config=config, outcome=args.outcome)
+        for path in args.paths:
+            report = pipeline.ingest(load_campaign(path, pipeline.outcome))
+            if report is None:
+                print(f"{path}: already ingested")
+                continue
+            arms = ", ".join(
+                f"{name} {arm['rows']:,} rows, {arm['n_estimators']} trees"
+                for name, arm in report["arms"].items()
+            )
+            print(f"{path}: trained in {report['train_s']:.1f}s ({arms})")
+    else:
+        pipeline = TrainingPipeline(args.work_dir)
+
+    if args.command == "rebuild":
+        for name, distilled in pipeline.rebuild().items():
+            print(f"{name}: {distilled['n_estimators']} trees on {distilled['rows']:,} rows")
+    elif args.command == "status":
+        print(f"Outcome: {pipeline.outcome}, nuisance models: {pipeline.state['config']}")
+        for batch in pipeline.state["batches"]:
+            print(
+                f"  {batch['fingerprint'][:12]}  {batch['rows']:>7,} rows  "
+                f"{batch['train_s']:6.1f}s  {batch['source']}"
+            )
+        for name, distilled in pipeline.state["distilled"].items():
+            print(f"  {name}: {distilled['n_estimators']} trees on {distilled['rows']:,} rows")
+        return
+
+    if args.publish:
+        version = pipeline.publish(args.version, args.activate)
+        print(f"Published model version {version}" + (" (active)" if args.activate else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+X-learner of the CATE of one treatment arm against the control group.
+
+Follows the BaseXClassifier of notebook 03 (causalml): outcome models of
+the control and treated groups, imputed treatment effects, one effect
+model per group, and their propensity-weighted average. The nuisance
+models are fitted per campaign batch and averaged across batches
+(weighted by rows), so a new batch only needs models of its own.
+"""
+from dataclasses import asdict, dataclass
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.linear_model import LogisticRegression
+
+
+@dataclass(frozen=True)
+class XLearnerConfig:
+    """Hyperparameters of the nuisance models, those of notebook 03."""
+    n_estimators: int = 100
+    max_depth: int = 10
+    random_state: int = 42
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def forest_params(self) -> dict:
+        return {
+            "n_estimators": self.n_estimators,
+            "max_depth": self.max_depth,
+            "random_state": self.random_state,
+        }
+
+
+def positive_proba(model, X: np.ndarray) -> np.ndarray:
+    """P(y = 1) from a fitted classifier, also when it only saw one class."""
+    classes = list(model.classes_)
+    if 1 not in classes:
+        return np.zeros(len(X))
+    return model.predict_proba(X)[:, classes.index(1)]
+
+
+@dataclass
+class OutcomeModels:
+    """
+    Nuisance models of one batch that only depend on that batch.
+
+    Attributes:
+        control: Classifier of the outcome of the control group
+        treated: Classifier of the outcome of the treated group
+        propensity: Classifier of P(treated | x)
+        n_rows: Customers of the batch in the arm or the control group
+    """
+    control: RandomForestClassifier
+    treated: RandomForestClassifier
+    propensity: LogisticRegression
+    n_rows: int
+
+    @classmethod
+    def fit(cls, X: np.ndarray, treated: np.ndarray, y: np.ndarray, config: XLearnerConfig) -> "OutcomeModels":
+        """
+        Args:
+            X: Features of the arm and control customers of a batch
+            treated: Boolean mask of the customers who got the arm
+            y: Binary outcome
+            config: Hyperparameters
+        """
+        if not np.isin(y, (0, 1)).all():
+            raise ValueError("The outcome must be binary (0 or 1)")
+        if treated.all() or not treated.any():
+            raise ValueError("A batch needs customers of both the arm and the control group")
+        control = RandomForestClassifier(**config.forest_params()).fit(X[~treated], y[~treated])
+        treated_model = RandomForestClassifier(**config.forest_params()).fit(X[treated], y[treated])
+        propensity = LogisticRegression(max_iter=1000).fit(X, treated.astype(int))
+        return cls(control, treated_model, propensity, len(X))
+
+
+@dataclass
+class EffectModels:
+    """
+    Regressors of the imputed treatment effects of one batch.
+
+    Attributes:
+        control: Fitted on control customers, target mu_1(x) - y
+        treated: Fitted on treated customers, target y - mu_0(x)
+        n_rows: Customers the models were fitted on
+    """
+    control: RandomForestRegressor
+    treated: RandomForestRegressor
+    n_rows: int
+
+    @classmethod
+    def fit(
+        cls,
+        X: np.ndarray,
+        treated: np.ndarray,
+        y: np.ndarray,
+        outcomes: list[OutcomeModels],
+        config: XLearnerConfig
+    ) -> "EffectModels":
+        """Impute the treatment effects with the outcome models and fit on them."""
+        mu_0 = ensemble_proba(outcomes, "control", X)
+        mu_1 = ensemble_proba(outcomes, "treated", X)
+        effect = np.where(treated, y - mu_0, mu_1 - y)
+        control = RandomForestRegressor(**config.forest_params()).fit(X[~treated], effect[~treated])
+        treated_model = RandomForestRegressor(**config.forest_params()).fit(X[treated], effect[treated])
+        return cls(control, treated_model, len(X))
+
+
+def _weights(models: list) -> np.ndarray:
+    rows = np.array([m.n_rows for m in models], dtype=float)
+    return rows / rows.sum()
+
+
+def ensemble_proba(outcomes: list[OutcomeModels], name: str, X: np.ndarray) -> np.ndarray:
+    """Row-weighted average over batches of P(y = 1) of one outcome model."""
+    return sum(
+        weight * positive_proba(getattr(models, name), X)
+        for weight, models in zip(_weights(outcomes), outcomes)
+    )
+
+
+def predict_cate(outcomes: list[OutcomeModels], effects: list[EffectModels], X: np.ndarray) -> np.ndarray:
+    """
+    CATE of the arm, p(x) * tau_0(x) + (1 - p(x)) * tau_1(x).
+
+    Args:
+        outcomes: Outcome models of every batch so far
+        effects: Effect models of every batch so far
+        X: Features to score
+
+    Returns:
+        CATE array of shape (n_samples,)
+    """
+    p = ensemble_proba(outcomes, "propensity", X)
+    tau_0 = sum(w * m.control.predict(X) for w, m in zip(_weights(effects), effects))
+    tau_1 = sum(w * m.treated.predict(X) for w, m in zip(_weights(effects), effects))
+    return p * tau_0 + (1 - p) * tau_1
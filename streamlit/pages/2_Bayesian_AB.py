@@ -3,7 +3,7 @@ from pathlib import Path
 import sys
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from utils import get_figure_path, load_bayesian_results
+from utils import API_URL, fetch_monitor_report, get_figure_path, load_bayesian_results
 
 st.set_page_config(page_title="Bayesian A/B", layout="wide")
 
@@ -114,3 +114,50 @@ st.markdown("""
 - **Mens E-Mail** a un effet plus fort que Womens E-Mail
 - P(Treatment > Control) > 99% pour les deux traitements
 """)
+
+st.divider()
+
+# Live campaign: polls the sequential monitor of the API
+st.subheader("5. Suivi en Direct")
+
+refresh_s = st.number_input("Rafraîchissement (s)", min_value=1, max_value=300, value=5)
+
+
+@st.fragment(run_every=refresh_s)
+def live_monitor():
+    try:
+        report = fetch_monitor_report()
+    except OSError:
+        st.info(f"API injoignable ({API_URL}/monitor). Définissez CATE_API_URL si besoin.")
+        return
+
+    if not report["events"]:
+        st.info("Aucun événement reçu (POST /monitor/events).")
+        return
+
+    leader = report["groups"][report["leader"]]
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Événements", f"{report['events']:,}")
+    col2.metric(f"P({leader['label']} meilleur)", f"{leader['p_best']:.1%}")
+    col3.metric("Seuil d'arrêt", f"{report['threshold']:.0%}")
+
+    if report["stop"]:
+        st.success(f"Arrêt recommandé : {report['reason']}")
+    else:
+        st.info(report["reason"])
+
+    st.table([
+        {
+            "Groupe": group["label"],
+            "Clients": f"{group['customers']:,}",
+            "Taux Conversion": f"{group['rate_mean']:.2%}",
+            "HDI 94%": f"[{group['rate_hdi_low']:.4f}, {group['rate_hdi_high']:.4f}]",
+            "P(> Control)": "" if group["p_beats_control"] is None else f"{group['p_beats_control']:.1%}",
+            "P(Meilleur)": f"{group['p_best']:.1%}",
+            "Perte Attendue": f"{group['expected_loss']:.4%}",
+        }
+        for group in report["groups"].values()
+    ])
+
+
+live_monitor()
@@ -4,6 +4,7 @@ import sys
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from utils import (
+    ArtifactError,
     load_cate_models,
     preprocess_for_prediction,
     HISTORY_SEGMENTS,
@@ -24,11 +25,14 @@ st.divider()
 
 # Load models
 try:
-    mens_model, womens_model = load_cate_models()
+    cate_models = load_cate_models()
     models_loaded = True
 except FileNotFoundError:
     st.error("Modèles non trouvés. Exécutez le notebook 03_causal_ml.ipynb")
     models_loaded = False
+except ArtifactError as e:
+    st.error(f"Modèles exportés invalides : {e}. Réexportez-les avec python -m src.api.trees")
+    models_loaded = False
 
 if models_loaded:
     # Input form
@@ -89,8 +93,7 @@ if models_loaded:
         )
 
         # Predict
-        cate_mens = float(mens_model.predict(X)[0])
-        cate_womens = float(womens_model.predict(X)[0])
+        cate_mens, cate_womens = map(float, cate_models.predict(X)[0])
 
         # Determine optimal
         if cate_mens > cate_womens and cate_mens > 0:
@@ -1,13 +1,25 @@
 import json
+import os
+import sys
+import urllib.request
 from pathlib import Path
-import joblib
 import numpy as np
+import streamlit as st
 
 # Paths
 PROJECT_ROOT = Path(__file__).parent.parent
 DATA_DIR = PROJECT_ROOT / "data"
 FIGURES_DIR = PROJECT_ROOT / "reports" / "figures"
 MODELS_DIR = PROJECT_ROOT / "models"
+FLAT_MODELS_DIR = MODELS_DIR / "cate_models_flat"
+
+# CATE API serving /monitor, see src/bayesian/monitor.py
+API_URL = os.environ.get("CATE_API_URL", "http://localhost:8000")
+
+sys.path.insert(0, str(PROJECT_ROOT))
+from src.api.artifacts import ArtifactError
+from src.api.models import TREATMENT_ARMS, _load_current_artifact, load_pickles, pickle_checksums
+from src.api.trees import FlatTreeEnsemble
 
 
 def load_bayesian_results() -> dict:
@@ -24,16 +36,47 @@ def load_causal_ml_results() -> dict:
         return json.load(f)
 
 
+def fetch_monitor_report(timeout: float = 2.0) -> dict:
+    """
+    Fetch the live campaign report of the API's sequential monitor.
+
+    Raises:
+        OSError: if the API cannot be reached
+    """
+    with urllib.request.urlopen(f"{API_URL}/monitor", timeout=timeout) as response:
+        return json.load(response)
+
+
 def get_figure_path(name: str) -> Path:
     """Get path to a figure."""
     return FIGURES_DIR / name
 
 
-def load_cate_models():
-    """Load CATE prediction models."""
-    mens_model = joblib.load(MODELS_DIR / "cate_model_mens.pkl")
-    womens_model = joblib.load(MODELS_DIR / "cate_model_womens.pkl")
-    return mens_model, womens_model
+@st.cache_resource
+def load_cate_models() -> FlatTreeEnsemble:
+    """
+    Load CATE prediction models, shared across reruns and sessions.
+
+    Uses the memory-mapped flat artifact (python -m src.api.trees) when
+    it was exported from the current pickles, like the API, and
+    flattens the pickled models otherwise.
+
+    Returns:
+        FlatTreeEnsemble whose predict returns (cate_mens, cate_womens)
+        columns
+
+    Raises:
+        FileNotFoundError: if the pickles are missing
+        ArtifactError: if the artifact is corrupt or was exported for
+            other features or treatment arms
+    """
+    checksums = pickle_checksums(MODELS_DIR) if all(
+        (MODELS_DIR / arm.model_file).exists() for arm in TREATMENT_ARMS
+    ) else None
+    flat_models = _load_current_artifact(FLAT_MODELS_DIR, FlatTreeEnsemble.load, checksums)
+    if flat_models is None:
+        flat_models = FlatTreeEnsemble.from_gradient_boosting(load_pickles(MODELS_DIR))
+    return flat_models
 
 
 # History segment mapping
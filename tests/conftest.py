@@ -0,0 +1,18 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.common import load_customers
+from src.api.main import app
+
+
+@pytest.fixture(scope="session")
+def client():
+    """The API with the models in models/ loaded, shared by the tests."""
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
+def customers():
+    """200 customers drawn from hillstrom.csv, in the CustomerInput format."""
+    return load_customers(200)
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from scipy.optimize import Bounds, LinearConstraint, milp
+
+from src.api.allocation import allocate
+
+
+def optimum(gain, cost, capacity, budget):
+    """Best total gain of an integer assignment, from the MILP solver."""
+    n, n_arms = gain.shape
+    rows = [np.kron(np.eye(n), np.ones(n_arms))]
+    upper = [np.ones(n)]
+    for arm in np.flatnonzero(np.isfinite(capacity)):
+        row = np.zeros((n, n_arms))
+        row[:, arm] = 1
+        rows.append(row.reshape(1, -1))
+        upper.append([capacity[arm]])
+    if budget is not None:
+        rows.append(np.tile(cost, n)[None])
+        upper.append([budget])
+    A = np.vstack(rows)
+    result = milp(
+        -gain.ravel(),
+        constraints=LinearConstraint(A, np.zeros(len(A)), np.concatenate(upper)),
+        integrality=np.ones(n * n_arms),
+        bounds=Bounds(0, 1),
+    )
+    return -result.fun
+
+
+def random_instance(seed, ties):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(2, 40))
+    cate = rng.normal(0.005, 0.01, (n, 2))
+    if ties:
+        cate = np.round(cate, 3)
+    cost = rng.uniform(0.05, 0.2, 2)
+    capacity = rng.integers(0, n + 1, 2).astype(float)
+    return cate, cost, capacity, float(rng.uniform(0.005, 0.05) * n)
+
+
+def check_feasible(allocation, cost, capacity, budget):
+    assert (allocation.counts()[:-1] <= capacity).all()
+    if budget is not None:
+        assert allocation.cost <= budget + 1e-9
+    assert np.isclose(allocation.cost, np.append(cost, 0.0)[allocation.codes].sum())
+
+
+def test_ties_fill_the_next_arm():
+    allocation = allocate(np.tile([0.02, 0.01], (100, 1)), capacity=[30, 30])
+    assert allocation.counts().tolist() == [30, 30, 40]
+    assert np.isclose(allocation.expected_conversions, 30 * 0.02 + 30 * 0.01)
+
+
+@pytest.mark.parametrize("ties", [False, True])
+def test_capacities_match_the_integer_optimum(ties):
+    for seed in range(30):
+        cate, cost, capacity, _ = random_instance(seed, ties)
+        allocation = allocate(cate, cost, capacity)
+        check_feasible(allocation, cost, capacity, None)
+        assert allocation.expected_conversions == pytest.approx(optimum(cate, cost, capacity, None), abs=1e-9)
+
+
+@pytest.mark.parametrize("ties", [False, True])
+def test_budget_is_within_one_customer_of_the_optimum(ties):
+    for seed in range(30):
+        cate, cost, capacity, budget = random_instance(seed, ties)
+        for caps in (np.full(2, np.inf), capacity):
+            allocation = allocate(cate, cost, caps, budget)
+            check_feasible(allocation, cost, caps, budget)
+            best = optimum(cate, cost, caps, budget)
+            assert best - cate.max() - 1e-9 <= allocation.expected_conversions <= best + 1e-9
+
+
+def test_net_value_objective():
+    cate = np.array([[0.02, 0.0], [0.0, 0.03], [0.001, 0.002]])
+    allocation = allocate(cate, cost=[0.5, 0.5], value_per_conversion=100)
+    # Worth 2 - 0.5, 3 - 0.5 and at most 0.2 - 0.5 < 0
+    assert allocation.codes.tolist() == [0, 1, 2]
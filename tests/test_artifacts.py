@@ -0,0 +1,58 @@
+import json
+
+import numpy as np
+import pytest
+
+from src.api.artifacts import MANIFEST_NAME, ArtifactError, load_artifact, save_artifact
+from src.api.preprocessing import FEATURE_NAMES
+
+KIND = "test_artifact"
+
+
+@pytest.fixture
+def artifact(tmp_path):
+    path = tmp_path / "artifact"
+    save_artifact(path, KIND, {"a": np.arange(10), "b": np.ones((3, 2))})
+    return path
+
+
+def edit_manifest(path, **changes):
+    manifest = json.loads((path / MANIFEST_NAME).read_text())
+    manifest.update(changes)
+    (path / MANIFEST_NAME).write_text(json.dumps(manifest))
+
+
+def test_round_trip(artifact):
+    arrays, manifest = load_artifact(artifact, KIND)
+    np.testing.assert_array_equal(arrays["a"], np.arange(10))
+    assert isinstance(arrays["b"], np.memmap)
+    assert manifest["feature_names"] == FEATURE_NAMES
+
+
+def test_other_features_are_refused(artifact):
+    edit_manifest(artifact, feature_names=FEATURE_NAMES[::-1])
+    with pytest.raises(ArtifactError, match="exported for features"):
+        load_artifact(artifact, KIND)
+
+
+def test_checksum_mismatch_is_refused(artifact):
+    np.save(artifact / "a.npy", np.arange(10)[::-1].copy())
+    with pytest.raises(ArtifactError, match="Checksum mismatch"):
+        load_artifact(artifact, KIND)
+    # Without verification only the dtype and shape are checked
+    arrays, _ = load_artifact(artifact, KIND, verify=False)
+    assert arrays["a"][0] == 9
+
+
+def test_other_kinds_and_formats_are_refused(artifact):
+    with pytest.raises(ArtifactError):
+        load_artifact(artifact, "other_kind")
+    edit_manifest(artifact, format_version=0)
+    with pytest.raises(ArtifactError, match="format version"):
+        load_artifact(artifact, KIND)
+
+
+def test_a_missing_manifest_is_not_an_artifact(artifact):
+    (artifact / MANIFEST_NAME).unlink()
+    with pytest.raises(FileNotFoundError):
+        load_artifact(artifact, KIND)
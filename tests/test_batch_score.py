@@ -0,0 +1,53 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from src import batch_score
+from src.api.bulk import frame_columns, score_columns
+from src.api.models import cate_models
+from src.api.preprocessing import INPUT_COLUMNS
+
+
+def write_customers(path, customers):
+    pd.DataFrame(customers)[list(INPUT_COLUMNS)].to_csv(path, index=False)
+
+
+def test_chunks_are_written_in_input_order(tmp_path, monkeypatch, customers):
+    write_customers(tmp_path / "in.csv", customers)
+    # Threads share the models loaded in this process
+    monkeypatch.setattr(batch_score, "ProcessPoolExecutor", ThreadPoolExecutor)
+    cate_models.load_models()
+
+    stats = batch_score.score_file(tmp_path / "in.csv", tmp_path / "out.csv", chunksize=30, workers=2)
+
+    expected = score_columns(frame_columns(pd.read_csv(tmp_path / "in.csv")))
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / "out.csv"), expected, check_dtype=False)
+    assert stats["rows"] == len(customers)
+
+
+def test_a_slow_chunk_stops_submission(tmp_path, monkeypatch, customers):
+    write_customers(tmp_path / "in.csv", customers)
+    monkeypatch.setattr(batch_score, "ProcessPoolExecutor", ThreadPoolExecutor)
+    cate_models.load_models()
+
+    score_chunk = batch_score._score_chunk
+    submitted = []
+    released = threading.Event()
+    backlog = []
+
+    def slow_first_chunk(index, start_row, df):
+        submitted.append(index)
+        if index == 0:
+            # Chunks scored while the first one is stuck wait to be written
+            released.wait(timeout=2)
+            backlog.append(len(submitted))
+        elif len(submitted) > 8:
+            released.set()
+        return score_chunk(index, start_row, df)
+
+    monkeypatch.setattr(batch_score, "_score_chunk", slow_first_chunk)
+    batch_score.score_file(tmp_path / "in.csv", tmp_path / "out.csv", chunksize=10, workers=2)
+
+    # Two chunks per worker, the stuck one included
+    assert backlog == [4]
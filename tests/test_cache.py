@@ -0,0 +1,82 @@
+import numpy as np
+
+from src.api.cache import HISTORY_COLUMN, PredictionCache
+from src.api.models import cate_models
+
+
+class Scorer:
+    """Scores rows as [recency + history, history], recording what it scored."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, X):
+        self.calls.append(X.copy())
+        return np.column_stack([X[:, 0] + X[:, 1], X[:, 1]])
+
+
+def rows(*values):
+    """Feature rows with recency i and history value."""
+    return np.array([[i, value] for i, value in enumerate(values)], dtype=np.float64)
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache, score = PredictionCache(max_size=2), Scorer()
+    a, b, c = rows(1.0), rows(2.0), rows(3.0)
+    cache.predict(a, score)
+    cache.predict(b, score)
+    cache.predict(a, score)
+    # b is now the least recently used entry
+    cache.predict(c, score)
+    assert len(cache) == 2 and cache.evictions == 1
+
+    score.calls.clear()
+    cache.predict(a, score)
+    cache.predict(c, score)
+    assert score.calls == []
+    cache.predict(b, score)
+    assert len(score.calls) == 1
+    assert cache.evictions == 2
+    assert (cache.hits, cache.misses) == (3, 4)
+
+
+def test_versions_never_share_entries():
+    cache, score = PredictionCache(), Scorer()
+    X = rows(1.0, 2.0)
+    cache.predict(X, score, version="a")
+    cache.predict(X, score, version="b")
+    assert len(score.calls) == 2 and len(cache) == 4
+    cache.predict(X, score, version="a")
+    assert len(score.calls) == 2
+
+
+def test_reloading_the_models_clears_the_cache(client, customers):
+    client.post("/predict", json=customers[0])
+    assert len(cate_models.cache) > 0
+    cate_models.reload(cate_models.version)
+    assert len(cate_models.cache) == 0
+
+
+def test_history_step_quantizes_keys_and_scored_values():
+    cache, score = PredictionCache(history_step=10.0), Scorer()
+    first = cache.predict(np.array([[1.0, 101.0]]), score)
+    second = cache.predict(np.array([[1.0, 98.0]]), score)
+    assert len(score.calls) == 1
+    # The model scores the rounded history, not the raw value
+    assert score.calls[0][0, HISTORY_COLUMN] == 100.0
+    np.testing.assert_array_equal(first, [[101.0, 100.0]])
+    np.testing.assert_array_equal(second, first)
+
+    cache.predict(np.array([[1.0, 106.0]]), score)
+    assert len(score.calls) == 2
+
+
+def test_mixed_batches_keep_the_input_order():
+    cache, score = PredictionCache(), Scorer()
+    cache.predict(rows(5.0, 6.0, 7.0)[[0, 2]], score)
+
+    X = rows(5.0, 6.0, 7.0, 8.0)
+    out = cache.predict(X, score)
+    np.testing.assert_array_equal(out, score(X))
+    # Only the uncached rows 1 and 3 were scored, in one call
+    np.testing.assert_array_equal(score.calls[1], X[[1, 3]])
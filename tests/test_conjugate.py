@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+from src.bayesian.conjugate import CONTROL, BetaPosteriors, GroupStats, bayesian_results, spend_draws
+
+# Hillstrom group sizes and conversions, in GROUP_KEYS order
+N = np.array([21_307.0, 21_387.0, 21_306.0])
+CONVERSIONS = np.array([267.0, 189.0, 122.0])
+
+
+def test_closed_form_matches_monte_carlo():
+    posteriors = BetaPosteriors.from_counts(N, CONVERSIONS)
+    draws = posteriors.draws(1_000_000, np.random.default_rng(0))
+
+    assert np.allclose(posteriors.mean(), draws.mean(axis=0), rtol=1e-3)
+    assert np.allclose(posteriors.lift_mean(), (draws / draws[:, [CONTROL]] - 1).mean(axis=0), atol=5e-3)
+    greater = posteriors.prob_greater()
+    assert abs(greater[1, CONTROL] - (draws[:, 1] > draws[:, CONTROL]).mean()) < 1e-3
+    assert abs(greater[0, 1] - (draws[:, 0] > draws[:, 1]).mean()) < 1e-3
+    assert np.allclose(posteriors.prob_best(), np.bincount(draws.argmax(axis=1), minlength=3) / len(draws), atol=1e-3)
+    loss = (draws.max(axis=1, keepdims=True) - draws).mean(axis=0)
+    assert np.allclose(posteriors.expected_loss(), loss, atol=2e-5)
+
+
+def test_lifts_keep_their_definition_and_add_the_lift_of_means():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "treatment": np.repeat(["Mens E-Mail", "Womens E-Mail", "No E-Mail"], 1000),
+        "conversion": rng.integers(0, 2, 3000),
+        "spend": rng.exponential(1.0, 3000) * np.repeat([2.0, 1.5, 1.0], 1000),
+    })
+    stats = GroupStats.from_frame(df)
+    results = bayesian_results(stats, n_draws=10_000, seed=1)
+
+    # The notebook's spend lift: the mean over draws of the ratio to control
+    draws = spend_draws(stats, 10_000, np.random.default_rng(1))
+    spend = results["spend"]["womens_email"]
+    assert np.isclose(spend["lift"], (draws[:, 1] / draws[:, CONTROL] - 1).mean())
+    means = df.groupby("treatment")["spend"].mean()
+    assert np.isclose(spend["lift_of_means"], means["Womens E-Mail"] / means["No E-Mail"] - 1)
+
+    posteriors = BetaPosteriors.from_counts(stats.n, stats.conversions)
+    conversion = results["conversion"]["mens_email"]
+    assert np.isclose(conversion["lift_vs_control"], posteriors.lift_mean()[0])
+    rate = posteriors.mean()
+    assert np.isclose(conversion["lift_of_means_vs_control"], rate[0] / rate[CONTROL] - 1)
+    assert results == bayesian_results(stats, n_draws=10_000, seed=1)
@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+import pytest
+
+from src.api import registry
+from src.api.config import settings
+from src.api.executor import InferenceExecutor, QueueFullError, inference
+from src.api.models import MODELS_DIR
+from src.api.scoring import parse_batch, score_batch
+from src.api.shadow import shadow
+
+
+def run(coroutine_fn):
+    executor = InferenceExecutor(threads=1, max_queue_depth=1)
+    executor.start()
+    try:
+        return asyncio.run(coroutine_fn(executor))
+    finally:
+        executor.shutdown()
+
+
+def test_stream_holds_its_slot_until_consumed():
+    async def scenario(executor):
+        chunks = await executor.stream(iter, ["a", "b"])
+        assert executor.in_flight == 1
+        with pytest.raises(QueueFullError):
+            await executor.stream(iter, ["c"])
+        assert [chunk async for chunk in chunks] == ["a", "b"]
+        assert executor.in_flight == 0
+
+    run(scenario)
+
+
+def test_stream_releases_its_slot_on_disconnect_and_failure():
+    def failing():
+        yield "a"
+        raise ValueError("scoring failed")
+
+    async def scenario(executor):
+        chunks = await executor.stream(iter, ["a", "b"])
+        assert await anext(chunks) == "a"
+        await chunks.aclose()
+        assert executor.in_flight == 0
+
+        chunks = await executor.stream(failing)
+        with pytest.raises(ValueError):
+            [chunk async for chunk in chunks]
+        assert executor.in_flight == 0
+
+        with pytest.raises(ZeroDivisionError):
+            await executor.stream(lambda: iter([1 / 0]))
+        assert executor.in_flight == 0
+
+    run(scenario)
+
+
+def test_ndjson_batch_streams_every_customer(client, customers):
+    response = client.post("/predict/batch?format=ndjson", json={"customers": customers})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == len(customers) + 1
+    assert "summary" in lines[-1]
+    assert inference.in_flight == 0
+
+
+def test_process_pool_batches_are_shadowed(tmp_path, monkeypatch, client, customers):
+    monkeypatch.setattr(settings, "registry_dir", str(tmp_path / "registry"))
+    registry.publish(MODELS_DIR, "candidate")
+    shadow.start("candidate", sample_rate=1.0)
+    executor = InferenceExecutor(threads=1, processes=1, process_min_bytes=0)
+    executor.start()
+    try:
+        body = json.dumps({"customers": customers}).encode()
+        content = asyncio.run(executor.run_batch(score_batch, body, "objects", parse_batch))
+    finally:
+        executor.shutdown()
+        shadow.stop()
+
+    assert len(json.loads(content)["predictions"]) == len(customers)
+    stats = shadow.to_dict()
+    assert stats["sampled_rows"] == stats["scored_rows"] == len(customers)
+    # The candidate is the production model
+    assert stats["overall"]["flips"] == 0
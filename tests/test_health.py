@@ -0,0 +1,50 @@
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import load_customers
+
+BATCH_SIZE = 20_000
+CLIENTS = 2
+POLLS = 50
+
+
+def test_health_stays_fast_while_batches_score(client):
+    body = json.dumps({"customers": load_customers(BATCH_SIZE)}).encode()
+
+    def post_batch():
+        return client.post(
+            "/predict/batch?format=columnar", content=body, headers={"content-type": "application/json"}
+        ).status_code
+
+    started = time.perf_counter()
+    assert post_batch() == 200
+    batch_s = time.perf_counter() - started
+
+    stop = threading.Event()
+
+    def post_batches():
+        statuses = []
+        while not stop.is_set():
+            statuses.append(post_batch())
+        return statuses
+
+    latencies = []
+    with ThreadPoolExecutor(CLIENTS) as pool:
+        loaders = [pool.submit(post_batches) for _ in range(CLIENTS)]
+        try:
+            # Let the batches reach the executor
+            time.sleep(batch_s / 2)
+            for _ in range(POLLS):
+                started = time.perf_counter()
+                assert client.get("/health").status_code == 200
+                latencies.append(time.perf_counter() - started)
+        finally:
+            stop.set()
+        statuses = [status for loader in loaders for status in loader.result()]
+
+    assert statuses and set(statuses) == {200}
+    # Scoring runs off the event loop: /health does not wait for a batch
+    assert statistics.median(latencies) < batch_s / 5
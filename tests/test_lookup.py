@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from src.api.lookup import HISTORY, N_GROUPS, group_features, group_index
+from src.api.models import MODELS_DIR, ModelBundle, load_pickles
+from src.api.preprocessing import preprocess_batch
+
+
+@pytest.fixture(scope="module")
+def bundle():
+    return ModelBundle.load(MODELS_DIR, "lookup")
+
+
+def sklearn_cate(bundle, X):
+    return np.column_stack([model.predict(X) for model in bundle.arm_models])
+
+
+def test_lookup_is_bit_identical_to_the_trees(bundle, customers):
+    X = preprocess_batch(customers)
+    cate, on_grid = bundle.lookup_table.lookup(X)
+    assert on_grid.all()
+    np.testing.assert_array_equal(cate, sklearn_cate(bundle, X))
+
+
+def test_lookup_is_bit_identical_at_the_history_thresholds(bundle):
+    rng = np.random.default_rng(0)
+    thresholds = np.concatenate([
+        model.estimators_[i, 0].tree_.threshold[model.estimators_[i, 0].tree_.feature == HISTORY]
+        for model in load_pickles(MODELS_DIR) for i in range(len(model.estimators_))
+    ])
+    thresholds = np.unique(thresholds[thresholds >= 0]).astype(np.float32)
+    # Each threshold, the float32 on either side, and zero, in random cells
+    history = np.concatenate([
+        thresholds,
+        np.nextafter(thresholds, np.float32(-np.inf)),
+        np.nextafter(thresholds, np.float32(np.inf)),
+        [0.0],
+    ])
+    X = group_features()[rng.integers(0, N_GROUPS, size=len(history))]
+    X[:, HISTORY] = history
+
+    cate, on_grid = bundle.lookup_table.lookup(X)
+    assert on_grid.all()
+    np.testing.assert_array_equal(cate, sklearn_cate(bundle, X))
+
+
+def test_rows_off_the_grid_fall_back_to_the_models(bundle, customers):
+    X = preprocess_batch(customers[:4])
+    X[0, 0] = 13.0
+    X[1, HISTORY] = -1.0
+    X[2, 2] = 2.5
+
+    _, on_grid = group_index(X)
+    assert on_grid.tolist() == [False, False, False, True]
+    np.testing.assert_array_equal(bundle.predict_matrix(X), sklearn_cate(bundle, X))
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from benchmarks.common import load_customers
+from src.api import registry
+from src.api.config import settings
+from src.api.models import MULTI_MODEL_NAME, NO_TREATMENT, TREATMENT_ARMS, cate_models
+from src.api.preprocessing import preprocess_batch
+from src.api.trees import FlatTreeEnsemble
+from src.training.data import CampaignBatch, fingerprint
+from src.training.multi import MultiXLearner, distill, train, treatment_codes
+from src.training.pipeline import DistillConfig
+from src.training.xlearner import XLearnerConfig
+
+CONFIG = XLearnerConfig(n_estimators=20, max_depth=5)
+LABELS = [arm.label for arm in TREATMENT_ARMS] + [NO_TREATMENT]
+
+
+def synthetic_campaign(n=3000, seed=0) -> CampaignBatch:
+    """Hillstrom customers, randomized, with effects that depend on recency and channel."""
+    rng = np.random.default_rng(seed)
+    X = preprocess_batch(load_customers(n, seed=seed))
+    codes = rng.integers(0, len(LABELS), n)
+    rate = 0.1 + np.select(
+        [codes == 0, codes == 1], [0.2 * (X[:, 0] < 6), 0.2 * X[:, 10]], 0.0
+    )
+    y = (rng.random(n) < rate).astype(np.float64)
+    treatment = np.array(LABELS)[codes]
+    return CampaignBatch(X, treatment, y, fingerprint(X, treatment, y), "synthetic")
+
+
+@pytest.fixture
+def registry_dir(tmp_path, monkeypatch, client):
+    monkeypatch.setattr(settings, "registry_dir", str(tmp_path / "registry"))
+    yield
+    monkeypatch.undo()
+    cate_models.reload()
+
+
+def test_served_multi_model_matches_the_learner(tmp_path, registry_dir):
+    batch = synthetic_campaign()
+    learner = MultiXLearner.fit(batch.X, treatment_codes(batch), batch.y, CONFIG)
+    cate = learner.predict_cate(batch.X)
+
+    flat = distill(batch.X, cate, DistillConfig(n_estimators=200, max_depth=6))
+    flat.save(tmp_path / "model" / MULTI_MODEL_NAME, arms=[arm.name for arm in TREATMENT_ARMS])
+    registry.publish(tmp_path / "model", "multi")
+    bundle = cate_models.reload("multi")
+    assert bundle.backend == "flat"
+
+    served = cate_models.predict_matrix(batch.X, bundle)
+    np.testing.assert_array_equal(served, flat.predict(batch.X))
+    # Distillation approximates the learner
+    assert np.abs(served - cate).mean() < 0.15 * cate.std()
+    for arm in range(len(TREATMENT_ARMS)):
+        assert np.corrcoef(served[:, arm], cate[:, arm])[0, 1] > 0.95
+
+
+def test_train_exports_a_loadable_artifact(tmp_path):
+    report = train(synthetic_campaign(1000), tmp_path, CONFIG, DistillConfig(n_estimators=10))
+    flat = FlatTreeEnsemble.load(tmp_path / MULTI_MODEL_NAME)
+    assert flat.manifest["version"] == report["manifest"]["version"]
+    assert flat.manifest["arms"] == [arm.name for arm in TREATMENT_ARMS]
+    assert report["n_trees"] == len(flat.roots) == 10
+
+
+def test_fit_rejects_a_missing_arm_and_non_binary_outcomes():
+    batch = synthetic_campaign(500)
+    codes = treatment_codes(batch)
+
+    without_arm = codes != 1
+    with pytest.raises(ValueError, match="No customers received"):
+        MultiXLearner.fit(batch.X[without_arm], codes[without_arm], batch.y[without_arm], CONFIG)
+    with pytest.raises(ValueError, match="binary"):
+        MultiXLearner.fit(batch.X, codes, batch.y * 2, CONFIG)
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from src.evaluation import off_policy
+from src.evaluation.off_policy import CONTROL, N_TREATMENTS, RANDOMIZED_PROPENSITY, evaluate_policies
+
+
+def randomized_campaign(n, seed):
+    """Customers randomized 1/3 each, with known conversion probabilities."""
+    rng = np.random.default_rng(seed)
+    x = rng.random(n)
+    # P(y = 1 | x, t): the first arm helps high x, the second low x
+    p = np.column_stack([0.05 + 0.10 * x, 0.15 - 0.10 * x, np.full(n, 0.08)])
+    codes = rng.integers(0, N_TREATMENTS, n)
+    y = (rng.random(n) < p[np.arange(n), codes]).astype(np.float64)
+    return x, p, codes, y
+
+
+def policies(x):
+    return np.stack([
+        np.full(len(x), CONTROL),
+        np.zeros(len(x), dtype=np.intp),
+        np.where(x > 0.5, 0, 1),
+        np.where(x > 0.5, 1, 0),
+    ])
+
+
+def test_estimates_match_their_formulas():
+    x, p, codes, y = randomized_campaign(1000, seed=0)
+    assignments = policies(x)
+    mu = p + np.random.default_rng(1).normal(0, 0.02, p.shape)
+    estimates = evaluate_policies(assignments, codes, y, mu)
+
+    e = RANDOMIZED_PROPENSITY[codes]
+    rows = np.arange(len(y))
+    for i, policy in enumerate(assignments):
+        ipw = y * (codes == policy) / e
+        dr = mu[rows, policy] + (codes == policy) * (y - mu[rows, codes]) / e
+        dr_control = mu[:, CONTROL] + (codes == CONTROL) * (y - mu[rows, codes]) / e
+        assert estimates.ipw[i] == pytest.approx(ipw.mean())
+        assert estimates.ipw_se[i] == pytest.approx(ipw.std(ddof=1) / np.sqrt(len(y)))
+        assert estimates.ipw_lift[i] == pytest.approx((ipw - y * (codes == CONTROL) / e).mean())
+        assert estimates.dr[i] == pytest.approx(dr.mean())
+        assert estimates.dr_lift[i] == pytest.approx((dr - dr_control).mean())
+        assert estimates.emailed[i] == pytest.approx((policy != CONTROL).mean())
+
+
+def test_estimates_are_close_to_the_true_values():
+    x, p, codes, y = randomized_campaign(200_000, seed=2)
+    assignments = policies(x)
+    truth = p[np.arange(len(x)), assignments].mean(axis=1)
+    truth_lift = truth - p[:, CONTROL].mean()
+
+    estimates = evaluate_policies(assignments, codes, y, mu=p)
+    assert (np.abs(estimates.ipw - truth) <= 4 * estimates.ipw_se).all()
+    assert (np.abs(estimates.ipw_lift - truth_lift) <= 4 * estimates.ipw_lift_se).all()
+    assert (np.abs(estimates.dr - truth) <= 4 * estimates.dr_se).all()
+    assert (np.abs(estimates.dr_lift - truth_lift) <= 4 * estimates.dr_lift_se).all()
+    # A good outcome model makes the estimates more precise
+    assert (estimates.dr_se < estimates.ipw_se).all()
+
+
+def test_chunks_do_not_change_the_estimates(monkeypatch):
+    x, p, codes, y = randomized_campaign(1000, seed=3)
+    assignments = np.concatenate([policies(x)] * 5)
+    whole = evaluate_policies(assignments, codes, y, p).to_frame()
+    monkeypatch.setattr(off_policy, "CHUNK_CELLS", 3000)
+    chunked = evaluate_policies(assignments, codes, y, p).to_frame()
+    np.testing.assert_allclose(chunked.to_numpy(), whole.to_numpy(), rtol=1e-12)
+
+
+def test_invalid_policies_are_rejected():
+    x, p, codes, y = randomized_campaign(10, seed=4)
+    with pytest.raises(ValueError):
+        evaluate_policies(np.full(10, N_TREATMENTS), codes, y)
+    with pytest.raises(ValueError):
+        evaluate_policies(np.zeros(9, dtype=np.intp), codes, y)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from src.api.models import BACKENDS, MODELS_DIR, ModelBundle, load_pickles
+from src.api.policy import optimal_treatment, treatment_distribution
+from src.api.preprocessing import preprocess_batch
+
+
+def naive_optimal_treatment(cate):
+    """The per-customer rule: a positive CATE strictly above every other arm."""
+    codes, lift = [], []
+    for row in cate.tolist():
+        best = max(range(len(row)), key=row.__getitem__)
+        others = row[:best] + row[best + 1:]
+        if row[best] > 0 and all(row[best] > other for other in others):
+            codes.append(best)
+            lift.append(row[best])
+        else:
+            codes.append(len(row))
+            lift.append(0.0)
+    return np.array(codes), np.array(lift)
+
+
+@pytest.mark.parametrize("n_arms", [1, 2, 3, 5])
+def test_optimal_treatment_matches_the_per_customer_rule(n_arms):
+    rng = np.random.default_rng(n_arms)
+    # Small integers make ties and zero CATE common
+    cate = rng.integers(-2, 3, size=(1000, n_arms)).astype(np.float64)
+    codes, lift = optimal_treatment(cate)
+    expected_codes, expected_lift = naive_optimal_treatment(cate)
+    np.testing.assert_array_equal(codes, expected_codes)
+    np.testing.assert_array_equal(lift, expected_lift)
+
+
+def test_treatment_distribution():
+    distribution = treatment_distribution(np.array([1, 2, 0]), ["a", "b", "none"])
+    assert distribution == {
+        "a": {"count": 1, "percentage": 33.3},
+        "b": {"count": 2, "percentage": 66.7},
+        "none": {"count": 0, "percentage": 0.0},
+    }
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_every_backend_scores_all_arms_like_the_per_arm_models(backend, customers):
+    X = preprocess_batch(customers)
+    expected = np.column_stack([model.predict(X) for model in load_pickles(MODELS_DIR)])
+    cate = ModelBundle.load(MODELS_DIR, backend).predict_matrix(X)
+    np.testing.assert_allclose(cate, expected, rtol=0, atol=1e-12)
+
+
+def test_batch_response_matches_the_per_customer_loop(client, customers):
+    body = client.post("/predict/batch", json={"customers": customers}).json()
+
+    X = preprocess_batch(customers)
+    cate = np.column_stack([model.predict(X) for model in load_pickles(MODELS_DIR)])
+    codes, lift = naive_optimal_treatment(cate)
+    labels = ["Mens E-Mail", "Womens E-Mail", "No E-Mail"]
+
+    predictions = body["predictions"]
+    np.testing.assert_allclose([p["cate_mens_email"] for p in predictions], cate[:, 0], rtol=0, atol=1e-12)
+    np.testing.assert_allclose([p["cate_womens_email"] for p in predictions], cate[:, 1], rtol=0, atol=1e-12)
+    assert [p["optimal_treatment"] for p in predictions] == [labels[code] for code in codes]
+    np.testing.assert_allclose([p["lift_vs_no_email"] for p in predictions], lift, rtol=0, atol=1e-12)
+    assert {
+        label: counts["count"] for label, counts in body["summary"]["treatment_distribution"].items()
+    } == {label: int((codes == code).sum()) for code, label in enumerate(labels)}
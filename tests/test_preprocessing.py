@@ -0,0 +1,68 @@
+from itertools import product
+
+import numpy as np
+import pytest
+
+from src.api.preprocessing import (
+    CHANNELS,
+    FEATURE_NAMES,
+    HISTORY_SEGMENT_MAP,
+    INPUT_COLUMNS,
+    ZIP_CODES,
+    preprocess_columns,
+    preprocess_customer,
+)
+
+
+def every_category():
+    """A customer for each history segment, zip code and channel, plus unknown labels."""
+    segments = list(HISTORY_SEGMENT_MAP) + ["8) unknown"]
+    customers = []
+    for i, (segment, zip_code, channel) in enumerate(
+        product(segments, ZIP_CODES + ["Abroad"], CHANNELS + ["Mail"])
+    ):
+        customers.append({
+            "recency": i % 12 + 1,
+            "history": 29.99 + 7.5 * i,
+            "history_segment": segment,
+            "mens": i % 2,
+            "womens": i // 2 % 2,
+            "newbie": i // 4 % 2,
+            "zip_code": zip_code,
+            "channel": channel,
+        })
+    return customers
+
+
+@pytest.mark.parametrize("as_arrays", [False, True])
+def test_columns_match_the_per_customer_encoding(as_arrays):
+    customers = every_category()
+    columns = {name: [c[name] for c in customers] for name in INPUT_COLUMNS}
+    if as_arrays:
+        # Fixed-width string arrays, as pandas columns convert to
+        columns = {name: np.array(values) for name, values in columns.items()}
+
+    expected = np.vstack([preprocess_customer(c) for c in customers])
+    np.testing.assert_array_equal(preprocess_columns(columns), expected)
+
+
+def test_columns_follow_the_feature_names():
+    customers = every_category()
+    X = preprocess_columns({name: [c[name] for c in customers] for name in INPUT_COLUMNS})
+    assert X.shape == (len(customers), len(FEATURE_NAMES))
+
+    for j, name in enumerate(FEATURE_NAMES):
+        if name.startswith("zip_"):
+            expected = [c["zip_code"] == name[len("zip_"):] for c in customers]
+        elif name.startswith("channel_"):
+            expected = [c["channel"] == name[len("channel_"):] for c in customers]
+        elif name == "history_segment_ord":
+            expected = [HISTORY_SEGMENT_MAP.get(c["history_segment"], 1) for c in customers]
+        else:
+            expected = [c[name] for c in customers]
+        np.testing.assert_array_equal(X[:, j], expected, err_msg=name)
+
+
+def test_empty_columns():
+    X = preprocess_columns({name: [] for name in INPUT_COLUMNS})
+    assert X.shape == (0, len(FEATURE_NAMES))
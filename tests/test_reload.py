@@ -0,0 +1,97 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import joblib
+import numpy as np
+import pytest
+
+from src.api import registry
+from src.api.config import settings
+from src.api.models import MODELS_DIR, TREATMENT_ARMS, ModelBundle, cate_models
+from src.api.preprocessing import preprocess_batch
+
+ADMIN_HEADERS = {"X-Admin-Token": "reload-test"}
+FIELDS = [arm.output_field for arm in TREATMENT_ARMS]
+RELOADS = 10
+
+
+@pytest.fixture
+def versions(tmp_path, monkeypatch, client):
+    """Publish the real models as "a" and copies with shifted baselines as "b"."""
+    monkeypatch.setattr(settings, "registry_dir", str(tmp_path / "registry"))
+    monkeypatch.setattr(settings, "admin_token", ADMIN_HEADERS["X-Admin-Token"])
+    registry.publish(MODELS_DIR, "a", make_active=True)
+
+    shifted_dir = tmp_path / "shifted"
+    shifted_dir.mkdir()
+    for arm in TREATMENT_ARMS:
+        model = joblib.load(MODELS_DIR / arm.model_file)
+        model.init_.constant_ = model.init_.constant_ + 0.01
+        joblib.dump(model, shifted_dir / arm.model_file)
+    registry.publish(shifted_dir, "b")
+    cate_models.reload("a")
+
+    yield ["a", "b"]
+    monkeypatch.undo()
+    cate_models.reload()
+
+
+def test_hot_reload_under_load(client, customers, versions):
+    X = preprocess_batch(customers)
+    expected = {
+        version: ModelBundle.load(registry.version_dir(version), "sklearn", version).predict_matrix(X)
+        for version in versions
+    }
+    done = threading.Event()
+
+    def single(offset):
+        seen = []
+        for row in range(offset, len(customers), 5):
+            body = client.post("/predict", json=customers[row])
+            assert body.status_code == 200, body.text
+            body = body.json()
+            seen.append(([row], [[body[field] for field in FIELDS]], body["model_version"]))
+        return seen
+
+    def batch(response_format):
+        seen = []
+        rows = list(range(len(customers)))
+        while not done.is_set():
+            response = client.post(
+                f"/predict/batch?format={response_format}",
+                json={"customers": customers}
+            )
+            assert response.status_code == 200, response.text
+            if response_format == "columnar":
+                body = response.json()
+                cate = np.column_stack([body[field] for field in FIELDS])
+                version = body["model_version"]
+            else:
+                lines = [json.loads(line) for line in response.text.splitlines()]
+                cate = [[line[field] for field in FIELDS] for line in lines[:-1]]
+                version = lines[-1]["model_version"]
+            seen.append((rows, cate, version))
+        return seen
+
+    def reload():
+        try:
+            for i in range(RELOADS):
+                response = client.post(
+                    "/admin/models/reload", json={"version": versions[(i + 1) % 2]}, headers=ADMIN_HEADERS
+                )
+                assert response.status_code == 200, response.text
+        finally:
+            done.set()
+
+    with ThreadPoolExecutor(8) as pool:
+        futures = [pool.submit(batch, "columnar"), pool.submit(batch, "ndjson")]
+        futures += [pool.submit(single, offset) for offset in range(3)]
+        pool.submit(reload).result()
+        responses = [response for future in futures for response in future.result()]
+
+    for rows, cate, version in responses:
+        # Every CATE of a response comes from the version it reports
+        assert version in expected
+        np.testing.assert_allclose(cate, expected[version][rows], rtol=0, atol=1e-12)
+    assert {version for _, _, version in responses} == set(versions)
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from sklearn.tree import DecisionTreeRegressor
+
+from src.api.models import MODELS_DIR, load_pickles
+from src.api.preprocessing import preprocess_batch
+from src.api.trees import FlatTreeEnsemble
+
+
+@pytest.fixture(scope="module")
+def models():
+    return load_pickles(MODELS_DIR)
+
+
+@pytest.fixture(scope="module")
+def flat(models):
+    return FlatTreeEnsemble.from_gradient_boosting(models)
+
+
+def sklearn_cate(models, X):
+    return np.column_stack([model.predict(X) for model in models])
+
+
+def test_flat_trees_match_sklearn(models, flat, customers):
+    X = preprocess_batch(customers)
+    np.testing.assert_allclose(flat.predict(X), sklearn_cate(models, X), rtol=0, atol=1e-12)
+
+
+def test_flat_trees_reach_the_sklearn_leaves_at_the_thresholds(models, flat, customers):
+    # History exactly at every split threshold, and just above it
+    X = np.repeat(preprocess_batch(customers[:10]), 2, axis=0)
+    thresholds = np.unique(flat.threshold[np.isfinite(flat.threshold)])
+    X = np.repeat(X, len(thresholds), axis=0)
+    history = np.tile(thresholds.astype(np.float32), 20)
+    above = np.arange(len(X)) // len(thresholds) % 2 == 1
+    X[:, 1] = np.where(above, np.nextafter(history, np.float32(np.inf)), history)
+
+    leaves = flat.apply(X)
+    estimators = [estimator for model in models for estimator in model.estimators_[:, 0]]
+    for tree, estimator in enumerate(estimators):
+        node = leaves[:, tree] - flat.roots[tree]
+        np.testing.assert_array_equal(node, estimator.apply(X.astype(np.float32)))
+    np.testing.assert_allclose(flat.predict(X), sklearn_cate(models, X), rtol=0, atol=1e-12)
+
+
+def test_flat_trees_survive_a_save_and_load(flat, customers, tmp_path):
+    X = preprocess_batch(customers)
+    flat.save(tmp_path / "flat", version="test")
+    loaded = FlatTreeEnsemble.load(tmp_path / "flat")
+    np.testing.assert_array_equal(loaded.predict(X), flat.predict(X))
+
+
+def test_loaded_trees_traverse_memory_mapped_arrays(flat, tmp_path):
+    flat.save(tmp_path / "flat", version="test")
+    loaded = FlatTreeEnsemble.load(tmp_path / "flat")
+    for name in ("feature", "threshold", "children", "arm_values"):
+        array = getattr(loaded, name)
+        while not isinstance(array, np.memmap) and array.base is not None:
+            array = array.base
+        assert isinstance(array, np.memmap), name
+    np.testing.assert_array_equal(loaded.children, flat.children)
+    np.testing.assert_array_equal(loaded.arm_values, flat.arm_values)
+
+
+def test_multi_output_trees_match_sklearn():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(500, 4))
+    y = np.column_stack([X[:, 0] > 0, X[:, 1] * X[:, 2], -X[:, 3]]).astype(np.float64)
+    baseline, learning_rate = y.mean(axis=0), 0.1
+    trees = [
+        DecisionTreeRegressor(max_depth=3, random_state=seed).fit(X, y - baseline * seed / 10)
+        for seed in range(5)
+    ]
+
+    flat = FlatTreeEnsemble.from_multi_output_trees(trees, learning_rate, baseline)
+    expected = baseline + learning_rate * sum(tree.predict(X) for tree in trees)
+    np.testing.assert_allclose(flat.predict(X), expected, rtol=0, atol=1e-12)
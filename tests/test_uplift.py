@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from src.evaluation.uplift import bootstrap_uplift, policy_curve, uplift_curve
+
+
+def campaign(n, seed, n_arms=1, ties=False):
+    rng = np.random.default_rng(seed)
+    codes = rng.integers(0, n_arms + 1, n)
+    cate = rng.normal(size=(n, n_arms))
+    if ties:
+        cate = np.round(cate, 1)
+    y = (rng.random(n) < 0.1 + 0.05 * (codes < n_arms)).astype(np.float64)
+    return y, codes, cate
+
+
+def naive_uplift(y, treated, score, ends):
+    """Qini and gain of the top customers, recomputed from scratch at each end."""
+    order = np.argsort(-score, kind="stable")
+    qini, gain = [0.0], [0.0]
+    for end in ends:
+        top = order[:end]
+        n_t, n_c = treated[top].sum(), (~treated[top]).sum()
+        y_t, y_c = y[top][treated[top]].sum(), y[top][~treated[top]].sum()
+        qini.append(y_t - y_c * n_t / n_c if n_c else 0.0)
+        gain.append((y_t / n_t - y_c / n_c) * (n_t + n_c) if n_t and n_c else 0.0)
+    return np.array(qini), np.array(gain)
+
+
+def naive_area(x, y):
+    return sum((x[i + 1] - x[i]) * (y[i + 1] + y[i]) / 2 for i in range(len(x) - 1))
+
+
+@pytest.mark.parametrize("ties", [False, True])
+def test_uplift_curve_matches_the_naive_computation(ties):
+    y, codes, cate = campaign(500, seed=1, ties=ties)
+    treated, score = codes == 0, cate[:, 0]
+
+    curve = uplift_curve(y, treated, score)
+    # Tied customers are targeted together, the curve has a point per score
+    ends = np.cumsum(np.unique(-score, return_counts=True)[1])
+    qini, gain = naive_uplift(y, treated, score, ends)
+    np.testing.assert_allclose(curve.fraction, np.concatenate([[0], ends]) / len(y), atol=1e-12)
+    np.testing.assert_allclose(curve.qini, qini, atol=1e-9)
+    np.testing.assert_allclose(curve.gain, gain, atol=1e-9)
+
+    metrics = curve.metrics()
+    assert metrics["qini_auc"] == pytest.approx(naive_area(curve.fraction, qini))
+    assert metrics["auuc"] == pytest.approx(naive_area(curve.fraction, gain))
+    assert metrics["qini_coefficient"] == pytest.approx(naive_area(curve.fraction, qini) - qini[-1] / 2)
+
+
+def test_integer_weights_equal_repeated_customers():
+    y, codes, cate = campaign(300, seed=2)
+    weight = np.random.default_rng(2).integers(1, 4, len(y))
+    weighted = uplift_curve(y, codes == 0, cate[:, 0], weight=weight)
+    repeated = uplift_curve(*(np.repeat(a, weight) for a in (y, codes == 0, cate[:, 0])))
+    np.testing.assert_allclose(weighted.qini, repeated.qini, atol=1e-9)
+    np.testing.assert_allclose(weighted.gain, repeated.gain, atol=1e-9)
+
+
+def test_fewer_points_sample_the_full_curve():
+    y, codes, cate = campaign(1000, seed=3)
+    full = uplift_curve(y, codes == 0, cate[:, 0])
+    coarse = uplift_curve(y, codes == 0, cate[:, 0], n_points=20)
+    assert len(coarse.fraction) == 21
+    index = np.searchsorted(full.fraction, coarse.fraction)
+    np.testing.assert_allclose(coarse.qini, full.qini[index], atol=1e-12)
+
+
+def test_bootstrap_replicates_resample_the_customers():
+    y, codes, cate = campaign(200, seed=4)
+    treated, score = codes == 0, cate[:, 0]
+    n_boot = 50
+    result = bootstrap_uplift(y, treated, score, n_boot=n_boot, n_points=None, seed=7)
+
+    index = np.random.default_rng(7).integers(0, len(y), size=(n_boot, len(y)))
+    # The ranking of the full data, applied to every replicate
+    ends = np.cumsum(np.unique(-score, return_counts=True)[1])
+    position = np.empty(len(y), dtype=np.intp)
+    position[np.argsort(-score, kind="stable")] = np.arange(len(y))
+    qini = []
+    for rows in index:
+        rows = rows[np.argsort(position[rows], kind="stable")]
+        end_rows = np.searchsorted(position[rows], ends)
+        qini.append(naive_uplift(y[rows], treated[rows], -position[rows].astype(float), end_rows)[0])
+    low, high = np.quantile(qini, [0.025, 0.975], axis=0)
+    np.testing.assert_allclose(result.bands["qini"], [low, high], atol=1e-9)
+    assert result.intervals["qini_auc"][0] == pytest.approx(result.curve.metrics()["qini_auc"])
+
+
+def test_policy_curve_matches_the_naive_ipw_value():
+    y, codes, cate = campaign(400, seed=5, n_arms=2)
+    curve = policy_curve(y, codes, cate)
+
+    propensity = np.bincount(codes) / len(codes)
+    best = cate.argmax(axis=1)
+    order = np.argsort(-cate.max(axis=1), kind="stable")
+    values = []
+    for k in range(len(y) + 1):
+        policy = np.full(len(y), 2)
+        policy[order[:k]] = best[order[:k]]
+        values.append(np.sum(y * (codes == policy) / propensity[codes]) / len(y))
+    np.testing.assert_allclose(curve.value, values, atol=1e-12)
+
+    positive = (cate.max(axis=1) > 0).sum()
+    assert curve.metrics()["max_cate"] == pytest.approx(values[positive])
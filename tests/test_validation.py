@@ -0,0 +1,48 @@
+from src.api.preprocessing import INPUT_COLUMNS
+
+
+def as_columns(customers):
+    return {name: [customer[name] for customer in customers] for name in INPUT_COLUMNS}
+
+
+def test_column_errors_have_the_fastapi_shape(client, customers):
+    columns = as_columns(customers[:3])
+    columns["recency"][1] = 13
+    columns["history"][2] = "lots"
+    columns["channel"][0] = "Fax"
+
+    response = client.post("/predict/batch/columns", json=columns)
+    assert response.status_code == 422
+    errors = response.json()["detail"]
+    assert {tuple(error["loc"]) for error in errors} == {
+        ("body", "recency", 1), ("body", "history", 2), ("body", "channel", 0)
+    }
+    for error in errors:
+        assert {"type", "loc", "msg", "input"} <= set(error)
+    assert {error["loc"][1]: error["type"] for error in errors} == {
+        "recency": "value_error", "history": "float_parsing", "channel": "literal_error"
+    }
+
+
+def test_column_errors_match_the_row_errors(client, customers):
+    rows = [dict(customers[0], history=-1.0)]
+    columns = as_columns(rows)
+
+    by_row = client.post("/predict/batch", json={"customers": rows}).json()["detail"]
+    by_column = client.post("/predict/batch/columns", json=columns).json()["detail"]
+    assert len(by_row) == len(by_column) == 1
+    assert by_row[0]["type"] == by_column[0]["type"] == "greater_than_equal"
+    assert by_row[0]["msg"] == by_column[0]["msg"]
+    assert by_column[0]["input"] == -1.0
+
+
+def test_missing_and_ragged_columns(client, customers):
+    columns = as_columns(customers[:2])
+    del columns["newbie"]
+    errors = client.post("/predict/batch/columns", json=columns).json()["detail"]
+    assert errors == [{"type": "missing", "loc": ["body", "newbie"], "msg": "Field required", "input": None}]
+
+    columns = as_columns(customers[:2])
+    columns["mens"] = columns["mens"][:1]
+    errors = client.post("/predict/batch/columns", json=columns).json()["detail"]
+    assert [error["type"] for error in errors] == ["value_error"]